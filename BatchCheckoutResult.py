@@ -0,0 +1,21 @@
+from array import array
+from typing import Dict, List
+from Transaction import Transaction
+
+
+class BatchCheckoutResult:
+  def __init__(self):
+    # Every transaction passed to the batch, in order (failed ones are not given any totals).
+    self.transactions: List[Transaction] = []
+    # Maps the index of a failed transaction to the exception its checkout raised.
+    self.errors: Dict[int, Exception] = {}
+
+    # Per-line columns for all successfully checked out transactions, in batch order.
+    # The lines of transaction i are at [line_offsets[i]:line_offsets[i + 1]] (empty if it failed).
+    self.line_offsets: array = array('q', [0])
+    self.line_final_costs_cents: array = array('q')
+    self.line_savings_cents: array = array('q')
+    self.line_quantities: array = array('q')
+
+  def succeeded(self) -> List[Transaction]:
+    return [transaction for (index, transaction) in enumerate(self.transactions) if index not in self.errors]
@@ -0,0 +1,152 @@
+import threading
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+from Item import Item
+from Discount import Discount
+from Inventory import Inventory
+from PriceBook import PriceBook
+
+
+class CatalogStore(Inventory):
+  """
+  Items and discounts that are changed by publishing a new version of the catalog rather than changing it in place, so lanes never lock to read them.
+  Each version is a CatalogSnapshot, whose items, purchase quantity limits and discounts never change once published.
+  Publishing copies the items and discounts, changes the copy and then replaces the current version in one step, so readers see
+  all of a change or none of it. Writers take turns.
+
+  Stock levels are not versioned: every version shares the store's stock levels and lock shards, so stock taken at checkout is the same
+  whichever version a lane is using. Items removed from the store keep their stock level for the versions that still have them.
+
+  The store itself is an items dictionary of the current version (with current stock levels), and can be passed to checkout, list_items,
+  generate_receipt and the terminal as both the items and discounts dictionaries. Each transaction is then pinned to the version
+  that was current when it first used the store (see megamart.pinned_items and megamart.active_discounts), so its prices do not change
+  between scanning, checkout and the receipt, however many versions are published in the meantime.
+  Changing one item at a time copies the whole catalog each time; use apply() or publish() for many changes.
+  """
+
+  def __init__(self, items: Iterable[Tuple[Item, int, Optional[int]]] = (), discounts: Optional[Mapping[str, Discount]] = None, shards: int = 64):
+    super().__init__((), shards)
+    self._write_lock = threading.Lock()
+    self.version = 0
+
+    for (item, stock, limit) in items:
+      self._items[item.id] = (item, limit)
+      self._stock[item.id] = stock
+    self._snapshot = CatalogSnapshot(self, self.version, self._items, None)
+    self._snapshot.discounts = SnapshotDiscounts(discounts)
+
+  def current_version(self) -> 'CatalogSnapshot':
+    """The current version of the catalog. (snapshot() returns a plain items dictionary, as for any Inventory.)"""
+    return self._snapshot
+
+  @property
+  def discounts(self) -> 'SnapshotDiscounts':
+    """The discounts of the current version. They cannot be changed in place; publish() or set_discounts() a new version instead."""
+    return self._snapshot.discounts
+
+  def pin(self, transaction) -> 'CatalogSnapshot':
+    """The version the transaction is pinned to, pinning it to the current version if it is not pinned to a version of this store yet."""
+    snapshot = transaction.catalog_snapshot
+    if snapshot is None or snapshot.store is not self:
+      snapshot = transaction.catalog_snapshot = self._snapshot
+    return snapshot
+
+  def publish(self, items: Optional[Mapping[str, Tuple[Item, Optional[int], Optional[int]]]] = None, stock_deltas: Optional[Mapping[str, int]] = None,
+              discounts: Optional[Mapping[str, Optional[Discount]]] = None) -> 'CatalogSnapshot':
+    """
+    Adds or replaces many items (as in Inventory.apply), adjusts many stock levels and adds, replaces or (given as None) removes many discounts,
+    publishing them as one new version. Only stock levels are changed, and no version published, if no items or discounts are given.
+    If a stock delta would take an item's stock below zero, an InsufficientStockException is raised and nothing is changed.
+    Returns the current version.
+    """
+    items = items or {}
+    stock_deltas = stock_deltas or {}
+    discounts = discounts or {}
+
+    with self._write_lock:
+      locks = self._locks_for(set(items) | set(stock_deltas))
+      for lock in locks:
+        lock.acquire()
+      try:
+        for item_id in stock_deltas:
+          if item_id not in self._items and item_id not in items:
+            raise Exception(f"Item with code {item_id} not found")
+        self._check_apply(items, stock_deltas)
+
+        # Stock first, so that items new in this version already have their stock levels when readers first see them
+        self._apply_stock(items, stock_deltas)
+        if items or discounts:
+          version_items = dict(self._items)
+          for (item_id, (item, stock, limit)) in items.items():
+            version_items[item_id] = (item, limit)
+          self._publish(version_items, discounts)
+      finally:
+        for lock in reversed(locks):
+          lock.release()
+
+      return self._snapshot
+
+  def _publish(self, version_items: Dict[str, Tuple[Item, Optional[int]]], discounts: Mapping[str, Optional[Discount]]) -> None:
+    # Must be called with the write lock held. Readers either see the previous version or this one.
+    snapshot = CatalogSnapshot(self, self.version + 1, version_items, None)
+    snapshot.discounts = self._snapshot.discounts.updated(discounts)
+    self._items = version_items
+    self._snapshot = snapshot
+    self.version = snapshot.version
+
+  def apply(self, items: Mapping[str, Tuple[Item, Optional[int], Optional[int]]], stock_deltas: Mapping[str, int]) -> None:
+    self.publish(items, stock_deltas)
+
+  def __setitem__(self, item_id: str, value: Tuple[Item, int, Optional[int]]) -> None:
+    self.publish({item_id: value})
+
+  def __delitem__(self, item_id: str) -> None:
+    with self._write_lock:
+      if item_id not in self._items:
+        raise KeyError(item_id)
+      version_items = dict(self._items)
+      del version_items[item_id]
+      self._publish(version_items, {item_id: None} if item_id in self._snapshot.discounts else {})
+
+  def set_discounts(self, discounts: Mapping[str, Optional[Discount]]) -> 'CatalogSnapshot':
+    """Adds, replaces or (given as None) removes many discounts as one new version, and returns it."""
+    return self.publish(discounts=discounts)
+
+
+class CatalogSnapshot(Inventory):
+  """
+  One version of a CatalogStore: an items dictionary whose items and purchase quantity limits never change, with its discounts as a PriceBook
+  that cannot be changed either (see SnapshotDiscounts).
+  Stock levels are the store's current ones, and are taken and put back with the same locking as an Inventory.
+  """
+
+  def __init__(self, store: CatalogStore, version: int, items: Dict[str, Tuple[Item, Optional[int]]], discounts: Optional['SnapshotDiscounts']):
+    self.store = store
+    self.version = version
+    self._items = items
+    self._stock = store._stock
+    self._locks = store._locks
+    self.discounts = discounts
+
+  def __setitem__(self, item_id: str, value: Tuple[Item, int, Optional[int]]) -> None:
+    raise Exception('Items cannot be added to or replaced in a catalog snapshot, only in a new version published by its CatalogStore.')
+
+  def __delitem__(self, item_id: str) -> None:
+    raise Exception('Items cannot be removed from a catalog snapshot, only from a new version published by its CatalogStore.')
+
+  def apply(self, items: Mapping[str, Tuple[Item, Optional[int], Optional[int]]], stock_deltas: Mapping[str, int]) -> None:
+    if items:
+      raise Exception('Items cannot be added to or replaced in a catalog snapshot, only in a new version published by its CatalogStore.')
+    self.store.apply({}, stock_deltas)
+
+
+class SnapshotDiscounts(PriceBook):
+  """
+  The discounts of a CatalogSnapshot. Transactions pinned to the snapshot keep using them, so they are read-only: changing them in place
+  would change the prices of those transactions without publishing a new version. Discounts are changed with CatalogStore.publish() or
+  set_discounts() instead, which give the new version its own copy.
+  """
+
+  def _read_only(self, *args, **kwargs):
+    raise Exception('Discounts cannot be changed in a catalog snapshot, only in a new version published by its CatalogStore.')
+
+  __setitem__ = __delitem__ = pop = popitem = setdefault = update = __ior__ = clear = _read_only
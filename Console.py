@@ -0,0 +1,11 @@
+import builtins
+
+
+class Console:
+  """Where megamart_base.terminal reads its input from and prints its output to. This one is the real console, stdin and stdout."""
+
+  def input(self, prompt: str = '') -> str:
+    return builtins.input(prompt)
+
+  def print(self, *values: object, sep: str = ' ', end: str = '\n') -> None:
+    builtins.print(*values, sep=sep, end=end)
@@ -1,7 +1,39 @@
+from typing import Dict, Optional
+from date_ordinals import age_reached_ordinal
+
+ADULT_AGE = 18
+
+
 class Customer:
+  # Slots rather than a __dict__ per customer, as with Item
+  __slots__ = ('membership_number', 'name', '_date_of_birth', 'id_verified', 'delivery_distance_km', 'adult_from_ordinal', '_eligible_from')
+
   def __init__(self, membership_number: str, name: str, date_of_birth: str, id_verified: bool, delivery_distance_km: float):
     self.membership_number: str = membership_number
     self.name: str = name
     self.date_of_birth: str = date_of_birth
     self.id_verified: bool = id_verified
     self.delivery_distance_km: float = delivery_distance_km
+
+  @property
+  def date_of_birth(self) -> str:
+    return self._date_of_birth
+
+  @date_of_birth.setter
+  def date_of_birth(self, date_of_birth: str) -> None:
+    self._date_of_birth = date_of_birth
+    # Ordinal of the date the customer turns 18, or None if no valid birth date is provided
+    self.adult_from_ordinal: Optional[int] = age_reached_ordinal(date_of_birth, ADULT_AGE) if date_of_birth else None
+    # Age -> ordinal of the date the customer reaches it, for the other minimum ages of a RestrictionPolicy. Only made when first needed.
+    self._eligible_from: Optional[Dict[int, Optional[int]]] = None
+
+  def eligible_from(self, age: int) -> Optional[int]:
+    """The ordinal of the date the customer is the given age in full years, or None if no valid birth date is provided."""
+    if age == ADULT_AGE:
+      return self.adult_from_ordinal
+    if self._eligible_from is None:
+      self._eligible_from = {}
+    eligible_from = self._eligible_from.get(age)
+    if eligible_from is None and age not in self._eligible_from:
+      eligible_from = self._eligible_from[age] = age_reached_ordinal(self._date_of_birth, age) if self._date_of_birth else None
+    return eligible_from
@@ -1,8 +1,39 @@
+from typing import Optional, Tuple
 from DiscountType import DiscountType
+from money import DollarsField
 
 
 class Discount:
-  def __init__(self, type: DiscountType, value: float, item_id: str):
+  # Slots rather than a __dict__ per discount, as with Item
+  __slots__ = ('type', 'value_cents', 'item_id', 'start', 'end', '_frozen')
+
+  # Stored in value_cents, i.e. cents for flat discounts and hundredths of a percent for percentage discounts
+  value = DollarsField()
+
+  def __init__(self, type: DiscountType, value: float, item_id: str, start: Optional[str] = None, end: Optional[str] = None):
     self.type: DiscountType = type
     self.value: float = value
     self.item_id: str = item_id
+    # When the discount is valid from (inclusive) and until (exclusive), as 'dd/mm/YYYY' or 'dd/mm/YYYY HH:MM:SS'.
+    # None means it has no start or end. Only a DiscountSchedule takes these into account.
+    self.start: Optional[str] = start
+    self.end: Optional[str] = end
+    # A discount cannot be changed once made, as the prices worked out from it are remembered (see PriceBook).
+    # A new Discount is put in the discounts dictionary instead.
+    self._frozen: bool = True
+
+  def __setattr__(self, name: str, value: object) -> None:
+    if getattr(self, '_frozen', False):
+      raise Exception('A discount cannot be changed once made. Put a new Discount in the discounts dictionary instead.')
+    super().__setattr__(name, value)
+
+  def __delattr__(self, name: str) -> None:
+    raise Exception('A discount cannot be changed once made. Put a new Discount in the discounts dictionary instead.')
+
+  def __getstate__(self) -> Tuple[DiscountType, int, str, Optional[str], Optional[str]]:
+    # Restored by __setstate__ and frozen again, e.g. in replay's workers
+    return (self.type, self.value_cents, self.item_id, self.start, self.end)
+
+  def __setstate__(self, state: Tuple[DiscountType, int, str, Optional[str], Optional[str]]) -> None:
+    self.type, self.value_cents, self.item_id, self.start, self.end = state
+    self._frozen = True
@@ -0,0 +1,173 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from Discount import Discount
+from date_ordinals import parse_timestamp
+
+_NEVER = float('inf')
+_ALWAYS = float('-inf')
+
+
+class DiscountSchedule:
+  """
+  Discounts with the dates and times they are valid (see Discount.start and Discount.end), indexed by item ID, so that
+  years of past and future discounts can be loaded at once.
+  Each item's discounts are kept sorted by start, and may not overlap, so the discount valid at any moment is found with one binary search.
+
+  at() returns the discounts valid at a moment as a read-only discounts dictionary, which can be passed anywhere one is expected.
+  Between two consecutive starts or ends of any discount the valid discounts do not change, and the same dictionary is returned
+  for any moment in between, which lets checkout_batch keep using the prices it has worked out.
+  Discounts can be added and removed while lanes are using the schedule.
+  """
+
+  def __init__(self, discounts: Iterable[Discount] = ()):
+    # Item ID -> (starts, ends, discounts), sorted by start. Replaced rather than changed, so readers never see it half updated.
+    self._index: Dict[str, Tuple[List[float], List[float], List[Discount]]] = {}
+    # Every finite start and end, with repeats, in ascending order, and the discounts dictionary returned for each period between them.
+    # Replaced together, so the periods and their dictionaries always match.
+    self._periods: Tuple[List[int], Dict[int, 'ScheduledDiscounts']] = ([], {})
+    self._lock = threading.Lock()
+    self.version = 0
+
+    self._load(discounts)
+
+  def _load(self, discounts: Iterable[Discount]) -> None:
+    # Builds the index in one pass and one sort, rather than adding discounts one at a time
+    windows: Dict[str, List[Tuple[float, float, int, Discount]]] = {}
+    for (order, discount) in enumerate(discounts):
+      start, end = _window(discount)
+      windows.setdefault(discount.item_id, []).append((start, end, order, discount))
+
+    changes = []
+    for (item_id, item_windows) in windows.items():
+      item_windows.sort(key=lambda window: window[:3])
+      for (previous, window) in zip(item_windows, item_windows[1:]):
+        if previous[1] > window[0]:
+          raise Exception("Discount for item {} overlaps another discount for the same item.".format(item_id))
+      self._index[item_id] = ([window[0] for window in item_windows], [window[1] for window in item_windows], [window[3] for window in item_windows])
+      changes.extend(change for window in item_windows for change in window[:2] if change not in (_ALWAYS, _NEVER))
+
+    changes.sort()
+    self._periods = (changes, {})
+
+  def add(self, discount: Discount) -> None:
+    """Adds a discount. An Exception is raised if its dates are invalid or it overlaps another discount for the same item."""
+    start, end = _window(discount)
+    with self._lock:
+      starts, ends, discounts = self._index.get(discount.item_id, ([], [], []))
+      position = bisect_right(starts, start)
+      if (position > 0 and ends[position - 1] > start) or (position < len(starts) and starts[position] < end):
+        raise Exception("Discount for item {} overlaps another discount for the same item.".format(discount.item_id))
+
+      self._index[discount.item_id] = (starts[:position] + [start] + starts[position:], ends[:position] + [end] + ends[position:],
+                                       discounts[:position] + [discount] + discounts[position:])
+      self._changed(start, end, insort)
+
+  def remove(self, discount: Discount) -> None:
+    """Removes a discount added earlier. Raises a KeyError if it is not in the schedule."""
+    with self._lock:
+      starts, ends, discounts = self._index.get(discount.item_id, ([], [], []))
+      position = next((index for (index, scheduled) in enumerate(discounts) if scheduled is discount), None)
+      if position is None:
+        raise KeyError(discount.item_id)
+
+      if len(discounts) == 1:
+        del self._index[discount.item_id]
+      else:
+        self._index[discount.item_id] = (starts[:position] + starts[position + 1:], ends[:position] + ends[position + 1:],
+                                         discounts[:position] + discounts[position + 1:])
+      self._changed(starts[position], ends[position], lambda changes, change: changes.pop(bisect_left(changes, change)))
+
+  def _changed(self, start: float, end: float, update) -> None:
+    changes = list(self._periods[0])
+    for change in (start, end):
+      if change not in (_ALWAYS, _NEVER):
+        update(changes, change)
+    self._periods = (changes, {})
+    self.version += 1
+
+  def discount_at(self, item_id: str, timestamp: int) -> Optional[Discount]:
+    """The discount for the item valid at the timestamp (see date_ordinals.parse_timestamp), or None."""
+    scheduled = self._index.get(item_id)
+    if scheduled is None:
+      return None
+    starts, ends, discounts = scheduled
+    position = bisect_right(starts, timestamp) - 1
+    if position >= 0 and timestamp < ends[position]:
+      return discounts[position]
+    return None
+
+  def at(self, date_string: str, time_string: Optional[str] = None) -> 'ScheduledDiscounts':
+    """The discounts valid at a dd/mm/YYYY date and optional HH:MM:SS time (midnight if not given), e.g. a transaction's."""
+    timestamp = parse_timestamp(date_string, time_string)
+    if timestamp is None:
+      raise Exception("Date and time must be provided in the dd/mm/YYYY and HH:MM:SS formats to look up scheduled discounts.")
+    return self.at_timestamp(timestamp)
+
+  def at_timestamp(self, timestamp: int) -> 'ScheduledDiscounts':
+    changes, views = self._periods
+    period = bisect_right(changes, timestamp)
+    view = views.get(period)
+    if view is None:
+      view = views[period] = ScheduledDiscounts(self, timestamp)
+    return view
+
+  def discounts(self) -> Iterator[Discount]:
+    """Every discount in the schedule, by item and then by start."""
+    for (_, _, discounts) in list(self._index.values()):
+      yield from discounts
+
+  def __len__(self) -> int:
+    return sum(len(discounts) for (_, _, discounts) in list(self._index.values()))
+
+  def __getstate__(self) -> Dict[str, object]:
+    # Sent to replay's worker processes as a list of discounts
+    return {'discounts': list(self.discounts())}
+
+  def __setstate__(self, state: Dict[str, object]) -> None:
+    self.__init__(state['discounts'])
+
+
+class ScheduledDiscounts(Mapping):
+  """The discounts dictionary of a DiscountSchedule at one moment: item IDs mapped to the discount valid for them then."""
+
+  def __init__(self, schedule: DiscountSchedule, timestamp: int):
+    self.schedule = schedule
+    self.timestamp = timestamp
+
+  def __getitem__(self, item_id: str) -> Discount:
+    discount = self.schedule.discount_at(item_id, self.timestamp)
+    if discount is None:
+      raise KeyError(item_id)
+    return discount
+
+  def __contains__(self, item_id: object) -> bool:
+    return self.schedule.discount_at(item_id, self.timestamp) is not None
+
+  def __iter__(self) -> Iterator[str]:
+    for item_id in list(self.schedule._index):
+      if item_id in self:
+        yield item_id
+
+  def __len__(self) -> int:
+    return sum(1 for _ in self)
+
+
+def _window(discount: Discount) -> Tuple[float, float]:
+  # The (start, end) timestamps of a discount, with no start as minus infinity and no end as infinity
+  start, end = _ALWAYS, _NEVER
+  if discount.start is not None:
+    start = _parse(discount.start)
+  if discount.end is not None:
+    end = _parse(discount.end)
+  if start >= end:
+    raise Exception("Discount for item {} must start before it ends.".format(discount.item_id))
+  return start, end
+
+
+def _parse(date_time_string: str) -> int:
+  timestamp = parse_timestamp(*date_time_string.split(' ', 1))
+  if timestamp is None:
+    raise Exception("Discount dates must be in the dd/mm/YYYY or dd/mm/YYYY HH:MM:SS format.")
+  return timestamp
@@ -0,0 +1,28 @@
+from typing import List, Tuple
+
+# How many rejected rows are kept in the error list
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportReport:
+  def __init__(self):
+    # Rows read from the feed, and how many of them were applied or rejected
+    self.rows: int = 0
+    self.applied: int = 0
+    self.rejected: int = 0
+    # (row number, error message) of the first rejected rows
+    self.errors: List[Tuple[int, str]] = []
+    self.seconds: float = 0.0
+
+  def reject(self, row: int, error: Exception) -> None:
+    # Records the row number (counted from 1, after any header) as rejected with the error
+    self.rejected += 1
+    if len(self.errors) < MAX_REPORTED_ERRORS:
+      self.errors.append((row, '{}: {}'.format(type(error).__name__, error)))
+
+  @property
+  def rows_per_second(self) -> float:
+    return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+  def __str__(self) -> str:
+    return '{} rows ({} applied, {} rejected) in {:.2f}s, {:.0f} rows/s'.format(self.rows, self.applied, self.rejected, self.seconds, self.rows_per_second)
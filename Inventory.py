@@ -0,0 +1,146 @@
+import threading
+from collections.abc import MutableMapping
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+from Item import Item
+from InsufficientStockException import InsufficientStockException
+
+
+class Inventory(MutableMapping):
+  """
+  Items dictionary (string item IDs to (item, stock level, purchase quantity limit) tuples) whose stock levels can be
+  shared by many checkout lanes at once.
+  Stock is guarded by a fixed number of lock shards rather than one global lock, so lanes selling different items do not wait on each other.
+  commit() checks and takes the stock for a whole basket in one step, and rollback() puts it back.
+  """
+
+  def __init__(self, items: Iterable[Tuple[Item, int, Optional[int]]] = (), shards: int = 64):
+    self._items: Dict[str, Tuple[Item, Optional[int]]] = {}
+    self._stock: Dict[str, int] = {}
+    self._locks: List[threading.Lock] = [threading.Lock() for _ in range(shards)]
+
+    for (item, stock, limit) in items:
+      self[item.id] = (item, stock, limit)
+
+  def _lock_for(self, item_id: str) -> threading.Lock:
+    return self._locks[hash(item_id) % len(self._locks)]
+
+  def _locks_for(self, item_ids: Iterable[str]) -> List[threading.Lock]:
+    # Always taken in the same order, so two baskets sharing shards cannot deadlock
+    shard_indexes = sorted({hash(item_id) % len(self._locks) for item_id in item_ids})
+    return [self._locks[index] for index in shard_indexes]
+
+  def __getitem__(self, item_id: str) -> Tuple[Item, int, Optional[int]]:
+    item, limit = self._items[item_id]
+    return item, self._stock[item_id], limit
+
+  def __setitem__(self, item_id: str, value: Tuple[Item, int, Optional[int]]) -> None:
+    item, stock, limit = value
+    with self._lock_for(item_id):
+      self._items[item_id] = (item, limit)
+      self._stock[item_id] = stock
+
+  def __delitem__(self, item_id: str) -> None:
+    with self._lock_for(item_id):
+      del self._items[item_id]
+      del self._stock[item_id]
+
+  def __iter__(self) -> Iterator[str]:
+    return iter(self._items)
+
+  def __len__(self) -> int:
+    return len(self._items)
+
+  def __contains__(self, item_id: object) -> bool:
+    return item_id in self._items
+
+  def adjust_stock(self, item_id: str, delta: int) -> int:
+    """Adds delta (which may be negative) to an item's stock level and returns the new level."""
+    with self._lock_for(item_id):
+      self._stock[item_id] += delta
+      return self._stock[item_id]
+
+  def commit(self, quantities: Mapping[str, int]) -> Dict[str, int]:
+    """
+    Takes the given quantity of each item ID out of stock, either all together or not at all.
+    If any item does not have enough stock, an InsufficientStockException is raised and no stock is changed.
+    Returns the quantities taken, which can be passed to rollback() to put them back.
+    """
+    reservation = {item_id: quantity for (item_id, quantity) in quantities.items() if quantity}
+    locks = self._locks_for(reservation)
+
+    for lock in locks:
+      lock.acquire()
+    try:
+      for (item_id, quantity) in reservation.items():
+        if item_id not in self._stock or self._stock[item_id] < quantity:
+          item = self._items[item_id][0] if item_id in self._items else None
+          raise InsufficientStockException(f"Insufficient stock for item {item.name if item else item_id}")
+
+      for (item_id, quantity) in reservation.items():
+        self._stock[item_id] -= quantity
+    finally:
+      for lock in reversed(locks):
+        lock.release()
+
+    return reservation
+
+  def rollback(self, reservation: Mapping[str, int]) -> None:
+    """Puts back stock taken by commit()."""
+    locks = self._locks_for(reservation)
+
+    for lock in locks:
+      lock.acquire()
+    try:
+      for (item_id, quantity) in reservation.items():
+        if item_id in self._stock:
+          self._stock[item_id] += quantity
+    finally:
+      for lock in reversed(locks):
+        lock.release()
+
+  def apply(self, items: Mapping[str, Tuple[Item, Optional[int], Optional[int]]], stock_deltas: Mapping[str, int]) -> None:
+    """
+    Adds or replaces many items and then adjusts many stock levels as a single change, so lanes see all of it or none of it.
+    An item given with a stock level of None keeps its current stock level.
+    If a stock delta would take an item's stock below zero, an InsufficientStockException is raised and nothing is changed.
+    """
+    locks = self._locks_for(set(items) | set(stock_deltas))
+
+    for lock in locks:
+      lock.acquire()
+    try:
+      self._check_apply(items, stock_deltas)
+      for (item_id, (item, stock, limit)) in items.items():
+        self._items[item_id] = (item, limit)
+      self._apply_stock(items, stock_deltas)
+    finally:
+      for lock in reversed(locks):
+        lock.release()
+
+  def _check_apply(self, items: Mapping[str, Tuple[Item, Optional[int], Optional[int]]], stock_deltas: Mapping[str, int]) -> None:
+    # Raises the exception apply() would, without changing anything. The locks of every item involved must be held.
+    for (item_id, (item, stock, limit)) in items.items():
+      if stock is None and item_id not in self._stock:
+        raise Exception(f"Item with code {item_id} not found")
+
+    for (item_id, delta) in stock_deltas.items():
+      stock = items[item_id][1] if item_id in items else None
+      if stock is None:
+        stock = self._stock.get(item_id)
+      if stock is None:
+        raise Exception(f"Item with code {item_id} not found")
+      if stock + delta < 0:
+        item = items[item_id][0] if item_id in items else self._items[item_id][0]
+        raise InsufficientStockException(f"Insufficient stock for item {item.name}")
+
+  def _apply_stock(self, items: Mapping[str, Tuple[Item, Optional[int], Optional[int]]], stock_deltas: Mapping[str, int]) -> None:
+    # Sets the stock levels of the items given with one, then adds the stock deltas. The locks of every item involved must be held.
+    for (item_id, (item, stock, limit)) in items.items():
+      if stock is not None:
+        self._stock[item_id] = stock
+    for (item_id, delta) in stock_deltas.items():
+      self._stock[item_id] += delta
+
+  def snapshot(self) -> Dict[str, Tuple[Item, int, Optional[int]]]:
+    """Returns a plain items dictionary with the current stock levels."""
+    return {item_id: self[item_id] for item_id in list(self._items)}
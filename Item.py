@@ -1,9 +1,33 @@
-from typing import List
+from typing import List, Tuple
+from money import DollarsField
+from category_ids import intern_categories
 
 
 class Item:
+  # Slots rather than a __dict__ per item, as catalogs hold millions of them. __weakref__ is kept for MappedCatalog's cache.
+  __slots__ = ('id', 'name', 'original_price_cents', '_categories', 'category_mask', '__weakref__')
+
+  original_price = DollarsField() # stored in original_price_cents
+
   def __init__(self, id: str, name: str, original_price: float, categories: List[str]):
     self.id: str = id
     self.name: str = name
     self.original_price: float = original_price
     self.categories: List[str] = categories
+
+  @property
+  def categories(self) -> Tuple[str, ...]:
+    # A tuple shared with every other item in the same categories
+    return self._categories
+
+  @categories.setter
+  def categories(self, categories: List[str]) -> None:
+    # Also sets the bitmask of the item's category IDs (see category_ids), compared against a RestrictionPolicy's restricted categories
+    self._categories, self.category_mask = intern_categories(categories or ())
+
+  def __getstate__(self) -> Tuple[str, str, int, Tuple[str, ...]]:
+    # Category IDs are only the same within one process, so the mask is worked out again when unpickled, e.g. in replay's workers
+    return (self.id, self.name, self.original_price_cents, self._categories)
+
+  def __setstate__(self, state: Tuple[str, str, int, Tuple[str, ...]]) -> None:
+    self.id, self.name, self.original_price_cents, self.categories = state
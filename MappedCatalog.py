@@ -0,0 +1,282 @@
+"""
+Catalog file format (all integers little-endian):
+
+  header:   b'MMC1', uint32 item ID width, uint64 number of items, uint64 number of discounts
+  IDs:      every item ID as UTF-8, padded with zero bytes to the item ID width, sorted
+  records:  one per item, in the same order as the IDs:
+              uint64 offset of its strings, int64 price (cents), int64 stock level, int64 purchase quantity limit (-1 if none),
+              int64 discount value (cents or hundredths of a percent), uint8 discount type (0 if no discount, then 1 + index into DiscountType)
+  strings:  per item: str name, uint16 number of categories, str per category
+
+where str is a uint16 byte length followed by UTF-8 bytes.
+"""
+import bisect
+import mmap
+import os
+import struct
+import threading
+import weakref
+from collections.abc import Mapping, MutableMapping, Sequence
+from typing import Iterable, Iterator, List, Optional, Tuple
+from Item import Item
+from Discount import Discount
+from DiscountType import DiscountType
+from Inventory import Inventory
+from money import from_cents
+
+MAGIC = b'MMC1'
+_HEADER = struct.Struct('<4sIQQ')
+_RECORD = struct.Struct('<QqqqqB')
+_STOCK = struct.Struct('<q')
+# Where the stock level is within a record
+_STOCK_OFFSET = 16
+_NO_LIMIT = -1
+_NO_DISCOUNT = 0
+
+_DISCOUNT_TYPES = list(DiscountType)
+
+
+def write_catalog(path: str, items: Iterable[Tuple[Item, int, Optional[int]]], discounts: Iterable[Discount] = ()) -> None:
+  """Writes the given (item, stock level, purchase quantity limit) tuples and their discounts to a catalog file."""
+  items = sorted(items, key=lambda entry: entry[0].id.encode('utf-8'))
+  discounts = {discount.item_id: discount for discount in discounts}
+  id_width = max((len(item.id.encode('utf-8')) for (item, _, _) in items), default=1)
+
+  for (left, right) in zip(items, items[1:]):
+    if left[0].id == right[0].id:
+      raise Exception('Item ID {} appears more than once.'.format(left[0].id))
+  unknown_item_ids = discounts.keys() - {item.id for (item, _, _) in items}
+  if unknown_item_ids:
+    raise Exception('Discount for item ID {} does not match any item.'.format(min(unknown_item_ids)))
+
+  strings = bytearray()
+  records = bytearray()
+  for (item, stock, limit) in items:
+    discount = discounts.get(item.id)
+    records += _RECORD.pack(len(strings), item.original_price_cents, stock, _NO_LIMIT if limit is None else limit,
+                            discount.value_cents if discount else 0,
+                            _DISCOUNT_TYPES.index(discount.type) + 1 if discount else _NO_DISCOUNT)
+    _pack_str(strings, item.name)
+    strings += struct.pack('<H', len(item.categories))
+    for category in item.categories:
+      _pack_str(strings, category)
+
+  # Written alongside and then renamed over the old file, so a catalog is never seen half written
+  temporary_path = path + '.tmp'
+  with open(temporary_path, 'wb') as catalog_file:
+    catalog_file.write(_HEADER.pack(MAGIC, id_width, len(items), len(discounts)))
+    for (item, _, _) in items:
+      catalog_file.write(item.id.encode('utf-8').ljust(id_width, b'\0'))
+    catalog_file.write(records)
+    catalog_file.write(strings)
+    catalog_file.flush()
+    os.fsync(catalog_file.fileno())
+  os.replace(temporary_path, path)
+
+
+def _pack_str(buffer: bytearray, value: str) -> None:
+  encoded = value.encode('utf-8')
+  buffer += struct.pack('<H', len(encoded))
+  buffer += encoded
+
+
+def _unpack_str(buffer, offset: int) -> Tuple[str, int]:
+  (length,) = struct.unpack_from('<H', buffer, offset)
+  offset += 2
+  return bytes(buffer[offset:offset + length]).decode('utf-8'), offset + length
+
+
+class _IdColumn(Sequence):
+  # The sorted, padded item IDs of a catalog file, so they can be binary searched with bisect
+  def __init__(self, catalog: 'MappedCatalog'):
+    self._catalog = catalog
+
+  def __len__(self) -> int:
+    return self._catalog._count
+
+  def __getitem__(self, index: int) -> bytes:
+    start = self._catalog._ids_offset + index * self._catalog._id_width
+    return self._catalog._map[start:start + self._catalog._id_width]
+
+
+class _ItemDefinitions(Mapping):
+  # Item IDs to (item, purchase quantity limit), as Inventory keeps in _items
+  def __init__(self, catalog: 'MappedCatalog'):
+    self._catalog = catalog
+
+  def __getitem__(self, item_id: str) -> Tuple[Item, Optional[int]]:
+    item, _, limit = self._catalog[item_id]
+    return item, limit
+
+  def __iter__(self) -> Iterator[str]:
+    return iter(self._catalog)
+
+  def __len__(self) -> int:
+    return len(self._catalog)
+
+  def __contains__(self, item_id: object) -> bool:
+    return item_id in self._catalog
+
+
+class _StockColumn(MutableMapping):
+  # Item IDs to stock levels, as Inventory keeps in _stock, read from and written to the records in the mapped file
+  def __init__(self, catalog: 'MappedCatalog'):
+    self._catalog = catalog
+
+  def _offset(self, item_id: str) -> int:
+    index = self._catalog._find(item_id)
+    if index is None:
+      raise KeyError(item_id)
+    return self._catalog._record_offset(index) + _STOCK_OFFSET
+
+  def __getitem__(self, item_id: str) -> int:
+    return _STOCK.unpack_from(self._catalog._map, self._offset(item_id))[0]
+
+  def __setitem__(self, item_id: str, stock: int) -> None:
+    _STOCK.pack_into(self._catalog._map, self._offset(item_id), stock)
+
+  def __delitem__(self, item_id: str) -> None:
+    raise Exception('Items cannot be removed from a mapped catalog.')
+
+  def __iter__(self) -> Iterator[str]:
+    return iter(self._catalog)
+
+  def __len__(self) -> int:
+    return len(self._catalog)
+
+  def __contains__(self, item_id: object) -> bool:
+    return item_id in self._catalog
+
+
+class MappedCatalog(Inventory):
+  """
+  Items dictionary read from a catalog file written by write_catalog, which is memory-mapped rather than loaded,
+  so opening it takes the same time and memory however many items it holds.
+  Item objects are only built when looked up, and the same object is returned for as long as anything still uses it.
+  Stock levels are taken and put back with the same locking as an Inventory. If the catalog is opened writable, stock
+  changes are written to the file, otherwise they are only seen by this process.
+  Items cannot be added, replaced or removed, only their stock levels changed.
+  """
+
+  def __init__(self, path: str, writable: bool = False, shards: int = 64):
+    self.path = path
+    self._locks: List[threading.Lock] = [threading.Lock() for _ in range(shards)]
+
+    with open(path, 'r+b' if writable else 'rb') as catalog_file:
+      self._map = mmap.mmap(catalog_file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_COPY)
+
+    magic, self._id_width, self._count, self._discount_count = _HEADER.unpack_from(self._map, 0)
+    if magic != MAGIC:
+      raise Exception('{} is not a catalog file.'.format(path))
+    self._ids_offset = _HEADER.size
+    self._records_offset = self._ids_offset + self._count * self._id_width
+    self._strings_offset = self._records_offset + self._count * _RECORD.size
+
+    self._ids = _IdColumn(self)
+    self._items = _ItemDefinitions(self)
+    self._stock = _StockColumn(self)
+    # Items built so far, kept only while something else still refers to them
+    self._built: 'weakref.WeakValueDictionary[int, Item]' = weakref.WeakValueDictionary()
+
+  def _find(self, item_id: str) -> Optional[int]:
+    if not isinstance(item_id, str):
+      return None
+    key = item_id.encode('utf-8')
+    if len(key) > self._id_width:
+      return None
+    key = key.ljust(self._id_width, b'\0')
+    index = bisect.bisect_left(self._ids, key)
+    if index < self._count and self._ids[index] == key:
+      return index
+    return None
+
+  def _record_offset(self, index: int) -> int:
+    return self._records_offset + index * _RECORD.size
+
+  def _record(self, index: int) -> Tuple[int, int, int, int, int, int]:
+    return _RECORD.unpack_from(self._map, self._record_offset(index))
+
+  def _item(self, index: int, item_id: str, strings_offset: int, price_cents: int) -> Item:
+    item = self._built.get(index)
+    if item is None:
+      name, offset = _unpack_str(self._map, self._strings_offset + strings_offset)
+      (category_count,) = struct.unpack_from('<H', self._map, offset)
+      offset += 2
+      categories = []
+      for _ in range(category_count):
+        category, offset = _unpack_str(self._map, offset)
+        categories.append(category)
+
+      item = Item(item_id, name, 0, categories)
+      item.original_price_cents = price_cents
+      self._built[index] = item
+    return item
+
+  def __getitem__(self, item_id: str) -> Tuple[Item, int, Optional[int]]:
+    index = self._find(item_id)
+    if index is None:
+      raise KeyError(item_id)
+    strings_offset, price_cents, stock, limit, _, _ = self._record(index)
+    return self._item(index, item_id, strings_offset, price_cents), stock, None if limit == _NO_LIMIT else limit
+
+  def __setitem__(self, item_id: str, value: Tuple[Item, int, Optional[int]]) -> None:
+    raise Exception('Items cannot be added to or replaced in a mapped catalog.')
+
+  def __delitem__(self, item_id: str) -> None:
+    raise Exception('Items cannot be removed from a mapped catalog.')
+
+  def __iter__(self) -> Iterator[str]:
+    for index in range(self._count):
+      yield self._ids[index].rstrip(b'\0').decode('utf-8')
+
+  def __len__(self) -> int:
+    return self._count
+
+  def __contains__(self, item_id: object) -> bool:
+    return self._find(item_id) is not None
+
+  def apply(self, items: Mapping[str, Tuple[Item, Optional[int], Optional[int]]], stock_deltas: Mapping[str, int]) -> None:
+    if items:
+      raise Exception('Items cannot be added to or replaced in a mapped catalog.')
+    super().apply(items, stock_deltas)
+
+  def discount(self, item_id: str) -> Optional[Discount]:
+    """Returns a new Discount object for the item's discount, or None if it has none (or is not in the catalog)."""
+    index = self._find(item_id)
+    if index is None:
+      return None
+    _, _, _, _, value_cents, discount_type = self._record(index)
+    if discount_type == _NO_DISCOUNT:
+      return None
+    return Discount(_DISCOUNT_TYPES[discount_type - 1], from_cents(value_cents), item_id)
+
+  def flush(self) -> None:
+    """Makes stock changes durable, if the catalog was opened writable."""
+    self._map.flush()
+
+  def close(self) -> None:
+    self._map.close()
+
+
+class MappedDiscounts(Mapping):
+  """Discounts dictionary read from the same catalog file as a MappedCatalog, building Discount objects as they are looked up."""
+
+  def __init__(self, catalog: MappedCatalog):
+    self.catalog = catalog
+
+  def __getitem__(self, item_id: str) -> Discount:
+    discount = self.catalog.discount(item_id)
+    if discount is None:
+      raise KeyError(item_id)
+    return discount
+
+  def __contains__(self, item_id: object) -> bool:
+    return self.catalog.discount(item_id) is not None
+
+  def __iter__(self) -> Iterator[str]:
+    for index in range(len(self.catalog)):
+      if self.catalog._record(index)[5] != _NO_DISCOUNT:
+        yield self.catalog._ids[index].rstrip(b'\0').decode('utf-8')
+
+  def __len__(self) -> int:
+    return self.catalog._discount_count
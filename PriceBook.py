@@ -0,0 +1,117 @@
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple, Union
+from Item import Item
+from Discount import Discount
+
+# How many of the latest discount changes a PriceBook remembers for changed_since()
+MAX_REMEMBERED_CHANGES = 4096
+
+
+class PriceBook(dict):
+  """
+  A discounts dictionary (string item IDs to discount objects) that also remembers each item's final price and per-unit savings.
+  It can be passed anywhere a discounts dictionary is expected.
+  Prices are worked out the first time an item is looked up and kept until the item's discount is added, replaced or removed
+  through this dictionary, or until invalidate() is called for it. Discount objects cannot be changed in place, so a discount
+  can only change through this dictionary.
+  """
+
+  def __init__(self, discounts_dict: Optional[Mapping[str, Discount]] = None):
+    super().__init__(discounts_dict or {})
+    # Maps item IDs to (item object the price was worked out for, final price cents, per-unit savings cents)
+    self._prices: Dict[str, Tuple[Item, int, int]] = {}
+    # Goes up every time a discount changes, so anything priced from this book can tell when to price again
+    self.version: int = 0
+    # The item ID each of the latest changes was for (None for a change to every item). The first took the version from _first_change.
+    self._changes: List[Optional[str]] = []
+    self._first_change: int = 0
+
+  def cached_price(self, item: Item) -> Optional[Tuple[int, int]]:
+    """Returns the remembered (final price, per-unit savings) of an item in cents, or None if it needs to be worked out."""
+    entry = self._prices.get(item.id)
+    if entry is None or entry[0] is not item:
+      return None
+    return entry[1], entry[2]
+
+  def store_price(self, item: Item, final_price_cents: int, savings_cents: int) -> None:
+    self._prices[item.id] = (item, final_price_cents, savings_cents)
+
+  def changed_since(self, version: int) -> Optional[Set[str]]:
+    """
+    Returns the IDs of the items whose discounts changed since this book was at the given version, so that only their prices need
+    working out again. Returns None if every discount may have changed, or the changes are too long ago to be remembered.
+    """
+    if version < self._first_change or version > self.version:
+      return None
+    changed_item_ids = self._changes[version - self._first_change:]
+    if None in changed_item_ids:
+      return None
+    return set(changed_item_ids)
+
+  def _changed(self, item_id: Optional[str]) -> None:
+    self.version += 1
+    self._changes.append(item_id)
+    if len(self._changes) > 2 * MAX_REMEMBERED_CHANGES:
+      del self._changes[:MAX_REMEMBERED_CHANGES]
+      self._first_change += MAX_REMEMBERED_CHANGES
+
+  def updated(self, discounts: Mapping[str, Optional[Discount]]) -> 'PriceBook':
+    """
+    Returns a new PriceBook (of the same class as this one) with the given discounts added or replaced (or removed, if given as None),
+    leaving this one as it is.
+    The prices remembered for every other item are kept, as they are only used for the same item object they were worked out for.
+    """
+    price_book = type(self)(self)
+    for (item_id, discount) in discounts.items():
+      if discount is None:
+        dict.pop(price_book, item_id, None)
+      else:
+        dict.__setitem__(price_book, item_id, discount)
+
+    price_book._prices = dict(self._prices)
+    for item_id in discounts:
+      price_book._prices.pop(item_id, None)
+    return price_book
+
+  def invalidate(self, item_id: str) -> None:
+    self._prices.pop(item_id, None)
+    self._changed(item_id)
+
+  def invalidate_all(self) -> None:
+    self._prices.clear()
+    self._changed(None)
+
+  # Every way of changing the discounts only drops the prices of the affected items
+
+  def __setitem__(self, item_id: str, discount: Discount) -> None:
+    super().__setitem__(item_id, discount)
+    self.invalidate(item_id)
+
+  def __delitem__(self, item_id: str) -> None:
+    super().__delitem__(item_id)
+    self.invalidate(item_id)
+
+  def pop(self, item_id: str, *default):
+    self.invalidate(item_id)
+    return super().pop(item_id, *default)
+
+  def popitem(self) -> Tuple[str, Discount]:
+    item_id, discount = super().popitem()
+    self.invalidate(item_id)
+    return item_id, discount
+
+  def setdefault(self, item_id: str, discount: Optional[Discount] = None) -> Discount:
+    if item_id not in self:
+      self.invalidate(item_id)
+    return super().setdefault(item_id, discount)
+
+  def update(self, other: Union[Mapping[str, Discount], Iterable[Tuple[str, Discount]]] = (), **kwargs: Discount) -> None:
+    for (item_id, discount) in dict(other, **kwargs).items():
+      self[item_id] = discount
+
+  def __ior__(self, other: Mapping[str, Discount]) -> 'PriceBook':
+    self.update(other)
+    return self
+
+  def clear(self) -> None:
+    super().clear()
+    self.invalidate_all()
@@ -0,0 +1,30 @@
+from typing import Iterable, List, Optional
+from DiscountType import DiscountType
+from PromotionType import PromotionType
+from money import DollarsField
+
+
+class Promotion:
+  """
+  A promotion run across many items, or across the whole basket.
+
+    CATEGORY         A percentage or flat amount off the original price of every unit of the items in its categories or item IDs
+    MULTI_BUY        Buy 'buy' units of an item in its categories or item IDs, and get the next 'free' units of the same item free
+    SPEND_THRESHOLD  A percentage or flat amount off the subtotal of any basket that reaches the threshold
+  """
+  # Stored in value_cents, as for Discount: cents for flat promotions and hundredths of a percent for percentage promotions
+  value = DollarsField()
+  threshold = DollarsField() # stored in threshold_cents
+
+  def __init__(self, type: PromotionType, name: str, discount_type: Optional[DiscountType] = None, value: Optional[float] = None,
+               categories: Iterable[str] = (), item_ids: Iterable[str] = (), buy: Optional[int] = None, free: Optional[int] = None,
+               threshold: Optional[float] = None):
+    self.type: PromotionType = type
+    self.name: str = name
+    self.discount_type: Optional[DiscountType] = discount_type
+    self.value: Optional[float] = value
+    self.categories: List[str] = list(categories)
+    self.item_ids: List[str] = list(item_ids)
+    self.buy: Optional[int] = buy
+    self.free: Optional[int] = free
+    self.threshold: Optional[float] = threshold
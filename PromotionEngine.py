@@ -0,0 +1,176 @@
+import json
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from Item import Item
+from DiscountType import DiscountType
+from Promotion import Promotion
+from PromotionType import PromotionType
+
+
+class PromotionEngine:
+  """
+  Promotions compiled into lookup tables when loaded, so that pricing a basket takes time proportional to its number of lines
+  rather than lines times promotions.
+  Category and multi-buy promotions are indexed by item ID and by lower-case category, and the promotions that apply to an item
+  are worked out the first time the item is priced. Spend thresholds are sorted, with the best percentage and flat amount
+  reached at each threshold worked out in advance, so the basket discount is found with one binary search.
+
+  Promotions do not stack with an item's own discount: each unit is sold at whichever of the two prices is lower.
+  Multi-buy free units are then given at that price, and a spend threshold discount is taken off the subtotal of the lines.
+  """
+
+  def __init__(self, promotions: Iterable[Promotion]):
+    self.promotions: List[Promotion] = list(promotions)
+    self._by_item_id: Dict[str, List[Promotion]] = {}
+    self._by_category: Dict[str, List[Promotion]] = {}
+    thresholds = []
+
+    for promotion in self.promotions:
+      _validate(promotion)
+      if promotion.type == PromotionType.SPEND_THRESHOLD:
+        thresholds.append(promotion)
+        continue
+      for item_id in promotion.item_ids:
+        self._by_item_id.setdefault(item_id, []).append(promotion)
+      for category in promotion.categories:
+        self._by_category.setdefault(category.lower(), []).append(promotion)
+
+    # Thresholds in cents, in ascending order, and the best percentage (in hundredths) and flat amount of any threshold up to each one
+    thresholds.sort(key=lambda promotion: promotion.threshold_cents)
+    self._threshold_cents: List[int] = [promotion.threshold_cents for promotion in thresholds]
+    self._best_percentages: List[int] = []
+    self._best_flat_cents: List[int] = []
+    best_percentage, best_flat_cents = 0, 0
+    for promotion in thresholds:
+      if promotion.discount_type == DiscountType.PERCENTAGE:
+        best_percentage = max(best_percentage, promotion.value_cents)
+      else:
+        best_flat_cents = max(best_flat_cents, promotion.value_cents)
+      self._best_percentages.append(best_percentage)
+      self._best_flat_cents.append(best_flat_cents)
+
+    # Item -> (lowest promotional unit price in cents or None, (buy, free) of the best multi-buy or None)
+    self._item_rules: Dict[Item, Tuple[Optional[int], Optional[Tuple[int, int]]]] = {}
+
+  @classmethod
+  def load(cls, path: str) -> 'PromotionEngine':
+    """
+    Loads and compiles promotions from a JSON file holding a list of promotions, each an object with the arguments of Promotion, e.g.
+    {"type": "Multi-buy", "name": "3 for 2 biscuits", "categories": ["Biscuits"], "buy": 2, "free": 1}.
+    Promotion and discount types are given by name or value, in any case.
+    """
+    with open(path) as promotions_file:
+      promotions = json.load(promotions_file)
+    try:
+      return cls(Promotion(**dict(promotion, type=_enum_member(PromotionType, promotion['type']),
+                                  discount_type=_enum_member(DiscountType, promotion.get('discount_type'))))
+                 for promotion in promotions)
+    except (AttributeError, KeyError, TypeError):
+      raise Exception("Promotions file {} must hold a list of promotions, each with a type, a name and the fields of its type.".format(path))
+
+  def item_rules(self, item: Item) -> Tuple[Optional[int], Optional[Tuple[int, int]]]:
+    """The lowest unit price any category promotion gives the item in cents, and the (buy, free) of its best multi-buy, either None if there is none."""
+    rules = self._item_rules.get(item)
+    if rules is not None:
+      return rules
+
+    promotions = list(self._by_item_id.get(item.id, ()))
+    for category in item.categories:
+      promotions.extend(self._by_category.get(category.lower(), ()))
+
+    unit_price_cents = None
+    multi_buy = None
+    for promotion in promotions:
+      if promotion.type == PromotionType.CATEGORY:
+        price_cents = _promotional_price_cents(item.original_price_cents, promotion)
+        if unit_price_cents is None or price_cents < unit_price_cents:
+          unit_price_cents = price_cents
+      # The best multi-buy gives the most free units for every unit taken
+      elif multi_buy is None or promotion.free * sum(multi_buy) > multi_buy[1] * (promotion.buy + promotion.free):
+        multi_buy = (promotion.buy, promotion.free)
+
+    rules = self._item_rules[item] = (unit_price_cents, multi_buy)
+    return rules
+
+  def basket_discount_cents(self, subtotal_cents: int) -> int:
+    """The best spend threshold discount for a basket with this subtotal, never more than the subtotal."""
+    reached = bisect_right(self._threshold_cents, subtotal_cents)
+    if reached == 0:
+      return 0
+    percentage_cents = (subtotal_cents * self._best_percentages[reached - 1] + 5000) // 10000
+    return min(subtotal_cents, max(percentage_cents, self._best_flat_cents[reached - 1]))
+
+  def price_lines(self, lines: Sequence[Tuple[Item, int, int]]) -> Tuple[List[Tuple[int, int]], int]:
+    """
+    Prices the (item, quantity, unit price in cents after the item's own discount) of each line with the promotions.
+    Returns the (final cost, savings) in cents of each line, and the spend threshold discount taken off their subtotal.
+    Multi-buy free units are counted over all the lines of an item, and taken off its lines in order.
+    """
+    unit_prices_cents = []
+    # Item ID -> [quantity, (buy, free)] of the items on multi-buy
+    multi_buys: Dict[str, list] = {}
+    for (item, quantity, unit_price_cents) in lines:
+      promotional_price_cents, multi_buy = self.item_rules(item)
+      if promotional_price_cents is not None and promotional_price_cents < unit_price_cents:
+        unit_price_cents = promotional_price_cents
+      unit_prices_cents.append(unit_price_cents)
+
+      if multi_buy is not None:
+        multi_buys.setdefault(item.id, [0, multi_buy])[0] += quantity
+
+    free_units = {}
+    for (item_id, (quantity, (buy, free))) in multi_buys.items():
+      # Every full group of buy + free units has free units free, and so do any units taken beyond 'buy' in a partial group
+      groups, remainder = divmod(quantity, buy + free)
+      free_units[item_id] = groups * free + max(0, remainder - buy)
+
+    line_prices = []
+    subtotal_cents = 0
+    for ((item, quantity, _), unit_price_cents) in zip(lines, unit_prices_cents):
+      free = min(free_units.get(item.id, 0), quantity)
+      if free:
+        free_units[item.id] -= free
+      cost_cents = unit_price_cents * (quantity - free)
+      line_prices.append((cost_cents, item.original_price_cents * quantity - cost_cents))
+      subtotal_cents += cost_cents
+
+    return line_prices, self.basket_discount_cents(subtotal_cents)
+
+
+def _enum_member(enum_type, name: Optional[str]):
+  # The member of the enum with this name or value in any case, or None if no name is given
+  if name is None:
+    return None
+  for member in enum_type:
+    if str(name).lower() in (member.name.lower(), member.value.lower()):
+      return member
+  raise Exception("'{}' is not one of: {}.".format(name, ', '.join(member.value for member in enum_type)))
+
+
+def _promotional_price_cents(price_cents: int, promotion: Promotion) -> int:
+  if promotion.discount_type == DiscountType.PERCENTAGE:
+    # The promotional price is rounded to the nearest cent, halves rounding up, as for item discounts
+    return (price_cents * (10000 - promotion.value_cents) + 5000) // 10000
+  return max(0, price_cents - promotion.value_cents)
+
+
+def _validate(promotion: Promotion) -> None:
+  # Raises an Exception for promotions that cannot be applied, naming the promotion
+  if promotion.type in (PromotionType.CATEGORY, PromotionType.SPEND_THRESHOLD):
+    if promotion.discount_type == DiscountType.PERCENTAGE:
+      if promotion.value_cents is None or not 100 <= promotion.value_cents <= 10000:
+        raise Exception("Promotion '{}' has an invalid percentage value.".format(promotion.name))
+    elif promotion.discount_type == DiscountType.FLAT:
+      if promotion.value_cents is None or promotion.value_cents < 0:
+        raise Exception("Promotion '{}' has an invalid flat value.".format(promotion.name))
+    else:
+      raise Exception("Promotion '{}' has an unknown discount type.".format(promotion.name))
+
+  if promotion.type == PromotionType.SPEND_THRESHOLD:
+    if promotion.threshold_cents is None or promotion.threshold_cents < 0:
+      raise Exception("Promotion '{}' has an invalid spend threshold.".format(promotion.name))
+  elif promotion.type == PromotionType.MULTI_BUY:
+    if not isinstance(promotion.buy, int) or not isinstance(promotion.free, int) or promotion.buy < 1 or promotion.free < 1:
+      raise Exception("Promotion '{}' must buy and get free at least 1 unit.".format(promotion.name))
+  elif promotion.type != PromotionType.CATEGORY:
+    raise Exception("Promotion '{}' has an unknown promotion type.".format(promotion.name))
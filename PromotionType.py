@@ -0,0 +1,7 @@
+from enum import Enum
+
+
+class PromotionType(Enum):
+  CATEGORY = 'Category'
+  MULTI_BUY = 'Multi-buy'
+  SPEND_THRESHOLD = 'Spend threshold'
@@ -0,0 +1,141 @@
+import io
+from typing import Dict, IO, Iterable, Iterator, Tuple
+from Transaction import Transaction
+from Item import Item
+from Discount import Discount
+
+from megamart import active_discounts, item_price_and_savings_cents, running_totals
+
+# Columns: #, item name, quantity, unit price, total discounts applied, final price
+_BLANK_COLUMNS = '{:<5} {:<30} {:<10} {:>20} '.format('', '', '', '')
+_TOTALS_RULE = _BLANK_COLUMNS + '{:>35}={:>20}'.format('=' * 31, '=' * 20)
+
+
+class ReceiptRenderer:
+  """
+  Writes the item list and receipt text of transactions to a stream, exactly as list_items and generate_receipt print them.
+  Every fixed line of the layout is formatted once, and each item line with a single precompiled format call,
+  so the time taken only grows with the number of lines.
+  """
+
+  def __init__(self):
+    self.border = '{:<5}={:<30}={:<10}={:>20}={:>35}={:>20}\n'.format('=' * 5, '=' * 30, '=' * 10, '=' * 20, '=' * 35, '=' * 20)
+    self.items_header = '{:<5} {:<30} {:<10} {:>20} {:>35} {:>20}\n'.format('#', 'ITEM NAME', 'QUANTITY', 'UNIT PRICE ($)', 'TOTAL DISCOUNTS APPLIED ($)', 'FINAL PRICE ($)')
+    self.items_totals = _TOTALS_RULE + '\n' + _BLANK_COLUMNS + '{:>35} {{:>20.2f}}\n'.format('TOTAL PRICE ($)') + _TOTALS_RULE
+
+    # Same as '{:<5} {:<30} {:<10} {:>20} {:>35.2f} {:>20.2f}', but %-formatting is quicker for the one line repeated per item
+    self._item_line = '%-5d %-30s %-10d %20s %35.2f %20.2f\n'
+    self._summary = self._summary_layout('').format
+    # Receipts of baskets that reached a spend threshold promotion show its discount before the subtotal
+    self._summary_with_discount = self._summary_layout(_BLANK_COLUMNS + '{:>35} {{:>20.2f}}\n'.format('PROMOTION DISCOUNT ($)')).format
+
+  def _summary_layout(self, discount_line: str) -> str:
+    return (
+      self.border
+      + discount_line
+      + _BLANK_COLUMNS + '{:>35} {{:>20.2f}}\n'.format('SUBTOTAL ($)')
+      + _BLANK_COLUMNS + '{:>35} {{:>20.2f}}\n'.format('FULFILMENT SURCHARGE ($)')
+      + _BLANK_COLUMNS + '{:>35} {{:>20.2f}}\n\n'.format('ROUNDING ($)')
+      + _TOTALS_RULE + '\n'
+      + _BLANK_COLUMNS + '{:>35} {{:>20.2f}}\n'.format('FINAL TOTAL ($)')
+      + _TOTALS_RULE + '\n\n'
+      + _BLANK_COLUMNS + '{:>35} {{:>20}}\n'.format('PAYMENT METHOD')
+      + _BLANK_COLUMNS + '{:>35} {{:>20.2f}}\n'.format('AMOUNT TENDERED ($)')
+      + _BLANK_COLUMNS + '{:>35} {{:>20.2f}}\n'.format('CHANGE ($)')
+      + _BLANK_COLUMNS + '{:>35} {{:>20}}\n\n'.format('# ITEMS PURCHASED')
+      + _BLANK_COLUMNS + '{:>35} {{:>20.2f}}\n'.format('MONEY SAVED WITH US ($)')
+      + self.border
+      + 'Thank you for shopping at Monash MegaMart, please come again!\n'
+      + self.border
+    )
+
+  def write_items(self, transaction: Transaction, discounts_dict: Dict[str, Discount], stream: IO[str]) -> int:
+    """Writes the item list (header and one line per transaction line) and returns the total price of the items in cents."""
+    write = stream.write
+    item_line = self._item_line
+    write(self.items_header)
+    discounts_dict = active_discounts(transaction, discounts_dict)
+
+    # Lines already priced while scanning only need to be printed, as do lines priced with promotions at checkout
+    priced_lines = None
+    if transaction.promotion_savings_cents:
+      rows = transaction.transaction_lines.rows()
+    else:
+      priced_lines = running_totals(transaction, discounts_dict)
+      rows = priced_lines.rows() if priced_lines is not None else self._price_rows(transaction, discounts_dict)
+
+    # The unit price column only depends on the item
+    unit_prices: Dict[Item, str] = {}
+    items_total_cents = 0
+    index = 0
+    for (item, quantity, line_cost_cents, line_discounts_cents) in rows:
+      index += 1
+      unit_price = unit_prices.get(item)
+      if unit_price is None:
+        unit_price = unit_prices[item] = '%.2f each' % item.original_price
+      items_total_cents += line_cost_cents
+      write(item_line % (index, item.name, quantity, unit_price, line_discounts_cents / 100, line_cost_cents / 100))
+
+    if priced_lines is not None:
+      items_total_cents = priced_lines.subtotal_cents
+    return items_total_cents
+
+  def _price_rows(self, transaction: Transaction, discounts_dict: Dict[str, Discount]) -> Iterator[Tuple[Item, int, int, int]]:
+    for transaction_line in transaction.transaction_lines:
+      item = transaction_line.item
+      quantity = transaction_line.quantity
+      final_price_cents, discounts_cents = item_price_and_savings_cents(item, discounts_dict)
+      yield item, quantity, final_price_cents * quantity, discounts_cents * quantity
+
+  def write_items_totals(self, items_total: float, stream: IO[str]) -> None:
+    stream.write(self.items_totals.format(items_total))
+
+  def write_receipt(self, transaction: Transaction, discounts_dict: Dict[str, Discount], stream: IO[str]) -> None:
+    if not transaction.finalised:
+      raise Exception('Cannot print a receipt for an unfinalised transaction.')
+
+    write = stream.write
+    write(self.border)
+    write('MONASH MEGAMART RECEIPT\n')
+    write(self.border)
+    write('Transaction time: {} {}\n'.format(transaction.date, transaction.time))
+    write('Fulfilment type: {}\n'.format(transaction.fulfilment_type.value))
+    if transaction.customer:
+      write('Customer: {}\n'.format(transaction.customer.name))
+      write('Membership #: {}\n'.format(transaction.customer.membership_number))
+    write(self.border)
+
+    write('Purchased items:\n')
+    self.write_items(transaction, discounts_dict, stream)
+    write('\n')
+
+    if transaction.promotion_discount_cents:
+      write(self._summary_with_discount(transaction.promotion_discount, *self._summary_values(transaction)))
+    else:
+      write(self._summary(*self._summary_values(transaction)))
+
+  def _summary_values(self, transaction: Transaction) -> Tuple:
+    return (
+      transaction.all_items_subtotal or 0,
+      transaction.fulfilment_surcharge_amount or 0,
+      transaction.rounding_amount_applied or 0,
+      transaction.final_total or 0,
+      transaction.payment_method.value,
+      transaction.amount_tendered or 0,
+      transaction.change_amount or 0,
+      transaction.total_items_purchased or 0,
+      transaction.amount_saved or 0,
+    )
+
+  def write_receipts(self, transactions: Iterable[Transaction], discounts_dict: Dict[str, Discount], stream: IO[str]) -> int:
+    """Writes the receipts of many transactions one after another, e.g. to reprint a day's receipts. Returns how many were written."""
+    count = 0
+    for transaction in transactions:
+      self.write_receipt(transaction, discounts_dict, stream)
+      count += 1
+    return count
+
+  def receipt(self, transaction: Transaction, discounts_dict: Dict[str, Discount]) -> str:
+    stream = io.StringIO()
+    self.write_receipt(transaction, discounts_dict, stream)
+    return stream.getvalue()
@@ -0,0 +1,51 @@
+from typing import Dict, List
+from PaymentMethod import PaymentMethod
+
+
+class ReplaySummary:
+  """Totals recomputed by replaying journaled transactions. Summaries of separate parts of a journal can be merged."""
+
+  def __init__(self):
+    self.transactions: int = 0
+    # Number of transactions whose checkout raised, by exception type name
+    self.errors: Dict[str, int] = {}
+    # Number of transactions whose recomputed final total differs from the journaled one
+    self.mismatches: int = 0
+
+    self.subtotal_cents: int = 0
+    self.surcharge_cents: int = 0
+    self.rounding_cents: int = 0
+    self.final_total_cents: int = 0
+    self.savings_cents: int = 0
+    self.items_purchased: int = 0
+
+    # Item ID -> [quantity, final cost cents, savings cents]
+    self.by_item: Dict[str, List[int]] = {}
+    # Payment method -> [number of transactions, final total cents]
+    self.by_payment_method: Dict[PaymentMethod, List[int]] = {}
+
+  def merge(self, other: 'ReplaySummary') -> 'ReplaySummary':
+    self.transactions += other.transactions
+    for (name, count) in other.errors.items():
+      self.errors[name] = self.errors.get(name, 0) + count
+    self.mismatches += other.mismatches
+
+    self.subtotal_cents += other.subtotal_cents
+    self.surcharge_cents += other.surcharge_cents
+    self.rounding_cents += other.rounding_cents
+    self.final_total_cents += other.final_total_cents
+    self.savings_cents += other.savings_cents
+    self.items_purchased += other.items_purchased
+
+    for (item_id, totals) in other.by_item.items():
+      merged = self.by_item.setdefault(item_id, [0, 0, 0])
+      for (index, value) in enumerate(totals):
+        merged[index] += value
+    for (payment_method, totals) in other.by_payment_method.items():
+      merged = self.by_payment_method.setdefault(payment_method, [0, 0])
+      for (index, value) in enumerate(totals):
+        merged[index] += value
+    return self
+
+  def __eq__(self, other: object) -> bool:
+    return isinstance(other, ReplaySummary) and vars(self) == vars(other)
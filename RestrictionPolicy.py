@@ -0,0 +1,101 @@
+import json
+from typing import Dict, Optional, Tuple
+from Item import Item
+from Customer import Customer
+from category_ids import category_id
+
+# Category -> (minimum age, whether the customer's ID must be verified)
+DEFAULT_RESTRICTIONS: Dict[str, Tuple[int, bool]] = {
+  'alcohol': (18, True),
+  'tobacco': (18, True),
+  'knives': (18, True),
+}
+
+
+class RestrictionPolicy:
+  """
+  The item categories that may only be sold to some customers: for each, the minimum age in full years and whether the customer's ID must be verified.
+  Categories are matched case-insensitively.
+
+  The restricted categories are compiled into a bitmask of category IDs when the policy is created, and every Item carries the mask of its own
+  categories, so whether an item is restricted is a single bitwise AND. The requirement for each combination of restricted categories an item
+  can have (the highest of their minimum ages, and whether any needs ID) is worked out the first time it is seen.
+  A policy is not changed once created; a new one is made to change the restrictions.
+  """
+
+  def __init__(self, restrictions: Dict[str, Tuple[int, bool]] = DEFAULT_RESTRICTIONS):
+    # Category ID -> (minimum age, ID required)
+    self._restrictions: Dict[int, Tuple[int, bool]] = {}
+    self.restricted_mask = 0
+    for (category, (minimum_age, id_required)) in restrictions.items():
+      if not isinstance(minimum_age, int) or minimum_age < 0:
+        raise Exception("Minimum age for category {} must be a whole number of years.".format(category))
+      category_bit = category_id(category)
+      self._restrictions[category_bit] = (minimum_age, bool(id_required))
+      self.restricted_mask |= 1 << category_bit
+
+    # Restricted part of an item's category mask -> requirement for it
+    self._requirements: Dict[int, Tuple[int, bool]] = {}
+
+  @classmethod
+  def load(cls, path: str) -> 'RestrictionPolicy':
+    """Loads a policy from a JSON file mapping each category to {"minimum_age": age, "id_required": true or false}."""
+    with open(path) as policy_file:
+      restrictions = json.load(policy_file)
+    try:
+      return cls({category: (rule['minimum_age'], rule.get('id_required', True)) for (category, rule) in restrictions.items()})
+    except (AttributeError, KeyError, TypeError):
+      raise Exception("Restriction policy {} must map each category to its minimum_age and id_required.".format(path))
+
+  def requirement(self, item: Item) -> Optional[Tuple[int, bool]]:
+    """The (minimum age, ID required) the customer must meet to purchase the item, or None if it is not restricted."""
+    restricted = item.category_mask & self.restricted_mask
+    if not restricted:
+      return None
+
+    requirement = self._requirements.get(restricted)
+    if requirement is None:
+      minimum_age, id_required = 0, False
+      for (category_bit, (category_age, category_id_required)) in self._restrictions.items():
+        if restricted >> category_bit & 1:
+          minimum_age = max(minimum_age, category_age)
+          id_required = id_required or category_id_required
+      requirement = self._requirements[restricted] = (minimum_age, id_required)
+    return requirement
+
+  def is_restricted(self, item: Item) -> bool:
+    return bool(item.category_mask & self.restricted_mask)
+
+  @staticmethod
+  def purchase_not_allowed(requirement: Tuple[int, bool], customer: Customer, purchase_date_string: str, purchase_date_ordinal: Optional[int]) -> bool:
+    """
+    Returns True if the customer may not purchase an item with the requirement on the purchase date, whose ordinal has already been parsed.
+    A customer account must be linked to purchase any restricted item. Raises an Exception if the purchase date, or a birth date the
+    requirement needs, is in the incorrect format.
+    """
+    minimum_age, id_required = requirement
+
+    # If purchase date is not provided
+    if not purchase_date_string:
+      return True
+
+    # Check if purchase date is in correct format
+    if purchase_date_ordinal is None:
+      raise Exception("Purchase date is in incorrect format.")
+
+    if not customer or (id_required and not customer.id_verified):
+      return True
+    if not minimum_age:
+      return False
+
+    # The customer's age cannot be worked out without a birth date
+    if not customer.date_of_birth:
+      return True
+
+    # Check if birth date is in correct format
+    eligible_from_ordinal = customer.eligible_from(minimum_age)
+    if eligible_from_ordinal is None:
+      raise Exception("Birth date is in incorrect format.")
+
+    # Check if customer is underage
+    return purchase_date_ordinal < eligible_from_ordinal
@@ -0,0 +1,56 @@
+import time
+from typing import List, Optional, Sequence, Tuple
+from Console import Console
+
+
+class ScriptedConsole(Console):
+  """
+  A console that answers the terminal's prompts from a script instead of stdin, and throws away what is printed unless asked to keep it.
+  The script is a list of (action name, answers) steps, the first answer of each step being the main menu option that starts the action.
+  The time from the start of each action to the start of the next one, or to finish(), is recorded against the action's name.
+  Like stdin, an EOFError is raised if the terminal asks for more answers than the script has.
+  """
+
+  def __init__(self, script: Sequence[Tuple[str, Sequence[str]]], keep_output: bool = False):
+    # (answer, action name if the answer starts an action, otherwise None)
+    self._answers: List[Tuple[str, Optional[str]]] = []
+    for (action, answers) in script:
+      for (index, answer) in enumerate(answers):
+        self._answers.append((answer, action if index == 0 else None))
+    self._next = 0
+
+    self._action: Optional[str] = None
+    self._action_start = 0.0
+    # (action name, seconds) of every action finished so far
+    self.timings: List[Tuple[str, float]] = []
+    self.output: Optional[List[str]] = [] if keep_output else None
+
+  def input(self, prompt: str = '') -> str:
+    if self._next == len(self._answers):
+      raise EOFError('The script has no more answers.')
+
+    answer, action = self._answers[self._next]
+    self._next += 1
+    if action is not None:
+      self.finish()
+      self._action = action
+      self._action_start = time.perf_counter()
+    return answer
+
+  def print(self, *values: object, sep: str = ' ', end: str = '\n') -> None:
+    if self.output is not None:
+      self.output.append(sep.join([str(value) for value in values]) + end)
+
+  def finish(self) -> None:
+    """Records the time taken by the action in progress, if any."""
+    if self._action is not None:
+      self.timings.append((self._action, time.perf_counter() - self._action_start))
+      self._action = None
+
+  @property
+  def finished_script(self) -> bool:
+    return self._next == len(self._answers)
+
+  @property
+  def transcript(self) -> str:
+    return ''.join(self.output or [])
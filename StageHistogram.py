@@ -0,0 +1,61 @@
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+# Upper bounds of the latency buckets in seconds, from a microsecond up to five seconds
+LATENCY_BUCKETS: Tuple[float, ...] = (
+  1e-06, 2.5e-06, 5e-06, 1e-05, 2.5e-05, 5e-05, 0.0001, 0.00025, 0.0005,
+  0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+
+class StageHistogram:
+  """
+  The number of calls to one stage and how long they took, counted into fixed latency buckets.
+  A call is counted in the first bucket whose upper bound it does not exceed, or in the last (unbounded) bucket if it exceeds them all.
+  Calls may be observed from many lanes at once.
+  """
+
+  def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+    self.bounds = bounds
+    self.bucket_counts: List[int] = [0] * (len(bounds) + 1)
+    self.count: int = 0
+    self.sum: float = 0.0
+    self._lock = threading.Lock()
+
+  def observe(self, seconds: float) -> None:
+    index = bisect_left(self.bounds, seconds)
+    with self._lock:
+      self.bucket_counts[index] += 1
+      self.count += 1
+      self.sum += seconds
+
+  def cumulative_counts(self) -> List[int]:
+    """The number of calls at or under each bound, ending with the total for the unbounded bucket, as Prometheus expects."""
+    with self._lock:
+      bucket_counts = list(self.bucket_counts)
+    return _cumulative(bucket_counts)
+
+  def to_dict(self) -> Dict[str, object]:
+    with self._lock:
+      bucket_counts, count, total_seconds = list(self.bucket_counts), self.count, self.sum
+    return {
+      'count': count,
+      'sum': total_seconds,
+      'buckets': dict(zip([repr(bound) for bound in self.bounds] + ['+Inf'], _cumulative(bucket_counts))),
+    }
+
+  def reset(self) -> None:
+    with self._lock:
+      self.bucket_counts = [0] * (len(self.bounds) + 1)
+      self.count = 0
+      self.sum = 0.0
+
+
+def _cumulative(bucket_counts: List[int]) -> List[int]:
+  counts = []
+  total = 0
+  for count in bucket_counts:
+    total += count
+    counts.append(total)
+  return counts
@@ -1,29 +1,75 @@
-from typing import List, Optional
+from typing import Dict, Iterable, Optional
 from TransactionLine import TransactionLine
+from TransactionLines import TransactionLines
 from Customer import Customer
 from FulfilmentType import FulfilmentType
 from PaymentMethod import PaymentMethod
+from date_ordinals import parse_date_ordinal
+from money import DollarsField
 
 
 class Transaction:
-  date: str = None # format: dd/mm/YYYY e.g. 01/08/2023
+  date_ordinal: Optional[int] = None # date as an ordinal, None if not provided or not in dd/mm/YYYY format
   time: str = None # format: HH:MM:SS e.g. 12:45:00
-  transaction_lines: List[TransactionLine] = []
   customer: Optional[Customer] = None
   fulfilment_type: Optional[FulfilmentType] = None
   payment_method: Optional[PaymentMethod] = None
-  amount_tendered: Optional[float] = None
+  amount_tendered = DollarsField()
   
   total_items_purchased: Optional[int] = None
-  all_items_subtotal: Optional[float] = None
-  fulfilment_surcharge_amount: Optional[float] = None
-  rounding_amount_applied: Optional[float] = None
-  final_total: Optional[float] = None
-  change_amount: Optional[float] = None
-  amount_saved: Optional[float] = None
+  all_items_subtotal = DollarsField()
+  fulfilment_surcharge_amount = DollarsField()
+  rounding_amount_applied = DollarsField()
+  final_total = DollarsField()
+  change_amount = DollarsField()
+  amount_saved = DollarsField()
+  promotion_discount = DollarsField()
+  promotion_savings = DollarsField()
+
+  # Money amounts above are kept in whole cents, and only converted to dollar floats when read
+  amount_tendered_cents: Optional[int] = None
+  all_items_subtotal_cents: Optional[int] = None
+  fulfilment_surcharge_amount_cents: Optional[int] = None
+  rounding_amount_applied_cents: Optional[int] = None
+  final_total_cents: Optional[int] = None
+  change_amount_cents: Optional[int] = None
+  amount_saved_cents: Optional[int] = None
+
+  # Set when checked out with promotions: the spend threshold discount taken off the subtotal,
+  # and how much less the lines cost with promotions than without them, including that discount. Both are part of amount_saved.
+  promotion_discount_cents: Optional[int] = None
+  promotion_savings_cents: Optional[int] = None
 
   finalised: bool = False
 
+  # Quantities of each item ID taken from stock when checked out against an Inventory
+  stock_reservation: Optional[Dict[str, int]] = None
+
+  # The version of a CatalogStore the transaction is priced with, from the first time it used the store
+  catalog_snapshot = None
+
   def __init__(self, date: str, time: str):
     self.date: str = date
     self.time: str = time
+    self._transaction_lines: TransactionLines = TransactionLines()
+
+  @property
+  def transaction_lines(self) -> TransactionLines:
+    return self._transaction_lines
+
+  @transaction_lines.setter
+  def transaction_lines(self, transaction_lines: Iterable[TransactionLine]) -> None:
+    # Replacing the lines keeps any running totals pricing that was set up for this transaction
+    pricing = self._transaction_lines
+    self._transaction_lines = TransactionLines(transaction_lines)
+    if pricing.pricer is not None:
+      self._transaction_lines.set_pricer(pricing.pricer, pricing.pricing_source, pricing.pricing_version)
+
+  @property
+  def date(self) -> str: # format: dd/mm/YYYY e.g. 01/08/2023
+    return self._date
+
+  @date.setter
+  def date(self, date: str) -> None:
+    self._date = date
+    self.date_ordinal = parse_date_ordinal(date) if date else None
@@ -0,0 +1,344 @@
+"""
+Journal file format (all integers little-endian):
+
+  b'MMJ1'                                       file header
+  then any number of records, each:
+    uint32 payload length, uint32 CRC-32 of payload, payload
+
+A payload is one finalised transaction:
+  str date, str time
+  uint8 fulfilment type, uint8 payment method     (index into the enum, 255 if not set)
+  uint8 has customer, then if set: str membership number, str name, str date of birth,
+                                   uint8 ID verified, float64 delivery distance (NaN if not set)
+  int64 subtotal, surcharge, rounding, final total, amount tendered, change, amount saved (all cents), total items purchased
+  uint32 number of lines, then per line: str item ID, uint32 quantity, int64 final cost (cents)
+
+where str is a uint16 byte length followed by UTF-8 bytes, with length 0xFFFF meaning None.
+"""
+import os
+import queue
+import struct
+import threading
+import zlib
+from typing import Iterator, List, Optional, Tuple
+from Customer import Customer
+from FulfilmentType import FulfilmentType
+from PaymentMethod import PaymentMethod
+from Transaction import Transaction
+from TransactionLine import TransactionLine
+
+MAGIC = b'MMJ1'
+_RECORD_HEADER = struct.Struct('<II')
+_TOTALS = struct.Struct('<8q')
+_LINE = struct.Struct('<Iq')
+_NONE_LENGTH = 0xFFFF
+_NOT_SET = 255
+
+_FULFILMENT_TYPES = list(FulfilmentType)
+_PAYMENT_METHODS = list(PaymentMethod)
+
+
+def _pack_str(parts: List[bytes], value: Optional[str]) -> None:
+  if value is None:
+    parts.append(struct.pack('<H', _NONE_LENGTH))
+    return
+  encoded = value.encode('utf-8')
+  parts.append(struct.pack('<H', len(encoded)))
+  parts.append(encoded)
+
+
+def _unpack_str(payload: bytes, offset: int) -> Tuple[Optional[str], int]:
+  (length,) = struct.unpack_from('<H', payload, offset)
+  offset += 2
+  if length == _NONE_LENGTH:
+    return None, offset
+  return payload[offset:offset + length].decode('utf-8'), offset + length
+
+
+def encode_transaction(transaction: Transaction) -> bytes:
+  """Encodes a finalised transaction as a journal payload."""
+  parts: List[bytes] = []
+  _pack_str(parts, transaction.date)
+  _pack_str(parts, transaction.time)
+  parts.append(struct.pack('<BB',
+    _NOT_SET if transaction.fulfilment_type is None else _FULFILMENT_TYPES.index(transaction.fulfilment_type),
+    _NOT_SET if transaction.payment_method is None else _PAYMENT_METHODS.index(transaction.payment_method)))
+
+  customer = transaction.customer
+  parts.append(struct.pack('<B', customer is not None))
+  if customer is not None:
+    _pack_str(parts, customer.membership_number)
+    _pack_str(parts, customer.name)
+    _pack_str(parts, customer.date_of_birth)
+    parts.append(struct.pack('<Bd', bool(customer.id_verified), float('nan') if customer.delivery_distance_km is None else customer.delivery_distance_km))
+
+  parts.append(_TOTALS.pack(
+    transaction.all_items_subtotal_cents or 0,
+    transaction.fulfilment_surcharge_amount_cents or 0,
+    transaction.rounding_amount_applied_cents or 0,
+    transaction.final_total_cents or 0,
+    transaction.amount_tendered_cents or 0,
+    transaction.change_amount_cents or 0,
+    transaction.amount_saved_cents or 0,
+    transaction.total_items_purchased or 0))
+
+  parts.append(struct.pack('<I', len(transaction.transaction_lines)))
+  for transaction_line in transaction.transaction_lines:
+    _pack_str(parts, transaction_line.item.id)
+    parts.append(_LINE.pack(transaction_line.quantity, transaction_line.final_cost_cents or 0))
+
+  return b''.join(parts)
+
+
+class JournalRecord:
+  """A transaction read back from the journal. Lines are (item ID, quantity, final cost in cents) tuples."""
+
+  def __init__(self):
+    self.date: Optional[str] = None
+    self.time: Optional[str] = None
+    self.fulfilment_type: Optional[FulfilmentType] = None
+    self.payment_method: Optional[PaymentMethod] = None
+    self.customer: Optional[Customer] = None
+    self.all_items_subtotal_cents: int = 0
+    self.fulfilment_surcharge_amount_cents: int = 0
+    self.rounding_amount_applied_cents: int = 0
+    self.final_total_cents: int = 0
+    self.amount_tendered_cents: int = 0
+    self.change_amount_cents: int = 0
+    self.amount_saved_cents: int = 0
+    self.total_items_purchased: int = 0
+    self.lines: List[Tuple[str, int, int]] = []
+
+  def to_transaction(self, items_dict) -> Transaction:
+    """Rebuilds an unpriced transaction with the same basket, looking its items up in the given items dictionary."""
+    transaction = Transaction(self.date, self.time)
+    transaction.customer = self.customer
+    transaction.fulfilment_type = self.fulfilment_type
+    transaction.payment_method = self.payment_method
+    transaction.transaction_lines.extend(TransactionLine(items_dict[item_id][0], quantity) for (item_id, quantity, _) in self.lines)
+    return transaction
+
+
+def decode_transaction(payload: bytes) -> JournalRecord:
+  record = JournalRecord()
+  record.date, offset = _unpack_str(payload, 0)
+  record.time, offset = _unpack_str(payload, offset)
+
+  fulfilment, payment = struct.unpack_from('<BB', payload, offset)
+  offset += 2
+  record.fulfilment_type = None if fulfilment == _NOT_SET else _FULFILMENT_TYPES[fulfilment]
+  record.payment_method = None if payment == _NOT_SET else _PAYMENT_METHODS[payment]
+
+  (has_customer,) = struct.unpack_from('<B', payload, offset)
+  offset += 1
+  if has_customer:
+    membership_number, offset = _unpack_str(payload, offset)
+    name, offset = _unpack_str(payload, offset)
+    date_of_birth, offset = _unpack_str(payload, offset)
+    id_verified, delivery_distance_km = struct.unpack_from('<Bd', payload, offset)
+    offset += 9
+    record.customer = Customer(membership_number, name, date_of_birth, bool(id_verified),
+                               None if delivery_distance_km != delivery_distance_km else delivery_distance_km)
+
+  (record.all_items_subtotal_cents, record.fulfilment_surcharge_amount_cents, record.rounding_amount_applied_cents, record.final_total_cents,
+   record.amount_tendered_cents, record.change_amount_cents, record.amount_saved_cents, record.total_items_purchased) = _TOTALS.unpack_from(payload, offset)
+  offset += _TOTALS.size
+
+  (line_count,) = struct.unpack_from('<I', payload, offset)
+  offset += 4
+  for _ in range(line_count):
+    item_id, offset = _unpack_str(payload, offset)
+    quantity, final_cost_cents = _LINE.unpack_from(payload, offset)
+    offset += _LINE.size
+    record.lines.append((item_id, quantity, final_cost_cents))
+
+  return record
+
+
+def recover(path: str) -> int:
+  """
+  Checks every record of the journal and truncates it after the last complete one, dropping a record torn by a crash.
+  Creates the journal if it does not exist. Returns the number of complete records.
+  """
+  with open(path, 'a+b') as journal_file:
+    journal_file.seek(0)
+    if journal_file.read(len(MAGIC)) != MAGIC:
+      if journal_file.seek(0, os.SEEK_END) > 0:
+        raise Exception('{} is not a transaction journal.'.format(path))
+      journal_file.write(MAGIC)
+      journal_file.flush()
+      os.fsync(journal_file.fileno())
+      return 0
+
+    count = 0
+    good_end = len(MAGIC)
+    for (offset, payload) in _scan(journal_file, len(MAGIC)):
+      count += 1
+      good_end = offset + _RECORD_HEADER.size + len(payload)
+
+    if journal_file.seek(0, os.SEEK_END) != good_end:
+      journal_file.truncate(good_end)
+      journal_file.flush()
+      os.fsync(journal_file.fileno())
+
+  return count
+
+
+def _scan(journal_file, start: int, end: Optional[int] = None, verify: bool = True) -> Iterator[Tuple[int, bytes]]:
+  # Yields (record offset, payload) for each complete record starting in [start, end), stopping at the first torn one
+  journal_file.seek(start)
+  offset = start
+  while end is None or offset < end:
+    header = journal_file.read(_RECORD_HEADER.size)
+    if len(header) < _RECORD_HEADER.size:
+      return
+    length, checksum = _RECORD_HEADER.unpack(header)
+    payload = journal_file.read(length)
+    if len(payload) < length or (verify and zlib.crc32(payload) != checksum):
+      return
+    yield offset, payload
+    offset += _RECORD_HEADER.size + length
+
+
+def read_journal(path: str, start: Optional[int] = None, end: Optional[int] = None) -> Iterator[JournalRecord]:
+  """Reads back the records of the journal, optionally only those starting at byte offsets in [start, end)."""
+  with open(path, 'rb') as journal_file:
+    if journal_file.read(len(MAGIC)) != MAGIC:
+      raise Exception('{} is not a transaction journal.'.format(path))
+    for (_, payload) in _scan(journal_file, max(start or 0, len(MAGIC)), end):
+      yield decode_transaction(payload)
+
+
+def record_offsets(path: str) -> List[int]:
+  """Returns the byte offset of every record in the journal, reading only the record headers."""
+  offsets = []
+  with open(path, 'rb') as journal_file:
+    if journal_file.read(len(MAGIC)) != MAGIC:
+      raise Exception('{} is not a transaction journal.'.format(path))
+    offset = len(MAGIC)
+    while True:
+      header = journal_file.read(_RECORD_HEADER.size)
+      if len(header) < _RECORD_HEADER.size:
+        break
+      length, _ = _RECORD_HEADER.unpack(header)
+      offsets.append(offset)
+      offset = journal_file.seek(length, os.SEEK_CUR)
+  return offsets
+
+
+class JournalWrite(threading.Event):
+  """Returned by TransactionJournal.append. Set once the transaction is durable on disk, or once writing it has failed."""
+
+  def __init__(self):
+    super().__init__()
+    # The exception raised writing the transaction, if it could not be made durable
+    self.error: Optional[Exception] = None
+
+  def wait_durable(self, timeout: Optional[float] = None) -> bool:
+    """As wait(), but raises an Exception if the transaction could not be written."""
+    if not self.wait(timeout):
+      return False
+    if self.error is not None:
+      raise Exception('Transaction could not be written to the journal: {}'.format(self.error)) from self.error
+    return True
+
+
+class TransactionJournal:
+  """
+  Append-only journal of finalised transactions.
+  append() only encodes the transaction and queues it, so it adds almost no time to checkout. A background thread writes
+  everything queued by all lanes since its last write and makes it durable with a single fsync (group commit).
+  If a write fails, nothing more is written: the transactions queued are failed, and the error is raised by every later append() and by close().
+
+  Lanes give the receipt as soon as the transaction is queued, so the journal adds no time to checkout, and a failed write is reported
+  by the lane's next append(). If durable_receipts is set, they wait for the transaction to be durable first instead, which adds the
+  time of an fsync to every checkout.
+  """
+
+  def __init__(self, path: str, max_batch: int = 1024, durable_receipts: bool = False):
+    self.path = path
+    self.max_batch = max_batch
+    self.durable_receipts = durable_receipts
+    recover(path)
+
+    self._file = open(path, 'ab')
+    self._queue: 'queue.Queue[Optional[Tuple[bytes, JournalWrite]]]' = queue.Queue()
+    # Held while queueing, so nothing is queued after close() has queued the writer's stop
+    self._lock = threading.Lock()
+    self._closed = False
+    # The first exception raised writing to the file
+    self._error: Optional[Exception] = None
+    self._writer = threading.Thread(target=self._write_loop, name='TransactionJournal writer', daemon=True)
+    self._writer.start()
+
+  def append(self, transaction: Transaction) -> JournalWrite:
+    """
+    Queues a finalised transaction. The returned JournalWrite is set once it is durable on disk, or once writing it has failed.
+    Raises an Exception if the journal is closed or an earlier write failed.
+    """
+    if transaction is None or not transaction.finalised:
+      raise Exception('Only finalised transactions can be journaled.')
+
+    payload = encode_transaction(transaction)
+    durable = JournalWrite()
+    with self._lock:
+      if self._closed:
+        raise Exception('The transaction journal {} is closed.'.format(self.path))
+      self._raise_error()
+      self._queue.put((_RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload, durable))
+    return durable
+
+  def _raise_error(self) -> None:
+    if self._error is not None:
+      raise Exception('Writing to the transaction journal {} failed: {}'.format(self.path, self._error)) from self._error
+
+  def _write_loop(self) -> None:
+    closing = False
+    while not closing:
+      batch = [self._queue.get()]
+      # Take everything else already waiting, so one fsync covers it all
+      while len(batch) < self.max_batch:
+        try:
+          batch.append(self._queue.get_nowait())
+        except queue.Empty:
+          break
+
+      if None in batch:
+        closing = True
+        batch = [entry for entry in batch if entry is not None]
+      if not batch:
+        continue
+
+      # After a failed write the file may end in a torn record, so nothing more is written until it is recovered
+      if self._error is None:
+        try:
+          self._file.write(b''.join(record for (record, _) in batch))
+          self._file.flush()
+          os.fsync(self._file.fileno())
+        except Exception as e:
+          # Any exception, not just OSError, so the writer keeps failing writes rather than dying and leaving them waiting forever
+          self._error = e
+
+      for (_, durable) in batch:
+        durable.error = self._error
+        durable.set()
+
+  def close(self) -> None:
+    """Writes out everything queued so far and closes the journal. Raises an Exception if any write failed."""
+    with self._lock:
+      if self._closed:
+        return
+      self._closed = True
+      self._queue.put(None)
+    self._writer.join()
+    try:
+      self._file.close()
+    except OSError as e:
+      self._error = self._error or e
+    self._raise_error()
+
+  def __enter__(self) -> 'TransactionJournal':
+    return self
+
+  def __exit__(self, *exc_info) -> None:
+    self.close()
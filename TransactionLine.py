@@ -1,8 +1,11 @@
 from typing import Optional
 from Item import Item
+from money import DollarsField
 
 class TransactionLine:
-  final_cost: Optional[float]
+  final_cost_cents: Optional[int] = None
+  final_cost = DollarsField()
+  savings_cents: Optional[int] = None # savings from discounts for the whole line
 
   def __init__(self, item: Item, quantity: int):
     self.item: Item = item
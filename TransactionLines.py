@@ -0,0 +1,289 @@
+from array import array
+from collections.abc import MutableSequence
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Set, Tuple, Union
+from Item import Item
+from TransactionLine import TransactionLine
+
+# Stored in the final cost and savings columns for lines that have not been priced
+_UNPRICED = -1
+
+
+class TransactionLineView(TransactionLine):
+  """
+  A transaction line read from (and written back to) a row of a TransactionLines store.
+  Views are only valid until a line before them is inserted or removed.
+  """
+
+  def __init__(self, lines: 'TransactionLines', row: int):
+    self._lines = lines
+    self._row = row
+
+  @property
+  def item(self) -> Item:
+    return self._lines._items[self._lines._item_indices[self._row]]
+
+  @item.setter
+  def item(self, item: Item) -> None:
+    self._lines[self._row] = TransactionLine(item, self.quantity)
+
+  @property
+  def quantity(self) -> int:
+    return self._lines._quantities[self._row]
+
+  @quantity.setter
+  def quantity(self, quantity: int) -> None:
+    self._lines[self._row] = TransactionLine(self.item, quantity)
+
+  @property
+  def final_cost_cents(self) -> Optional[int]:
+    final_cost_cents = self._lines._final_costs_cents[self._row]
+    return None if final_cost_cents == _UNPRICED else final_cost_cents
+
+  @final_cost_cents.setter
+  def final_cost_cents(self, final_cost_cents: Optional[int]) -> None:
+    lines = self._lines
+    lines.subtotal_cents += lines._write_price(lines._final_costs_cents, self._row, final_cost_cents)
+
+  @property
+  def savings_cents(self) -> Optional[int]:
+    savings_cents = self._lines._savings_cents[self._row]
+    return None if savings_cents == _UNPRICED else savings_cents
+
+  @savings_cents.setter
+  def savings_cents(self, savings_cents: Optional[int]) -> None:
+    lines = self._lines
+    lines.savings_cents += lines._write_price(lines._savings_cents, self._row, savings_cents)
+
+
+class TransactionLines(MutableSequence):
+  """
+  The transaction lines of a single transaction. It behaves like a list of TransactionLine objects, and keeps running totals
+  that are updated as each line is added or removed: the number of items, the quantity scanned of each item ID and,
+  once a pricer is set, the subtotal and savings in cents. A line's final cost or savings set from outside (e.g. by checkout
+  with promotions) is included in the subtotal and savings in place of the pricer's.
+  Lines are stored as parallel arrays of item index, quantity, final cost and savings rather than as one object per line.
+  Indexing returns a TransactionLineView over the row, and pop returns a standalone TransactionLine.
+  """
+
+  def __init__(self, lines: Iterable[TransactionLine] = ()):
+    # Each distinct item object is stored once, lines refer to it by its index in _items
+    self._items: List[Item] = []
+    self._item_index: Dict[Item, int] = {}
+
+    self._item_indices: array = array('l')
+    self._quantities: array = array('q')
+    self._final_costs_cents: array = array('q')
+    self._savings_cents: array = array('q')
+
+    self.total_quantity: int = 0
+    self.item_quantities: Dict[str, int] = {}
+    # The item object scanned for each item ID in item_quantities
+    self.items_by_id: Dict[str, Item] = {}
+    # Set once two different item objects have been scanned under the same item ID
+    self.mixed_items: bool = False
+
+    # Returns the (final price, per-unit savings) of an item in cents
+    self.pricer: Optional[Callable[[Item], Tuple[int, int]]] = None
+    # The discounts dictionary the pricer uses, and a version of it that the pricer's owner can use to tell if it changed
+    self.pricing_source: Optional[object] = None
+    self.pricing_version: Optional[int] = None
+    # False if there is no pricer or any line could not be priced
+    self.priced: bool = False
+    self.subtotal_cents: int = 0
+    self.savings_cents: int = 0
+
+    self.extend(lines)
+
+  def set_pricer(self, pricer: Optional[Callable[[Item], Tuple[int, int]]], source: Optional[object] = None, version: Optional[int] = None) -> None:
+    self.pricer = pricer
+    self.pricing_source = source
+    self.pricing_version = version
+    self.reprice()
+
+  def reprice(self) -> None:
+    """Prices every line again, e.g. after the discounts used by the pricer changed."""
+    self.priced = self.pricer is not None
+    self.subtotal_cents = 0
+    self.savings_cents = 0
+
+    if self.priced:
+      for row in range(len(self._quantities)):
+        self._price_row(row)
+
+  def reprice_items(self, item_ids: Set[str]) -> None:
+    """Prices the lines of the given item IDs again, e.g. after their discounts changed. Every other line keeps its price."""
+    if not self.priced:
+      # The running totals do not cover every line, so every line is priced
+      self.reprice()
+      return
+
+    item_indexes = {index for (index, item) in enumerate(self._items) if item.id in item_ids}
+    for row in range(len(self._quantities)):
+      if self._item_indices[row] in item_indexes:
+        self.subtotal_cents -= self._final_costs_cents[row]
+        self.savings_cents -= self._savings_cents[row]
+        self._price_row(row)
+        if not self.priced:
+          return
+
+  def _price_row(self, row: int) -> None:
+    try:
+      final_price_cents, savings_cents = self.pricer(self._items[self._item_indices[row]])
+    except Exception:
+      # Leave it to checkout to report the problem
+      self.priced = False
+      return
+
+    quantity = self._quantities[row]
+    self._final_costs_cents[row] = final_price_cents * quantity
+    self._savings_cents[row] = savings_cents * quantity
+    self.subtotal_cents += final_price_cents * quantity
+    self.savings_cents += savings_cents * quantity
+
+  def _write_price(self, column: array, row: int, value: Optional[int]) -> int:
+    # Writes a line's final cost or savings set from outside, e.g. by checkout with promotions, and returns how much the
+    # column's running total changes by, so the running totals stay the sums of the lines and removing a line later takes off what it added
+    previous = column[row]
+    column[row] = _UNPRICED if value is None else value
+    if not self.priced:
+      return 0
+    if value is None:
+      # The running totals no longer cover every line
+      self.priced = False
+      return 0
+    return value - previous
+
+  def write_final_costs(self, prices: Mapping[str, Tuple[int, int]]) -> Tuple[array, array, array]:
+    """
+    Sets the final cost of every line from the (final price, per-unit savings) in cents of its item ID, a whole column at a time, as checkout
+    does line by line. Every scanned item ID must be in prices. Returns the final cost column, the savings of every line (which, as in checkout,
+    are not written to the lines) and the quantity column. As for final costs set one by one from outside, the running subtotal becomes their sum.
+    """
+    # _items keeps every item ever scanned, including any whose lines have since been removed, which are not priced
+    item_prices = [prices.get(item.id, (0, 0)) for item in self._items]
+    final_prices = [final_price for (final_price, _) in item_prices]
+    unit_savings = [savings for (_, savings) in item_prices]
+    item_indices, quantities = self._item_indices, self._quantities
+    self._final_costs_cents = array('q', [final_prices[index] * quantity for (index, quantity) in zip(item_indices, quantities)])
+    savings_cents = array('q', [unit_savings[index] * quantity for (index, quantity) in zip(item_indices, quantities)])
+    if self.priced:
+      self.subtotal_cents = sum(self._final_costs_cents)
+    return self._final_costs_cents, savings_cents, quantities
+
+  def rows(self) -> Iterator[Tuple[Item, int, Optional[int], Optional[int]]]:
+    """Yields the (item, quantity, final cost cents, savings cents) of every line, read straight from the columns."""
+    items = self._items
+    for (item_index, quantity, final_cost_cents, savings_cents) in zip(self._item_indices, self._quantities, self._final_costs_cents, self._savings_cents):
+      yield (items[item_index], quantity,
+             None if final_cost_cents == _UNPRICED else final_cost_cents,
+             None if savings_cents == _UNPRICED else savings_cents)
+
+  def smallest_quantity(self) -> Optional[int]:
+    """The smallest quantity of any line, or None if there are no lines."""
+    return min(self._quantities) if self._quantities else None
+
+  def _intern_item(self, item: Item) -> int:
+    index = self._item_index.get(item)
+    if index is None:
+      index = len(self._items)
+      self._items.append(item)
+      self._item_index[item] = index
+    return index
+
+  def _write_row(self, row: int, line: TransactionLine) -> None:
+    self._item_indices[row] = self._intern_item(line.item)
+    self._quantities[row] = line.quantity
+    final_cost_cents, savings_cents = getattr(line, 'final_cost_cents', None), getattr(line, 'savings_cents', None)
+    self._final_costs_cents[row] = _UNPRICED if final_cost_cents is None else final_cost_cents
+    self._savings_cents[row] = _UNPRICED if savings_cents is None else savings_cents
+
+  def _added(self, row: int) -> None:
+    item = self._items[self._item_indices[row]]
+    quantity = self._quantities[row]
+    self.total_quantity += quantity
+    self.item_quantities[item.id] = self.item_quantities.get(item.id, 0) + quantity
+
+    scanned_item = self.items_by_id.setdefault(item.id, item)
+    if scanned_item is not item:
+      self.mixed_items = True
+
+    if self.priced:
+      self._price_row(row)
+
+  def _removed(self, row: int) -> None:
+    item = self._items[self._item_indices[row]]
+    quantity = self._quantities[row]
+    self.total_quantity -= quantity
+    self.item_quantities[item.id] -= quantity
+    if self.item_quantities[item.id] == 0:
+      del self.item_quantities[item.id]
+      del self.items_by_id[item.id]
+
+    if self.priced:
+      self.subtotal_cents -= self._final_costs_cents[row]
+      self.savings_cents -= self._savings_cents[row]
+
+  def _detach(self, row: int) -> TransactionLine:
+    line = TransactionLine(self._items[self._item_indices[row]], self._quantities[row])
+    view = TransactionLineView(self, row)
+    line.final_cost_cents, line.savings_cents = view.final_cost_cents, view.savings_cents
+    return line
+
+  def _row(self, index: int) -> int:
+    row = index + len(self) if index < 0 else index
+    if not 0 <= row < len(self):
+      raise IndexError('transaction line index out of range')
+    return row
+
+  def __len__(self) -> int:
+    return len(self._quantities)
+
+  def __getitem__(self, index: Union[int, slice]):
+    if isinstance(index, slice):
+      return [TransactionLineView(self, row) for row in range(*index.indices(len(self)))]
+    return TransactionLineView(self, self._row(index))
+
+  def __iter__(self):
+    for row in range(len(self._quantities)):
+      yield TransactionLineView(self, row)
+
+  def __setitem__(self, index: Union[int, slice], value) -> None:
+    if isinstance(index, slice):
+      # Rebuild from standalone lines, which is simplest for arbitrary slices
+      lines = [self._detach(row) for row in range(len(self))]
+      lines[index] = list(value)
+      del self[:]
+      self.extend(lines)
+      return
+
+    row = self._row(index)
+    self._removed(row)
+    self._write_row(row, value)
+    self._added(row)
+
+  def __delitem__(self, index: Union[int, slice]) -> None:
+    rows = range(*index.indices(len(self))) if isinstance(index, slice) else [self._row(index)]
+    for row in sorted(rows, reverse=True):
+      self._removed(row)
+      del self._item_indices[row]
+      del self._quantities[row]
+      del self._final_costs_cents[row]
+      del self._savings_cents[row]
+
+  def insert(self, index: int, line: TransactionLine) -> None:
+    row = max(0, min(len(self), index + len(self) if index < 0 else index))
+    self._item_indices.insert(row, 0)
+    self._quantities.insert(row, 0)
+    self._final_costs_cents.insert(row, _UNPRICED)
+    self._savings_cents.insert(row, _UNPRICED)
+    self._write_row(row, line)
+    self._added(row)
+
+  def pop(self, index: int = -1) -> TransactionLine:
+    # Removed lines are returned as standalone objects, as views over a removed row are no longer valid
+    line = self._detach(self._row(index))
+    del self[index]
+    return line
+
+  def __repr__(self) -> str:
+    return 'TransactionLines({!r})'.format([(line.item.id, line.quantity) for line in self])
@@ -0,0 +1,228 @@
+"""
+Times the checkout hot path on data from the workload generator: checkout, calculate_final_item_price, is_not_allowed_to_purchase_item,
+list_items and generate_receipt, across basket sizes, catalog sizes and ratios of restricted items. A batch of scanned baskets is also
+checked out both with checkout_batch and with checkout one at a time, and how many times faster the batch is per transaction is reported.
+
+Results are written as JSON, and compared against a stored baseline if there is one. Any case that is slower than the
+baseline by more than the threshold is reported as a regression and makes the command exit with status 1.
+
+Usage: python benchmark.py [--quick] [--output FILE] [--baseline FILE] [--save-baseline] [--threshold FRACTION]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from Item import Item
+from Customer import Customer
+from Discount import Discount
+from Inventory import Inventory
+from PriceBook import PriceBook
+from Transaction import Transaction
+from workload import generate_baskets, generate_megadata
+
+from megamart import calculate_final_item_price, checkout, checkout_batch, is_not_allowed_to_purchase_item, track_running_totals
+from megamart_base import generate_receipt, list_items, settle_payment
+
+BASKET_SIZES = [1, 10, 100, 1000]
+CATALOG_SIZES = [100, 10000, 100000]
+RESTRICTED_RATIOS = [0.0, 0.1, 0.5]
+
+QUICK_BASKET_SIZES = [1, 100]
+QUICK_CATALOG_SIZES = [100, 10000]
+QUICK_RESTRICTED_RATIOS = [0.0, 0.5]
+
+# Baskets per batch in the checkout_batch and checkout_each cases
+BATCH_SIZE = 1000
+QUICK_BATCH_SIZE = 100
+
+DEFAULT_OUTPUT = 'benchmark_results.json'
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+DEFAULT_THRESHOLD = 0.10
+
+# Customers the generated baskets are linked to
+_CUSTOMER_COUNT = 1000
+
+
+def benchmark_catalog(catalog_size: int, restricted_ratio: float, seed: int = 0) -> Tuple[Inventory, Dict[str, Customer], PriceBook]:
+  """Returns generated items, customers and discounts, with enough stock that repeated checkouts never run out."""
+  return generate_megadata(catalog_size, _CUSTOMER_COUNT, seed, restricted_ratio, stock_range=(10 ** 9, 10 ** 9))
+
+
+def benchmark_transaction(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], customers_dict: Dict[str, Customer], discounts_dict: Dict[str, Discount],
+                          basket_size: int, seed: int = 0) -> Transaction:
+  """Returns a generated basket of exactly basket_size lines, with its running totals tracked as on a lane."""
+  transaction = next(generate_baskets(items_dict, customers_dict, 1, seed, size=basket_size, member_ratio=1.0))
+  track_running_totals(transaction, discounts_dict)
+  return transaction
+
+
+def time_operation(operation: Callable[[], object], repeat: int = 5, min_seconds: float = 0.05) -> Dict[str, float]:
+  """Times an operation, calling it enough times per run to take at least min_seconds. Returns seconds per call."""
+  number = 1
+  while True:
+    start = time.perf_counter()
+    for _ in range(number):
+      operation()
+    elapsed = time.perf_counter() - start
+    if elapsed >= min_seconds:
+      break
+    number = max(number * 2, int(number * min_seconds / max(elapsed, 1e-9)))
+
+  runs = [elapsed / number]
+  for _ in range(repeat - 1):
+    start = time.perf_counter()
+    for _ in range(number):
+      operation()
+    runs.append((time.perf_counter() - start) / number)
+
+  return {'median': statistics.median(runs), 'min': min(runs), 'calls': number * repeat}
+
+
+def _checkout_each(transactions: List[Transaction], items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount]) -> None:
+  # What checkout_batch does, one checkout at a time. Failed baskets are skipped, as the batch records them and carries on.
+  for transaction in transactions:
+    try:
+      checkout(transaction, items_dict, discounts_dict)
+    except Exception:
+      pass
+
+
+def _per_item(timing: Dict[str, float], count: int) -> Dict[str, float]:
+  return {'median': timing['median'] / count, 'min': timing['min'] / count, 'calls': timing['calls'] * count}
+
+
+def run_benchmarks(basket_sizes: List[int], catalog_sizes: List[int], restricted_ratios: List[float],
+                   repeat: int = 5, min_seconds: float = 0.05, batch_size: int = BATCH_SIZE) -> Dict[str, Dict[str, float]]:
+  """Runs every benchmark case and returns seconds per call by case name. The checkout_batch and checkout_each cases are per transaction."""
+  results = {}
+  for catalog_size in catalog_sizes:
+    for restricted_ratio in restricted_ratios:
+      items_dict, customers_dict, discounts_dict = benchmark_catalog(catalog_size, restricted_ratio)
+      items = [items_dict[item_id][0] for item_id in items_dict]
+      customer = Customer('1', 'Benchmark', '01/01/1990', True, 8.5)
+      catalog = 'catalog={},restricted={}'.format(catalog_size, restricted_ratio)
+
+      # Per-item functions, cycling through every item of the catalog
+      def price_every_item():
+        for item in items:
+          calculate_final_item_price(item, discounts_dict)
+      def check_every_item():
+        for item in items:
+          is_not_allowed_to_purchase_item(item, customer, '20/07/2023')
+
+      results['calculate_final_item_price[{}]'.format(catalog)] = _per_item(time_operation(price_every_item, repeat, min_seconds), len(items))
+      results['is_not_allowed_to_purchase_item[{}]'.format(catalog)] = _per_item(time_operation(check_every_item, repeat, min_seconds), len(items))
+
+      # Baskets as scanned, without running totals, like those replayed from a journal
+      baskets = list(generate_baskets(items_dict, customers_dict, batch_size, seed=0))
+      case = 'transactions={},{}'.format(batch_size, catalog)
+      results['checkout_batch[{}]'.format(case)] = _per_item(time_operation(lambda: checkout_batch(baskets, items_dict, discounts_dict), repeat, min_seconds), batch_size)
+      results['checkout_each[{}]'.format(case)] = _per_item(time_operation(lambda: _checkout_each(baskets, items_dict, discounts_dict), repeat, min_seconds), batch_size)
+
+      for basket_size in basket_sizes:
+        case = 'basket={},{}'.format(basket_size, catalog)
+        transaction = benchmark_transaction(items_dict, customers_dict, discounts_dict, basket_size)
+        results['checkout[{}]'.format(case)] = time_operation(lambda: checkout(transaction, items_dict, discounts_dict), repeat, min_seconds)
+
+        # Item lists and receipts do not depend on the restricted ratio, so they are only timed once per catalog size
+        if restricted_ratio == restricted_ratios[0]:
+          case = 'basket={},catalog={}'.format(basket_size, catalog_size)
+          results['list_items[{}]'.format(case)] = time_operation(lambda: list_items(transaction, discounts_dict), repeat, min_seconds)
+          settle_payment(transaction, transaction.final_total)
+          results['generate_receipt[{}]'.format(case)] = time_operation(lambda: generate_receipt(transaction, discounts_dict), repeat, min_seconds)
+  return results
+
+
+def batch_speedups(results: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+  """Returns how many times faster checkout_batch is than checkout one at a time, per transaction, by checkout_batch case name."""
+  speedups = {}
+  for (case, timing) in results.items():
+    each_case = case.replace('checkout_batch[', 'checkout_each[', 1)
+    if case.startswith('checkout_batch[') and each_case in results:
+      speedups[case] = results[each_case]['min'] / timing['min']
+  return speedups
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float = DEFAULT_THRESHOLD) -> List[Tuple[str, float, float, float]]:
+  """
+  Returns (case name, baseline seconds, current seconds, ratio) for every case in both that got slower by more than the threshold.
+  The fastest run of each case is compared, as it is the least affected by whatever else the machine was doing.
+  """
+  regressions = []
+  for (case, timing) in results.items():
+    if case not in baseline:
+      continue
+    ratio = timing['min'] / baseline[case]['min']
+    if ratio > 1 + threshold:
+      regressions.append((case, baseline[case]['min'], timing['min'], ratio))
+  return regressions
+
+
+def _metadata() -> Dict[str, str]:
+  return {
+    'python': platform.python_version(),
+    'implementation': platform.python_implementation(),
+    'machine': platform.machine(),
+    'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+  }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description='Time the checkout hot path and compare against a baseline.')
+  parser.add_argument('--quick', action='store_true', help='run a smaller set of cases')
+  parser.add_argument('--output', default=DEFAULT_OUTPUT)
+  parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+  parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+  parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='slowdown that counts as a regression, e.g. 0.1 for 10%%')
+  parser.add_argument('--repeat', type=int, default=5)
+  args = parser.parse_args(argv)
+
+  if args.quick:
+    results = run_benchmarks(QUICK_BASKET_SIZES, QUICK_CATALOG_SIZES, QUICK_RESTRICTED_RATIOS, args.repeat, batch_size=QUICK_BATCH_SIZE)
+  else:
+    results = run_benchmarks(BASKET_SIZES, CATALOG_SIZES, RESTRICTED_RATIOS, args.repeat)
+
+  with open(args.output, 'w') as output_file:
+    json.dump({'metadata': _metadata(), 'results': results}, output_file, indent=2)
+
+  baseline = None
+  if os.path.exists(args.baseline) and not args.save_baseline:
+    with open(args.baseline) as baseline_file:
+      baseline = json.load(baseline_file)['results']
+
+  print('{:<75} {:>14} {:>14} {:>8}'.format('CASE', 'BASELINE (us)', 'CURRENT (us)', 'RATIO'))
+  for (case, timing) in results.items():
+    if baseline is not None and case in baseline:
+      print('{:<75} {:>14.2f} {:>14.2f} {:>8.2f}'.format(case, baseline[case]['min'] * 1e6, timing['min'] * 1e6, timing['min'] / baseline[case]['min']))
+    else:
+      print('{:<75} {:>14} {:>14.2f} {:>8}'.format(case, '-', timing['min'] * 1e6, '-'))
+
+  print('\n{:<75} {:>14}'.format('BATCH CASE', 'SPEEDUP'))
+  for (case, speedup) in batch_speedups(results).items():
+    print('{:<75} {:>13.2f}x'.format(case, speedup))
+
+  if args.save_baseline:
+    with open(args.baseline, 'w') as baseline_file:
+      json.dump({'metadata': _metadata(), 'results': results}, baseline_file, indent=2)
+    print('\nBaseline saved to {}.'.format(args.baseline))
+    return 0
+
+  if baseline is None:
+    return 0
+
+  regressions = compare(results, baseline, args.threshold)
+  if regressions:
+    print('\n{} case(s) slower than the baseline by more than {:.0%}:'.format(len(regressions), args.threshold))
+    for (case, _, _, ratio) in regressions:
+      print('  {} ({:.2f}x)'.format(case, ratio))
+    return 1
+  print('\nNo regressions against {}.'.format(args.baseline))
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,288 @@
+"""
+Loads supplier feeds of new items, price changes, stock deltas and discounts into the live catalog.
+
+A feed is a CSV file with a header row, or a JSONL file with one JSON object per line. The 'record' field of each row says what it is:
+
+  record=item      id, name, price, categories, stock, limit   Adds or replaces an item (categories separated by ';' in CSV, limit optional)
+  record=price     id, price                                   Changes an item's original price
+  record=stock     id, delta                                   Adds delta (which may be negative) to an item's stock level
+  record=discount  id, type, value                             Sets an item's discount (type 'Percentage' or 'Flat'), or removes it if value is empty
+
+Rows are read one at a time and checked against the same rules as checkout (discount values as in calculate_final_item_price,
+stock levels as in is_item_sufficiently_stocked). Rows that break them are rejected and reported, the rest are applied in batches:
+each batch of items and stock deltas is applied to the Inventory as one change, then its discounts to the discounts dictionary.
+If a CatalogStore is given as both the items and discounts dictionaries, each batch's items, stock deltas and discounts are published
+as one new version of the catalog, and transactions pinned to earlier versions keep their prices.
+A mapped catalog file (MappedCatalog) cannot be changed in place, so feeds are refused for it.
+
+Usage: python catalog_import.py FEED [FEED ...]
+"""
+import argparse
+import csv
+import json
+import time
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple, Union
+from Item import Item
+from Discount import Discount
+from DiscountType import DiscountType
+from ImportReport import ImportReport
+from Inventory import Inventory
+from CatalogStore import CatalogStore
+from MappedCatalog import MappedCatalog, MappedDiscounts
+from InsufficientStockException import InsufficientStockException
+from PriceBook import PriceBook
+
+from money import to_cents
+from megamart import _final_item_price_cents, is_item_sufficiently_stocked
+
+# Discount types by lower-case name or value, e.g. 'flat'
+_DISCOUNT_TYPES = {key.lower(): member for member in DiscountType for key in (member.name, member.value)}
+
+
+def read_feed(stream: IO[str], format: str) -> Iterator[Dict[str, Any]]:
+  """Yields the rows of a CSV or JSONL feed as dictionaries, one at a time."""
+  if format == 'csv':
+    rows = csv.reader(stream)
+    header = next(rows, [])
+    for row in rows:
+      yield dict(zip(header, row))
+  elif format == 'jsonl':
+    for line in stream:
+      if line.strip():
+        yield json.loads(line)
+  else:
+    raise Exception("Feed format must be 'csv' or 'jsonl'.")
+
+
+def _text(row: Dict[str, Any], field: str, required: bool = True) -> Optional[str]:
+  value = row.get(field)
+  value = value.strip() if isinstance(value, str) else value
+  if value is None or value == '':
+    if required:
+      raise Exception("Field '{}' is missing.".format(field))
+    return None
+  return str(value)
+
+
+def _whole_number(row: Dict[str, Any], field: str, required: bool = True) -> Optional[int]:
+  value = _text(row, field, required)
+  if value is None:
+    return None
+  try:
+    return int(value)
+  except ValueError:
+    raise Exception("Field '{}' is not a whole number.".format(field))
+
+
+def _amount(row: Dict[str, Any], field: str, required: bool = True) -> Optional[float]:
+  value = _text(row, field, required)
+  if value is None:
+    return None
+  try:
+    amount = float(value)
+  except ValueError:
+    raise Exception("Field '{}' is not a number.".format(field))
+  if amount < 0 or abs(amount * 100 - to_cents(amount)) > 1e-6:
+    raise Exception("Field '{}' cannot be negative and cannot be more than two decimal places.".format(field))
+  return amount
+
+
+class _Batch:
+  # Rows validated but not applied yet. Rows are checked against the catalog as it will be once earlier rows are applied.
+  def __init__(self, items_dict: Inventory, discounts_dict: Dict[str, Discount]):
+    self.items_dict = items_dict
+    self.discounts_dict = discounts_dict
+    # A CatalogStore given as both dictionaries, which takes the whole batch as one version. Discounts are read from its current version.
+    self.store: Optional[CatalogStore] = items_dict if isinstance(items_dict, CatalogStore) and discounts_dict is items_dict else None
+    if self.store is not None:
+      self.discounts_dict = self.store.discounts
+    # Item ID -> (item, stock level or None to keep the current one, purchase quantity limit)
+    self.items: Dict[str, Tuple[Item, Optional[int], Optional[int]]] = {}
+    self.stock_deltas: Dict[str, int] = {}
+    # Row numbers of the stock rows behind each stock delta, to report if the delta cannot be applied
+    self.stock_rows: Dict[str, List[int]] = {}
+    # Item ID -> discount, or None to remove it
+    self.discounts: Dict[str, Optional[Discount]] = {}
+    self.rows = 0
+
+  def item(self, item_id: str) -> Tuple[Item, int, Optional[int]]:
+    # The item, stock level and limit as they will be once this batch is applied
+    if item_id in self.items:
+      item, stock, limit = self.items[item_id]
+      if stock is None:
+        stock = self.items_dict[item_id][1]
+    elif item_id in self.items_dict:
+      item, stock, limit = self.items_dict[item_id]
+    else:
+      raise Exception(f"Item with code {item_id} not found")
+    return item, stock + self.stock_deltas.get(item_id, 0), limit
+
+  def discount(self, item_id: str) -> Optional[Discount]:
+    if item_id in self.discounts:
+      return self.discounts[item_id]
+    return self.discounts_dict.get(item_id)
+
+  def check_price(self, item: Item, discount: Optional[Discount]) -> None:
+    # Raises the same exception calculate_final_item_price would for this item and discount
+    _final_item_price_cents(item, {item.id: discount} if discount is not None else {})
+
+  def add(self, row: Dict[str, Any], row_number: int) -> None:
+    record = _text(row, 'record')
+    item_id = _text(row, 'id')
+
+    if record == 'item':
+      categories = row.get('categories') or []
+      if isinstance(categories, str):
+        categories = [category.strip() for category in categories.split(';') if category.strip()]
+      item = Item(item_id, _text(row, 'name'), _amount(row, 'price'), categories)
+      stock = _whole_number(row, 'stock')
+      limit = _whole_number(row, 'limit', required=False)
+      if stock < 0:
+        raise Exception("Item stock level is not zero or a positive integer.")
+      if limit is not None and limit < 1:
+        raise Exception("Purchase quantity limit is not a positive integer more than zero.")
+      self.check_price(item, self.discount(item_id))
+
+      self.items[item_id] = (item, stock, limit)
+      self.stock_deltas.pop(item_id, None)
+      self.stock_rows.pop(item_id, None)
+
+    elif record == 'price':
+      current_item, _, limit = self.item(item_id)
+      item = Item(item_id, current_item.name, _amount(row, 'price'), current_item.categories)
+      self.check_price(item, self.discount(item_id))
+
+      stock = self.items[item_id][1] if item_id in self.items else None
+      self.items[item_id] = (item, stock, limit)
+
+    elif record == 'stock':
+      item, stock, limit = self.item(item_id)
+      delta = _whole_number(row, 'delta')
+      if delta < 0 and not is_item_sufficiently_stocked(item, -delta, {item_id: (item, stock, limit)}):
+        raise InsufficientStockException(f"Insufficient stock for item {item.name}")
+
+      self.stock_deltas[item_id] = self.stock_deltas.get(item_id, 0) + delta
+      self.stock_rows.setdefault(item_id, []).append(row_number)
+
+    elif record == 'discount':
+      item, _, _ = self.item(item_id)
+      value = _amount(row, 'value', required=False)
+      if value is None:
+        discount = None
+      else:
+        discount_type = _DISCOUNT_TYPES.get(_text(row, 'type').lower())
+        if discount_type is None:
+          raise Exception("Unknown discount type.")
+        discount = Discount(discount_type, value, item_id)
+        self.check_price(item, discount)
+
+      self.discounts[item_id] = discount
+
+    else:
+      raise Exception("Unknown record type '{}'.".format(record))
+
+    self.rows += 1
+
+  def apply(self, report: ImportReport) -> None:
+    if self.store is not None:
+      self.apply_to_store(report)
+      return
+
+    try:
+      self.items_dict.apply(self.items, self.stock_deltas)
+    except InsufficientStockException:
+      # Lanes sold stock after these rows were checked, so apply the items and then each item's stock delta separately
+      self.items_dict.apply(self.items, {})
+      for (item_id, delta) in self.stock_deltas.items():
+        try:
+          self.items_dict.apply({}, {item_id: delta})
+        except InsufficientStockException as e:
+          self.reject_stock_rows(item_id, report, e)
+
+    for (item_id, discount) in self.discounts.items():
+      if discount is None:
+        self.discounts_dict.pop(item_id, None)
+      else:
+        self.discounts_dict[item_id] = discount
+    if isinstance(self.discounts_dict, PriceBook):
+      # Replaced items may have a new price, so anything priced with the old one needs pricing again
+      for item_id in self.items.keys() - self.discounts.keys():
+        self.discounts_dict.invalidate(item_id)
+
+    report.applied += self.rows
+
+  def reject_stock_rows(self, item_id: str, report: ImportReport, error: Exception) -> None:
+    # Every row behind a stock delta that could not be applied is rejected with the same error
+    for row_number in self.stock_rows[item_id]:
+      report.reject(row_number, error)
+    self.rows -= len(self.stock_rows[item_id])
+
+  def apply_to_store(self, report: ImportReport) -> None:
+    try:
+      self.store.publish(self.items, self.stock_deltas, self.discounts)
+    except InsufficientStockException:
+      # As in apply, publish the items and discounts, then apply each item's stock delta separately
+      self.store.publish(self.items, {}, self.discounts)
+      for (item_id, delta) in self.stock_deltas.items():
+        try:
+          self.store.publish(stock_deltas={item_id: delta})
+        except InsufficientStockException as e:
+          self.reject_stock_rows(item_id, report, e)
+
+    report.applied += self.rows
+
+
+def import_feed(feed: Union[str, IO[str]], items_dict: Inventory, discounts_dict: Dict[str, Discount],
+                format: Optional[str] = None, batch_size: int = 10000) -> ImportReport:
+  """
+  Reads a feed (a path, or an open text stream) and applies its rows to the items and discounts dictionaries, returning a report.
+  The format is 'csv' or 'jsonl', and is taken from the file extension if not given.
+  Only one batch of rows is held in memory at a time, however large the feed is.
+  A MappedCatalog (e.g. from load_catalog with MEGAMART_CATALOG set) cannot take new items or discounts, so an Exception is raised
+  before any row is read rather than part way through the feed.
+  """
+  if feed is None or items_dict is None or discounts_dict is None:
+    raise Exception("Feed, items dictionary or discounts dictionary not provided.")
+  if isinstance(items_dict, MappedCatalog) or isinstance(discounts_dict, MappedDiscounts):
+    raise Exception("Feeds cannot be imported into a mapped catalog file. Import them into the catalog it was written from, "
+                    "then write the file again with MappedCatalog.write_catalog.")
+
+  if isinstance(feed, str):
+    with open(feed, newline='', encoding='utf-8') as stream:
+      return import_feed(stream, items_dict, discounts_dict, format or feed.rsplit('.', 1)[-1].lower(), batch_size)
+
+  report = ImportReport()
+  start = time.perf_counter()
+  batch = _Batch(items_dict, discounts_dict)
+
+  for row in read_feed(feed, format):
+    report.rows += 1
+    try:
+      batch.add(row, report.rows)
+    except Exception as e:
+      report.reject(report.rows, e)
+
+    if batch.rows >= batch_size:
+      batch.apply(report)
+      batch = _Batch(items_dict, discounts_dict)
+
+  batch.apply(report)
+  report.seconds = time.perf_counter() - start
+  return report
+
+
+if __name__ == "__main__":
+  import megadata
+  from megamart_base import load_catalog
+
+  parser = argparse.ArgumentParser(description='Load CSV or JSONL supplier feeds into the catalog.')
+  parser.add_argument('feeds', nargs='+')
+  parser.add_argument('--batch-size', type=int, default=10000)
+  args = parser.parse_args()
+
+  items, discounts = load_catalog(megadata.items, megadata.discounts)
+  for path in args.feeds:
+    report = import_feed(path, items, discounts, batch_size=args.batch_size)
+    print('{}: {}'.format(path, report))
+    for (row_number, message) in report.errors:
+      print('  row {}: {}'.format(row_number, message))
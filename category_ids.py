@@ -0,0 +1,43 @@
+import sys
+import threading
+from typing import Dict, Iterable, Tuple
+
+# Lower-case category name -> its ID, which is also the bit it sets in a category mask
+_category_ids: Dict[str, int] = {}
+_lock = threading.Lock()
+# Categories as given -> the interned tuple of them and its category mask, shared by every item with the same categories
+_interned: Dict[Tuple[str, ...], Tuple[Tuple[str, ...], int]] = {}
+
+
+def category_id(category: str) -> int:
+  """
+  Returns the integer ID of a category, matched case-insensitively, giving it the next unused ID the first time it is seen.
+  IDs are only ever added, so a category keeps its ID for as long as the process runs.
+  """
+  name = category.lower()
+  interned = _category_ids.get(name)
+  if interned is None:
+    with _lock:
+      interned = _category_ids.setdefault(name, len(_category_ids))
+  return interned
+
+
+def category_mask(categories: Iterable[str]) -> int:
+  """Returns a bitmask with the bit of each category's ID set, so that sets of categories can be compared with a bitwise AND."""
+  mask = 0
+  for category in categories:
+    mask |= 1 << category_id(category)
+  return mask
+
+
+def intern_categories(categories: Iterable[str]) -> Tuple[Tuple[str, ...], int]:
+  """
+  Returns one shared tuple of the categories, with each name interned, and its category mask.
+  Items in the same categories get the same tuple, so a catalog only keeps one copy of each combination of categories.
+  """
+  key = tuple(categories)
+  interned = _interned.get(key)
+  if interned is None:
+    categories_tuple = tuple(sys.intern(category) for category in key)
+    interned = _interned.setdefault(categories_tuple, (categories_tuple, category_mask(categories_tuple)))
+  return interned
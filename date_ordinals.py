@@ -0,0 +1,63 @@
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Optional
+
+DATE_FORMAT = "%d/%m/%Y" # e.g. 01/08/2023
+
+
+@lru_cache(maxsize=4096)
+def parse_date_ordinal(date_string: str) -> Optional[int]:
+  """Returns the proleptic Gregorian ordinal of a dd/mm/YYYY date string, or None if it is not in that format."""
+  try:
+    return datetime.strptime(date_string, DATE_FORMAT).toordinal()
+  except (TypeError, ValueError):
+    return None
+
+
+def age_reached_ordinal(birth_date_string: str, age: int) -> Optional[int]:
+  """
+  Returns the ordinal of the first day on which someone born on the given dd/mm/YYYY date is the given age in full years,
+  or None if the birth date is not in that format.
+  Someone born on 29 February reaches their age on 1 March in non-leap years.
+  """
+  birth_ordinal = parse_date_ordinal(birth_date_string)
+  if birth_ordinal is None:
+    return None
+
+  birth_date = date.fromordinal(birth_ordinal)
+  try:
+    return birth_date.replace(year=birth_date.year + age).toordinal()
+  except ValueError:
+    return date(birth_date.year + age, 3, 1).toordinal()
+
+
+def parse_time_seconds(time_string: str) -> Optional[int]:
+  """Returns the number of seconds since midnight of a HH:MM:SS time string, or None if it is not in that format."""
+  try:
+    hours, minutes, seconds = time_string.split(':')
+  except (AttributeError, ValueError):
+    return None
+  if not all(len(part) == 2 and part.isdigit() for part in (hours, minutes, seconds)):
+    return None
+
+  hours, minutes, seconds = int(hours), int(minutes), int(seconds)
+  if hours > 23 or minutes > 59 or seconds > 59:
+    return None
+  return hours * 3600 + minutes * 60 + seconds
+
+
+def parse_timestamp(date_string: str, time_string: Optional[str] = None) -> Optional[int]:
+  """
+  Returns a dd/mm/YYYY date and optional HH:MM:SS time (midnight if not given) as a number of seconds that can be compared with others,
+  or None if either is not in that format.
+  """
+  ordinal = parse_date_ordinal(date_string)
+  if ordinal is None:
+    return None
+
+  seconds = 0
+  if time_string is not None:
+    seconds = parse_time_seconds(time_string)
+    if seconds is None:
+      return None
+  return ordinal * 86400 + seconds
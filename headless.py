@@ -0,0 +1,140 @@
+"""
+Runs scripted lane sessions through megamart_base.terminal with no console, to measure end-to-end lane throughput and latency.
+
+Each session is one generated basket: scan its items (one at a time, or all at once with the bulk scan option), link the member account
+if it has one, then check out and tender. The answers are typed into terminal's own menus and prompts by a ScriptedConsole,
+so the timings are of the real terminal code path, output formatting and all.
+
+Reports sessions per second, and the p50/p95/p99 latency of each menu action: the time from choosing the action at the main menu
+until the main menu is shown again (or the session ends, for checkout).
+
+Usage: python headless.py [--sessions N] [--items N] [--basket-size N] [--bulk] [--seed N]
+"""
+import argparse
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from Item import Item
+from Customer import Customer
+from Discount import Discount
+from FulfilmentType import FulfilmentType
+from PaymentMethod import PaymentMethod
+from Transaction import Transaction
+from ScriptedConsole import ScriptedConsole
+
+from megamart_base import terminal
+
+# Amount typed in for cash payments, which covers any generated basket
+CASH_TENDERED = '1000000'
+
+
+def session_script(transaction: Transaction, bulk: bool = False) -> List[Tuple[str, List[str]]]:
+  """The (action, answers) steps that check out the transaction's lines, customer, fulfilment type and payment method at the terminal."""
+  script = []
+  if bulk:
+    codes = ' '.join('{}x{}'.format(line.item.id, line.quantity) for line in transaction.transaction_lines)
+    script.append(('bulk_scan', ['7', '', codes, '']))
+  else:
+    answers = ['1']
+    for line in transaction.transaction_lines:
+      answers += [line.item.id, str(line.quantity)]
+    script.append(('scan', answers + ['quit']))
+
+  if transaction.customer is not None:
+    script.append(('link', ['3', transaction.customer.membership_number]))
+
+  answers = ['4', str(list(FulfilmentType).index(transaction.fulfilment_type) + 1), str(list(PaymentMethod).index(transaction.payment_method) + 1)]
+  answers.append(CASH_TENDERED if transaction.payment_method == PaymentMethod.CASH else 'Y')
+  script.append(('checkout', answers))
+  return script
+
+
+def run_session(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount], customers_dict: Dict[str, Customer],
+                script: List[Tuple[str, List[str]]], keep_output: bool = False) -> Tuple[ScriptedConsole, bool]:
+  """
+  Runs one terminal session with the script's answers, returning its console and whether it completed.
+  A session that does not complete, e.g. as checkout raised and the terminal went back to the main menu, is stopped when the script runs out.
+  """
+  console = ScriptedConsole(script, keep_output)
+  try:
+    terminal(items_dict, discounts_dict, customers_dict, console=console)
+    completed = console.finished_script
+  except EOFError:
+    completed = False
+  console.finish()
+  return console, completed
+
+
+def run_sessions(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount], customers_dict: Dict[str, Customer],
+                 transactions: Iterable[Transaction], bulk: bool = False) -> Dict[str, object]:
+  """Runs a session for every transaction, one after another, and returns the results (see summarise)."""
+  timings: Dict[str, List[float]] = {}
+  completed = 0
+  failed = 0
+
+  start = time.perf_counter()
+  for transaction in transactions:
+    console, session_completed = run_session(items_dict, discounts_dict, customers_dict, session_script(transaction, bulk))
+    if session_completed:
+      completed += 1
+    else:
+      failed += 1
+    for (action, seconds) in console.timings:
+      timings.setdefault(action, []).append(seconds)
+
+  return summarise(completed, failed, time.perf_counter() - start, timings)
+
+
+def percentile(samples: List[float], percent: float) -> float:
+  """The nearest-rank percentile of the samples, e.g. percent=95 for p95."""
+  ordered = sorted(samples)
+  rank = max(1, -(-len(ordered) * percent // 100))
+  return ordered[int(rank) - 1]
+
+
+def summarise(completed: int, failed: int, seconds: float, timings: Dict[str, List[float]]) -> Dict[str, object]:
+  """Sessions per second and per-action latency percentiles in seconds, from the sessions' action timings."""
+  return {
+    'sessions': completed,
+    'failed': failed,
+    'seconds': seconds,
+    'sessions_per_second': completed / seconds if seconds else 0.0,
+    'actions': {
+      action: {'count': len(samples), 'p50': percentile(samples, 50), 'p95': percentile(samples, 95), 'p99': percentile(samples, 99)}
+      for (action, samples) in timings.items()
+    },
+  }
+
+
+def format_results(results: Dict[str, object]) -> str:
+  lines = [
+    'Sessions completed: {} ({} failed) in {:.2f} s, {:.1f} sessions/s'.format(
+      results['sessions'], results['failed'], results['seconds'], results['sessions_per_second']),
+    '',
+    '{:<12} {:>8} {:>12} {:>12} {:>12}'.format('ACTION', 'COUNT', 'P50 (ms)', 'P95 (ms)', 'P99 (ms)'),
+  ]
+  for (action, latency) in results['actions'].items():
+    lines.append('{:<12} {:>8} {:>12.3f} {:>12.3f} {:>12.3f}'.format(
+      action, latency['count'], latency['p50'] * 1e3, latency['p95'] * 1e3, latency['p99'] * 1e3))
+  return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+  from workload import generate_baskets, generate_megadata
+
+  parser = argparse.ArgumentParser(description='Run scripted lane sessions through the terminal and report throughput and latency.')
+  parser.add_argument('--sessions', type=int, default=1000)
+  parser.add_argument('--items', type=int, default=10000, help='number of items in the generated catalog')
+  parser.add_argument('--basket-size', type=int, help='lines per basket (default: generated sizes averaging 12)')
+  parser.add_argument('--bulk', action='store_true', help='scan each basket with the bulk scan option')
+  parser.add_argument('--seed', type=int, default=0)
+  args = parser.parse_args(argv)
+
+  items_dict, customers_dict, discounts_dict = generate_megadata(args.items, 1000, args.seed, stock_range=(10 ** 9, 10 ** 9))
+  transactions = generate_baskets(items_dict, customers_dict, args.sessions, args.seed, size=args.basket_size)
+  print(format_results(run_sessions(items_dict, discounts_dict, customers_dict, transactions, args.bulk)))
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+Counts calls to each stage of checkout, and to generate_receipt, and how long they took, to tell which stage slows a lane down.
+
+  restriction      working out whether an item is restricted and whether the customer may buy it
+  limit            looking up an item's purchase quantity limit
+  stock            checking an item's stock level
+  stock_commit     taking the stock of a checked out transaction from the Inventory
+  pricing          working out an item's final price and savings
+  rounding         rounding off the subtotal
+  surcharge        working out the fulfilment surcharge
+  generate_receipt writing a receipt
+
+Instrumentation is off unless enabled. enable() swaps the functions behind each stage for timed versions of them,
+and disable() puts the originals back, so nothing is timed or counted while it is off and checkout runs exactly as it would without it.
+Counts are kept until reset(), and can be written to a file in the Prometheus text format or as JSON.
+
+Usage: python instrumentation.py [--output FILE] [--transactions N]   (checks out a generated workload and writes its metrics)
+"""
+import argparse
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from StageHistogram import StageHistogram
+from ReceiptRenderer import ReceiptRenderer
+
+import megamart
+
+# Stage -> the functions timed for it, as (module or class, function name)
+STAGES: Dict[str, List[Tuple[object, str]]] = {
+  'restriction': [(megamart, '_item_restriction'), (megamart, '_is_restricted_purchase_not_allowed')],
+  'limit': [(megamart, 'get_item_purchase_quantity_limit')],
+  'stock': [(megamart, 'is_item_sufficiently_stocked')],
+  'stock_commit': [(megamart, '_commit_stock')],
+  'pricing': [(megamart, 'item_price_and_savings_cents')],
+  'rounding': [(megamart, '_round_off_subtotal_cents')],
+  'surcharge': [(megamart, '_fulfilment_surcharge_cents')],
+  'generate_receipt': [(ReceiptRenderer, 'write_receipt')],
+}
+
+enabled = False
+histograms: Dict[str, StageHistogram] = {stage: StageHistogram() for stage in STAGES}
+
+# (owner, function name, original function) of every function swapped while enabled
+_originals: List[Tuple[object, str, Callable]] = []
+_lock = threading.Lock()
+
+
+def _timed(function: Callable, histogram: StageHistogram) -> Callable:
+  perf_counter = time.perf_counter
+  observe = histogram.observe
+
+  @functools.wraps(function)
+  def timed(*args, **kwargs):
+    start = perf_counter()
+    try:
+      return function(*args, **kwargs)
+    finally:
+      observe(perf_counter() - start)
+  return timed
+
+
+def enable() -> None:
+  """Starts timing every stage. Does nothing if already enabled."""
+  global enabled
+  with _lock:
+    if enabled:
+      return
+    for (stage, functions) in STAGES.items():
+      for (owner, name) in functions:
+        function = getattr(owner, name)
+        _originals.append((owner, name, function))
+        setattr(owner, name, _timed(function, histograms[stage]))
+    enabled = True
+
+
+def disable() -> None:
+  """Stops timing and puts back the original functions. Counts so far are kept."""
+  global enabled
+  with _lock:
+    while _originals:
+      owner, name, function = _originals.pop()
+      setattr(owner, name, function)
+    enabled = False
+
+
+def reset() -> None:
+  for histogram in histograms.values():
+    histogram.reset()
+
+
+def metrics() -> Dict[str, Dict[str, object]]:
+  """The call count, total seconds and cumulative bucket counts of every stage, by stage."""
+  return {stage: histogram.to_dict() for (stage, histogram) in histograms.items()}
+
+
+def format_prometheus() -> str:
+  lines = [
+    '# HELP megamart_stage_seconds Time spent in each stage of checkout and receipt generation.',
+    '# TYPE megamart_stage_seconds histogram',
+  ]
+  for (stage, values) in metrics().items():
+    for (bound, count) in values['buckets'].items():
+      lines.append('megamart_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(stage, bound, count))
+    lines.append('megamart_stage_seconds_sum{{stage="{}"}} {!r}'.format(stage, values['sum']))
+    lines.append('megamart_stage_seconds_count{{stage="{}"}} {}'.format(stage, values['count']))
+  return '\n'.join(lines) + '\n'
+
+
+def format_json() -> str:
+  return json.dumps({'time': time.time(), 'enabled': enabled, 'stages': metrics()}, indent=2)
+
+
+def write_metrics(path: str, format: Optional[str] = None) -> None:
+  """
+  Writes the metrics to a file, as 'prometheus' text or 'json'. The format is 'json' for paths ending in .json and 'prometheus' otherwise.
+  The file is replaced in one step, so a scraper never reads it half written.
+  """
+  if format is None:
+    format = 'json' if path.lower().endswith('.json') else 'prometheus'
+  if format == 'prometheus':
+    text = format_prometheus()
+  elif format == 'json':
+    text = format_json()
+  else:
+    raise Exception("Metrics format must be 'prometheus' or 'json'.")
+
+  temporary_path = path + '.tmp'
+  with open(temporary_path, 'w') as metrics_file:
+    metrics_file.write(text)
+  os.replace(temporary_path, path)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+  from megamart import checkout, track_running_totals
+  from megamart_base import generate_receipt, settle_payment
+  from workload import generate_baskets, generate_megadata
+
+  parser = argparse.ArgumentParser(description='Check out a generated workload with instrumentation enabled and write its metrics.')
+  parser.add_argument('--output', default='megamart_metrics.prom', help='metrics file, written as JSON if it ends in .json')
+  parser.add_argument('--transactions', type=int, default=1000)
+  parser.add_argument('--seed', type=int, default=0)
+  args = parser.parse_args(argv)
+
+  items_dict, customers_dict, discounts_dict = generate_megadata(10000, 1000, args.seed, stock_range=(10 ** 9, 10 ** 9))
+  enable()
+  try:
+    for transaction in generate_baskets(items_dict, customers_dict, args.transactions, args.seed):
+      track_running_totals(transaction, discounts_dict)
+      try:
+        checkout(transaction, items_dict, discounts_dict)
+      except Exception:
+        continue
+      settle_payment(transaction, transaction.final_total)
+      generate_receipt(transaction, discounts_dict)
+  finally:
+    disable()
+
+  write_metrics(args.output)
+  print('{:<20} {:>10} {:>14}'.format('STAGE', 'CALLS', 'MEAN (us)'))
+  for (stage, values) in metrics().items():
+    mean = values['sum'] / values['count'] * 1e6 if values['count'] else 0.0
+    print('{:<20} {:>10} {:>14.2f}'.format(stage, values['count'], mean))
+  print('\nMetrics written to {}.'.format(args.output))
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Runs many simulated lanes at once, each checking out generated baskets with the real checkout and generate_receipt,
+and reports throughput and latency percentiles as the number of lanes rises, to find where lanes stop scaling.
+
+Lanes run as threads or as processes:
+
+  thread   All lanes share one items dictionary (an Inventory) and one discounts dictionary (a PriceBook), as lanes served
+           by megamart_server do, so contention on stock and prices shows up in the results.
+  process  Each lane is a separate process with its own copy of the same generated catalog, which shows how far
+           checkout itself scales across cores when nothing is shared.
+
+Every lane's baskets are generated before the clock starts, and all lanes start together. Baskets have their running totals
+tracked, as they would after scanning at a lane. Efficiency is throughput divided by what the lanes would manage if each ran
+as fast as a single lane.
+
+Usage: python loadtest.py [--lanes 1,2,4,8] [--mode thread|process] [--transactions N] [--items N] [--basket-size N] [--output FILE]
+"""
+import argparse
+import json
+import multiprocessing
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from Item import Item
+from Customer import Customer
+from Discount import Discount
+from Transaction import Transaction
+from workload import generate_baskets, generate_megadata
+
+from headless import percentile
+from megamart import checkout, track_running_totals
+from megamart_base import generate_receipt, settle_payment
+
+DEFAULT_LANES = [1, 2, 4, 8]
+_CUSTOMER_COUNT = 1000
+
+# (checkout seconds, receipt seconds, number of failed checkouts) of one lane
+LaneResult = Tuple[List[float], List[float], int]
+
+
+def lane_baskets(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], customers_dict: Dict[str, Customer], discounts_dict: Dict[str, Discount],
+                 transactions: int, seed: int, lane: int, basket_size: Optional[int] = None) -> List[Transaction]:
+  """The baskets a lane checks out. Each lane gets different baskets from the same seed."""
+  baskets = list(generate_baskets(items_dict, customers_dict, transactions, seed * 1000 + lane, size=basket_size))
+  for transaction in baskets:
+    track_running_totals(transaction, discounts_dict)
+  return baskets
+
+
+def run_lane(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount], baskets: List[Transaction],
+             start) -> LaneResult:
+  """Checks out every basket and prints its receipt once start (a barrier) is passed, timing each checkout and receipt."""
+  perf_counter = time.perf_counter
+  checkout_seconds = []
+  receipt_seconds = []
+  errors = 0
+
+  start.wait()
+  for transaction in baskets:
+    started = perf_counter()
+    try:
+      checkout(transaction, items_dict, discounts_dict)
+    except Exception:
+      errors += 1
+      continue
+    checked_out = perf_counter()
+    settle_payment(transaction, transaction.final_total)
+    generate_receipt(transaction, discounts_dict)
+    checkout_seconds.append(checked_out - started)
+    receipt_seconds.append(perf_counter() - checked_out)
+
+  return checkout_seconds, receipt_seconds, errors
+
+
+def _catalog(catalog_size: int, seed: int):
+  return generate_megadata(catalog_size, _CUSTOMER_COUNT, seed, stock_range=(10 ** 9, 10 ** 9))
+
+
+def _run_threads(lanes: int, transactions: int, catalog_size: int, basket_size: Optional[int], seed: int) -> Tuple[List[LaneResult], float]:
+  items_dict, customers_dict, discounts_dict = _catalog(catalog_size, seed)
+  baskets = [lane_baskets(items_dict, customers_dict, discounts_dict, transactions, seed, lane, basket_size) for lane in range(lanes)]
+
+  start = threading.Barrier(lanes + 1)
+  results: List[LaneResult] = [None] * lanes
+
+  def lane_thread(lane: int) -> None:
+    results[lane] = run_lane(items_dict, discounts_dict, baskets[lane], start)
+
+  threads = [threading.Thread(target=lane_thread, args=(lane,)) for lane in range(lanes)]
+  for thread in threads:
+    thread.start()
+  start.wait()
+  started = time.perf_counter()
+  for thread in threads:
+    thread.join()
+  return results, time.perf_counter() - started
+
+
+def _lane_process(lane: int, transactions: int, catalog_size: int, basket_size: Optional[int], seed: int, start, results) -> None:
+  items_dict, customers_dict, discounts_dict = _catalog(catalog_size, seed)
+  baskets = lane_baskets(items_dict, customers_dict, discounts_dict, transactions, seed, lane, basket_size)
+  results.put(run_lane(items_dict, discounts_dict, baskets, start))
+
+
+def _run_processes(lanes: int, transactions: int, catalog_size: int, basket_size: Optional[int], seed: int) -> Tuple[List[LaneResult], float]:
+  start = multiprocessing.Barrier(lanes + 1)
+  queue = multiprocessing.Queue()
+  processes = [multiprocessing.Process(target=_lane_process, args=(lane, transactions, catalog_size, basket_size, seed, start, queue))
+               for lane in range(lanes)]
+  for process in processes:
+    process.start()
+  start.wait()
+  started = time.perf_counter()
+  results = [queue.get() for _ in processes]
+  elapsed = time.perf_counter() - started
+  for process in processes:
+    process.join()
+  return results, elapsed
+
+
+def _latency(samples: List[float]) -> Dict[str, float]:
+  if not samples:
+    return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+  return {'p50': percentile(samples, 50), 'p95': percentile(samples, 95), 'p99': percentile(samples, 99)}
+
+
+def run_load(lanes: int, mode: str = 'thread', transactions: int = 200, catalog_size: int = 10000,
+             basket_size: Optional[int] = None, seed: int = 0) -> Dict[str, object]:
+  """Runs the given number of lanes, each checking out the given number of transactions, and returns the throughput and latencies in seconds."""
+  if mode == 'thread':
+    results, seconds = _run_threads(lanes, transactions, catalog_size, basket_size, seed)
+  elif mode == 'process':
+    results, seconds = _run_processes(lanes, transactions, catalog_size, basket_size, seed)
+  else:
+    raise Exception("Lane mode must be 'thread' or 'process'.")
+
+  checkout_seconds = [seconds for result in results for seconds in result[0]]
+  receipt_seconds = [seconds for result in results for seconds in result[1]]
+  return {
+    'lanes': lanes,
+    'mode': mode,
+    'transactions': len(checkout_seconds),
+    'errors': sum(result[2] for result in results),
+    'seconds': seconds,
+    'throughput': len(checkout_seconds) / seconds if seconds else 0.0,
+    'checkout': _latency(checkout_seconds),
+    'receipt': _latency(receipt_seconds),
+  }
+
+
+def sweep(lane_counts: List[int], mode: str = 'thread', transactions: int = 200, catalog_size: int = 10000,
+          basket_size: Optional[int] = None, seed: int = 0) -> List[Dict[str, object]]:
+  """Runs the load at each lane count in turn, adding each run's efficiency relative to the first."""
+  runs = []
+  for lanes in lane_counts:
+    run = run_load(lanes, mode, transactions, catalog_size, basket_size, seed)
+    first = runs[0] if runs else run
+    single_lane_throughput = first['throughput'] / first['lanes']
+    run['efficiency'] = run['throughput'] / (single_lane_throughput * lanes) if single_lane_throughput else 0.0
+    runs.append(run)
+  return runs
+
+
+def format_runs(runs: List[Dict[str, object]]) -> str:
+  lines = ['{:>5} {:>8} {:>8} {:>10} {:>6}   {:>26}   {:>26}'.format('LANES', 'TXNS', 'ERRORS', 'TXN/S', 'EFF', 'CHECKOUT p50/p95/p99 (ms)', 'RECEIPT p50/p95/p99 (ms)')]
+  for run in runs:
+    latencies = []
+    for stage in ('checkout', 'receipt'):
+      latencies.append('{:>8.3f} {:>8.3f} {:>8.3f}'.format(run[stage]['p50'] * 1e3, run[stage]['p95'] * 1e3, run[stage]['p99'] * 1e3))
+    lines.append('{:>5} {:>8} {:>8} {:>10.1f} {:>6.2f}   {}   {}'.format(
+      run['lanes'], run['transactions'], run['errors'], run['throughput'], run['efficiency'], latencies[0], latencies[1]))
+  return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description='Check out generated baskets on many lanes at once and report how throughput and latency scale.')
+  parser.add_argument('--lanes', default=','.join(str(lanes) for lanes in DEFAULT_LANES), help='comma separated lane counts to run, e.g. 1,2,4,8')
+  parser.add_argument('--mode', choices=['thread', 'process'], default='thread')
+  parser.add_argument('--transactions', type=int, default=200, help='transactions checked out by each lane')
+  parser.add_argument('--items', type=int, default=10000, help='number of items in the generated catalog')
+  parser.add_argument('--basket-size', type=int, help='lines per basket (default: generated sizes averaging 12)')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--output', help='also write the results to this JSON file')
+  args = parser.parse_args(argv)
+
+  lane_counts = [int(lanes) for lanes in args.lanes.split(',')]
+  runs = sweep(lane_counts, args.mode, args.transactions, args.items, args.basket_size, args.seed)
+  print('Mode: {}, {} CPU(s)\n'.format(args.mode, multiprocessing.cpu_count()))
+  print(format_runs(runs))
+
+  if args.output:
+    with open(args.output, 'w') as output_file:
+      json.dump(runs, output_file, indent=2)
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -1,5 +1,12 @@
+import os
 import megadata  
 import megamart_base
+from PromotionEngine import PromotionEngine
+from TransactionJournal import TransactionJournal
     
 if __name__ == "__main__":
-  megamart_base.terminal(megadata.items, megadata.discounts, megadata.customers)
+  with TransactionJournal('transactions.journal') as journal:
+    items, discounts = megamart_base.load_catalog(megadata.items, megadata.discounts)
+    # Promotions to check out with, from the JSON file MEGAMART_PROMOTIONS if set (see PromotionEngine.load)
+    promotions = PromotionEngine.load(os.environ['MEGAMART_PROMOTIONS']) if os.environ.get('MEGAMART_PROMOTIONS') else None
+    megamart_base.terminal(items, discounts, megadata.customers, journal, promotions=promotions)
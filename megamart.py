@@ -1,5 +1,6 @@
-from datetime import datetime
-from typing import Dict, Tuple, Optional
+import sys
+from array import array
+from typing import Dict, List, Set, Tuple, Optional
 from DiscountType import DiscountType
 from PaymentMethod import PaymentMethod
 from FulfilmentType import FulfilmentType
@@ -8,6 +9,16 @@ from Transaction import Transaction
 from Item import Item
 from Customer import Customer
 from Discount import Discount
+from BatchCheckoutResult import BatchCheckoutResult
+from PriceBook import PriceBook
+from Inventory import Inventory
+from TransactionLines import TransactionLines
+from PromotionEngine import PromotionEngine
+from DiscountSchedule import DiscountSchedule
+from CatalogStore import CatalogStore
+from RestrictionPolicy import RestrictionPolicy
+from date_ordinals import parse_date_ordinal
+from money import to_cents, from_cents
 
 from RestrictedItemException import RestrictedItemException
 from PurchaseLimitExceededException import PurchaseLimitExceededException
@@ -15,6 +26,13 @@ from InsufficientStockException import InsufficientStockException
 from FulfilmentException import FulfilmentException
 from InsufficientFundsException import InsufficientFundsException
 
+# The restricted categories, their minimum ages and whether they need ID. Replace it, e.g. with RestrictionPolicy.load, to change the restrictions.
+restriction_policy = RestrictionPolicy()
+
+# A transaction checked out column-wise by checkout_batch that has not taken its stock yet: its index in the batch, the transaction,
+# its purchased quantities, subtotal, savings, number of items and surcharge in cents, and its final cost, savings and quantity columns
+_BatchRunEntry = Tuple[int, Transaction, Dict[str, int], int, int, int, int, array, array, array]
+
 # You are to complete the implementation for the eight methods below:
 #### START
 
@@ -25,6 +43,8 @@ def is_not_allowed_to_purchase_item(item: Item, customer: Customer, purchase_dat
     In all cases, if an item object was not actually provided, an Exception should be raised.
 
     Items that are under the alcohol, tobacco or knives category may only be sold to customers who are aged 18+ and have their ID verified.
+    (These are the restrictions of the default restriction_policy; a different policy may restrict other categories, with other minimum ages,
+    with or without ID verification. An item in several restricted categories must meet the highest minimum age of them.)
     An item potentially belongs to many categories - as long as it belongs to at least one of the three categories above, restrictions apply to that item.
     The checking of an item's categories against restricted categories should be done in a case-insensitive manner.
     For example, if an item A is in the category ['Alcohol'] and item B is in the category ['ALCOHOL'], both items A and B should be identified as restricted items.
@@ -51,38 +71,26 @@ def is_not_allowed_to_purchase_item(item: Item, customer: Customer, purchase_dat
     if item is None:
         raise Exception("Item object not provided.")
 
-    # Check if item is in the restricted category
-    restricted_cat = ["alcohol", "tobacco", "knives"]
-    is_item_restricted = any(category.lower() in restricted_cat for category in item.categories)
+    restriction = _item_restriction(item)
+    if restriction is not None:
+        # parse_date_ordinal remembers recently parsed dates, so repeated checks on the same day do not parse again
+        purchase_date_ordinal = parse_date_ordinal(purchase_date_string) if purchase_date_string else None
+        return _is_restricted_purchase_not_allowed(customer, purchase_date_string, purchase_date_ordinal, restriction)
+    return False
 
-    if is_item_restricted:
-        # If purchase date is not provided
-        if not purchase_date_string:
-            return True
 
-        # Check if purchase date is in correct format
-        try:
-            purchasedate = datetime.strptime(purchase_date_string, "%d/%m/%Y")
-        except ValueError:
-            raise Exception("Purchase date is in incorrect format.")
+def _is_restricted_purchase_not_allowed(customer: Customer, purchase_date_string: str, purchase_date_ordinal: Optional[int],
+                                        restriction: Tuple[int, bool]) -> bool:
+    return restriction_policy.purchase_not_allowed(restriction, customer, purchase_date_string, purchase_date_ordinal)
 
-        # If customer is not provided or birth date is not provided or ID not verified
-        if not customer or not customer.date_of_birth or not customer.id_verified:
-            return True
 
-        # Check if birth date is in correct format and calculate age
-        try:
-            birthdate = datetime.strptime(customer.date_of_birth, "%d/%m/%Y")
-            age = purchasedate.year - birthdate.year - ((purchasedate.month, purchasedate.day) < (birthdate.month, birthdate.day))
-        except ValueError:
-            raise Exception("Birth date is in incorrect format.")
+def _item_restriction(item: Item) -> Optional[Tuple[int, bool]]:
+    # The (minimum age, ID required) of a restricted item, or None. One bitwise AND of the item's categories against the policy's.
+    return restriction_policy.requirement(item)
 
-        # Check if customer is underage
-        if age < 18:
-            return True
 
-        return False
-    return False
+def _is_restricted_item(item: Item) -> bool:
+    return restriction_policy.is_restricted(item)
 
 
 def get_item_purchase_quantity_limit(item: Item, items_dict: Dict[str, Tuple[Item, int, Optional[int]]]) -> Optional[int]:
@@ -159,9 +167,12 @@ def calculate_final_item_price(item: Item, discounts_dict: Dict[str, Discount])
  # Check if item object and discounts dictionary are provided
     if item is None or discounts_dict is None:
         raise Exception("Item object or discounts dictionary not provided.")
-        
+
+    return from_cents(_final_item_price_cents(item, discounts_dict))
+
+def _final_item_price_cents(item: Item, discounts_dict: Dict[str, Discount]) -> int:
     # Initialize the final price with the original price
-    final_price = item.original_price
+    final_price_cents = item.original_price_cents
 
     # Check if there is a discount for the item
     if item.id in discounts_dict:
@@ -171,20 +182,22 @@ def calculate_final_item_price(item: Item, discounts_dict: Dict[str, Discount])
 
         # Apply the discount
         if discount.type == DiscountType.PERCENTAGE:
-            # Check if discount value is within the valid range
-            if 1 <= discount.value <= 100:
-                final_price -= final_price * (discount.value / 100)
+            # Check if discount value (in hundredths of a percent) is within the valid range
+            if 100 <= discount.value_cents <= 10000:
+                # Round the discounted price to the nearest cent, halves always rounding up. round(final_price, 2) on floats did this only
+                # when the float happened to land above the half cent, e.g. it gave 22.45 for 44.91 at 50%, where this gives 22.46.
+                final_price_cents = (final_price_cents * (10000 - discount.value_cents) + 5000) // 10000
             else:
                 raise Exception("Invalid percentage value for discount.")
         elif discount.type == DiscountType.FLAT:
             # Check if the discount makes the price negative or greater than original
-            if discount.value < 0 or discount.value > final_price:
+            if discount.value_cents < 0 or discount.value_cents > final_price_cents:
                 raise Exception("Invalid flat discount value. Final price would be negative or greater than original price.")
-            final_price -= discount.value
+            final_price_cents -= discount.value_cents
         else:
             raise Exception("Unknown discount type.")
-    
-    return round(final_price, 2)  # Rounding to 2 decimal places
+
+    return final_price_cents
 
 def calculate_item_savings(item_original_price: float, item_final_price: float) -> float:
     """
@@ -196,16 +209,44 @@ def calculate_item_savings(item_original_price: float, item_final_price: float)
     if item_original_price is None or item_final_price is None:
         raise Exception("Item's original price or final price was not provided.")
     
-    # Round the input prices
-    item_original_price = round(item_original_price, 2)
-    item_final_price = round(item_final_price, 2)
-    
+    # Convert the input prices to whole cents
+    return from_cents(_item_savings_cents(to_cents(item_original_price), to_cents(item_final_price)))
+
+def _item_savings_cents(item_original_price_cents: int, item_final_price_cents: int) -> int:
     # Check if the final price of the item is greater than its original price
-    if item_final_price > item_original_price:
+    if item_final_price_cents > item_original_price_cents:
         raise Exception("The final price of the item is greater than its original price.")
-    
+
     # Calculate and return the savings
-    return round(item_original_price - item_final_price, 2)
+    return item_original_price_cents - item_final_price_cents
+
+def item_price_and_savings(item: Item, discounts_dict: Dict[str, Discount]) -> Tuple[float, float]:
+    """
+    Returns the final price and per-unit savings of an item, as calculated by calculate_final_item_price and calculate_item_savings.
+    If the discounts dictionary is a PriceBook, the values are only calculated the first time and read back from it afterwards.
+    """
+    final_price_cents, savings_cents = item_price_and_savings_cents(item, discounts_dict)
+    return from_cents(final_price_cents), from_cents(savings_cents)
+
+def item_price_and_savings_cents(item: Item, discounts_dict: Dict[str, Discount]) -> Tuple[int, int]:
+    """
+    Same as item_price_and_savings, but returns the final price and per-unit savings in whole cents.
+    """
+    if item is None or discounts_dict is None:
+        raise Exception("Item object or discounts dictionary not provided.")
+
+    if isinstance(discounts_dict, PriceBook):
+        cached = discounts_dict.cached_price(item)
+        if cached is not None:
+            return cached
+
+    final_price_cents = _final_item_price_cents(item, discounts_dict)
+    savings_cents = _item_savings_cents(item.original_price_cents, final_price_cents)
+
+    if isinstance(discounts_dict, PriceBook):
+        discounts_dict.store_price(item, final_price_cents, savings_cents)
+
+    return final_price_cents, savings_cents
 
 def calculate_fulfilment_surcharge(fulfilment_type: FulfilmentType, customer: Customer) -> float:
     """
@@ -216,13 +257,16 @@ def calculate_fulfilment_surcharge(fulfilment_type: FulfilmentType, customer: Cu
     Delivery fulfilment type can only be used if the customer has linked their member account to the transaction, and if delivery distance is specified in their member profile.
     Otherwise, a FulfilmentException should be raised.
     """
+    return from_cents(_fulfilment_surcharge_cents(fulfilment_type, customer))
+
+def _fulfilment_surcharge_cents(fulfilment_type: FulfilmentType, customer: Customer) -> int:
    # Check if fulfilment type is provided
     if fulfilment_type is None:
         raise Exception("Fulfilment type not provided.")
     
     # If the fulfilment type is PICKUP
     if fulfilment_type == FulfilmentType.PICKUP:
-        return 0.0
+        return 0
     
     # If the fulfilment type is DELIVERY
     if fulfilment_type == FulfilmentType.DELIVERY:
@@ -231,11 +275,9 @@ def calculate_fulfilment_surcharge(fulfilment_type: FulfilmentType, customer: Cu
         if customer is None or customer.delivery_distance_km is None or customer.delivery_distance_km == 0:
             raise FulfilmentException("Delivery not possible. Customer or delivery distance information is missing.")
         
-        # Calculate surcharge
-        distance_based_surcharge = customer.delivery_distance_km * 0.50
-        surcharge = max(5.0, distance_based_surcharge)
-        
-        return round(surcharge, 2)  # Rounding to 2 decimal places
+        # Calculate surcharge, 50 cents per kilometre rounded to the nearest cent
+        distance_based_surcharge_cents = to_cents(customer.delivery_distance_km * 0.50)
+        return max(500, distance_based_surcharge_cents)
 
 ######## Second
 
@@ -252,29 +294,26 @@ def round_off_subtotal(subtotal: float, payment_method: PaymentMethod) -> float:
     if subtotal is None or payment_method is None:
         raise Exception("Both subtotal and payment method must be provided.")
     
-    # Round off the subtotal to two decimal places initially
-    subtotal = round(subtotal, 2)
-    
+    # Round off the subtotal to whole cents initially
+    return from_cents(_round_off_subtotal_cents(to_cents(subtotal), payment_method))
+
+def _round_off_subtotal_cents(cents: int, payment_method: PaymentMethod) -> int:
     if payment_method != PaymentMethod.CASH:
-        return subtotal
-    
-    # Convert the subtotal to cents to make it easier to work with
-    cents = int(subtotal * 100)
+        return cents
     
     # Find the remainder when dividing by 5
     rem = cents % 5
     
     # Apply the rounding rules
-    if rem in [1, 2, 6, 7]:
+    if rem in [1, 2]:
         cents -= rem
-    elif rem in [3, 4, 8, 9]:
+    elif rem in [3, 4]:
         cents += (5 - rem)
     
-    # Convert the subtotal back to dollars and cents
-    new_subtotal = cents / 100.0
-    return round(new_subtotal, 2)
+    return cents
 
-def checkout(transaction: Transaction, items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount]) -> Transaction:
+def checkout(transaction: Transaction, items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount],
+             promotions: Optional[PromotionEngine] = None) -> Transaction:
     """
     This method will need to utilise all of the seven methods above.
     As part of the checkout process, each of the transaction lines in the transaction should be processed.
@@ -286,72 +325,533 @@ def checkout(transaction: Transaction, items_dict: Dict[str, Tuple[Item, int, Op
     All of the transaction lines will need to be processed in order to calculate its respective final price after applicable discounts have been applied.
     The subtotal, surcharge and rounding amounts, as well as final total, total savings from discounts and total number of items purchased also need to be calculated for the transaction.
     Once the calculations are completed, the updated transaction object should be returned.
+    If a PromotionEngine is given, lines are priced with its promotions as well, and any spend threshold discount is taken off the subtotal.
+    If the discounts dictionary is a DiscountSchedule, the discounts valid at the transaction's date and time are used.
+    If the items or discounts dictionary is a CatalogStore, the version of it the transaction is pinned to is used.
     """
     # Validate inputs
     if transaction is None or items_dict is None or discounts_dict is None:
         raise Exception("Transaction object, items dictionary, or discounts dictionary not provided")
-        
+
+    items_dict = pinned_items(transaction, items_dict)
+    # Stock taken by an earlier checkout of this transaction is put back before checking it out again
+    release_stock(transaction, items_dict)
+    discounts_dict = active_discounts(transaction, discounts_dict)
+
+    # Use the running totals kept while scanning if they were priced against these discounts, and there are no promotions to apply
+    transaction_lines = running_totals(transaction, discounts_dict) if promotions is None else None
+    if transaction_lines is not None and _checkout_from_running_totals(transaction, transaction_lines, items_dict):
+        return transaction
+
+    return _checkout_transaction(transaction, items_dict, discounts_dict, {}, {}, promotions=promotions)
+
+
+def active_discounts(transaction: Transaction, discounts_dict: Dict[str, Discount]) -> Dict[str, Discount]:
+    """
+    Returns the discounts valid at the transaction's date and time if the discounts dictionary is a DiscountSchedule,
+    the discounts of the version the transaction is pinned to if it is a CatalogStore, otherwise the discounts dictionary itself.
+    """
+    if isinstance(discounts_dict, DiscountSchedule):
+        return discounts_dict.at(transaction.date, transaction.time)
+    if isinstance(discounts_dict, CatalogStore):
+        return discounts_dict.pin(transaction).discounts
+    return discounts_dict
+
+
+def pinned_items(transaction: Transaction, items_dict: Dict[str, Tuple[Item, int, Optional[int]]]) -> Dict[str, Tuple[Item, int, Optional[int]]]:
+    """
+    Returns the version of the items the transaction is pinned to if the items dictionary is a CatalogStore (pinning it to the current
+    version the first time), otherwise the items dictionary itself. Items should be scanned from it, so they match the prices used at checkout.
+    """
+    if isinstance(items_dict, CatalogStore):
+        return items_dict.pin(transaction)
+    return items_dict
+
+
+def track_running_totals(transaction: Transaction, discounts_dict: Dict[str, Discount]) -> None:
+    """
+    Prices the transaction's lines against the discounts dictionary as they are added or removed,
+    so that list_items and checkout can use its running subtotal and savings rather than pricing every line again.
+    Running totals are only used when the discounts dictionary is a PriceBook, as it tells when its discounts have changed.
+    """
+    if transaction is None or discounts_dict is None:
+        raise Exception("Transaction object or discounts dictionary not provided")
+
+    if isinstance(discounts_dict, CatalogStore):
+        discounts_dict = active_discounts(transaction, discounts_dict)
+    transaction.transaction_lines.set_pricer(lambda item: item_price_and_savings_cents(item, discounts_dict), discounts_dict, getattr(discounts_dict, 'version', None))
+
+
+def running_totals(transaction: Transaction, discounts_dict: Dict[str, Discount]) -> Optional[TransactionLines]:
+    """
+    Returns the transaction's lines if their running totals are priced against the discounts dictionary, otherwise None.
+    If discounts in the PriceBook have changed since, the lines of those items are priced again first.
+    """
+    transaction_lines = transaction.transaction_lines
+    if transaction_lines.pricing_source is not discounts_dict or not isinstance(discounts_dict, PriceBook):
+        return None
+
+    if transaction_lines.pricing_version != discounts_dict.version:
+        changed_item_ids = None if transaction_lines.pricing_version is None else discounts_dict.changed_since(transaction_lines.pricing_version)
+        transaction_lines.pricing_version = discounts_dict.version
+        if changed_item_ids is None:
+            transaction_lines.reprice()
+        else:
+            transaction_lines.reprice_items(changed_item_ids)
+
+    return transaction_lines if transaction_lines.priced else None
+
+
+def _checkout_from_running_totals(transaction: Transaction, transaction_lines: TransactionLines, items_dict: Dict[str, Tuple[Item, int, Optional[int]]]) -> bool:
+    # Checks each scanned item once against its total quantity, then fills in the totals from the running totals.
+    # Returns False if anything does not check out, so that the line by line checkout raises the same exception it always has.
+    if transaction_lines.mixed_items or transaction.payment_method is None:
+        return False
+
+    # A line with a quantity below 1 is only reported line by line, as totals per item would hide it
+    smallest_quantity = transaction_lines.smallest_quantity()
+    if smallest_quantity is not None and smallest_quantity < 1:
+        return False
+
+    try:
+        for (item_id, quantity) in transaction_lines.item_quantities.items():
+            item = transaction_lines.items_by_id[item_id]
+            # The lines must have been priced using the item currently in the items dictionary
+            if items_dict.get(item_id, (None, None, None))[0] is not item:
+                return False
+
+            restriction = _item_restriction(item)
+            if restriction is not None and _is_restricted_purchase_not_allowed(transaction.customer, transaction.date, transaction.date_ordinal, restriction):
+                return False
+
+            purchase_limit = get_item_purchase_quantity_limit(item, items_dict)
+            if purchase_limit is not None and quantity > purchase_limit:
+                return False
+
+            if not is_item_sufficiently_stocked(item, quantity, items_dict):
+                return False
+
+        surcharge_cents = _fulfilment_surcharge_cents(transaction.fulfilment_type, transaction.customer)
+    except Exception:
+        return False
+
+    _commit_stock(transaction, items_dict, transaction_lines.item_quantities)
+    _set_transaction_totals(transaction, transaction_lines.subtotal_cents, transaction_lines.savings_cents, transaction_lines.total_quantity, surcharge_cents)
+    return True
+
+
+def checkout_batch(transactions: List[Transaction], items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount],
+                   promotions: Optional[PromotionEngine] = None) -> BatchCheckoutResult:
+    """
+    Checks out many transactions in one pass against the same items and discounts dictionaries.
+    If the transactions list, items dictionary or discounts dictionary was not actually provided, an Exception should be raised.
+    Each transaction is validated and priced exactly as checkout would, but an exception raised by one transaction
+    (e.g. RestrictedItemException or InsufficientStockException) is recorded against its index instead of aborting the batch.
+    Transactions are checked out column-wise: item lookups, purchase quantity limits, final prices and savings are worked out once per item
+    for the whole batch, each transaction's line costs and savings are worked out a whole column at a time, and the stock of a run of
+    transactions is taken from an Inventory in one commit. A transaction that does not check out this way is checked out on its own instead,
+    so that the exception recorded for it is the one checkout would raise.
+    The per-line final costs, savings and quantities of every successful transaction are also collected into flat arrays.
+    If a PromotionEngine is given, every transaction is priced with its promotions, as in checkout.
+    If the discounts dictionary is a DiscountSchedule, each transaction is priced with the discounts valid at its date and time.
+    If the items or discounts dictionary is a CatalogStore, each transaction uses the version of it the transaction is pinned to.
+    """
+    if transactions is None or items_dict is None or discounts_dict is None:
+        raise Exception("Transactions list, items dictionary, or discounts dictionary not provided")
+
+    result = BatchCheckoutResult()
+    item_cache: Dict[str, Tuple[Item, Optional[Tuple[int, bool]], Optional[int]]] = {}
+    price_cache: Dict[str, Tuple[int, int]] = {}
+    # The largest quantity of each item ID a transaction can check out column-wise (0 if none), and the item IDs with a restriction
+    most_quantities: Dict[str, int] = {}
+    restricted_ids: Set[str] = set()
+    # The items and discounts the caches were filled with. A DiscountSchedule gives every transaction between two of its changes
+    # the same discounts, and a CatalogStore every transaction pinned to the same version the same items and discounts.
+    cached_items, cached_discounts = items_dict, discounts_dict
+    # The transactions checked out column-wise that have not taken their stock yet
+    run: List[_BatchRunEntry] = []
+
+    for (index, transaction) in enumerate(transactions):
+      result.transactions.append(transaction)
+
+      try:
+        if transaction is None:
+          raise Exception("Transaction object not provided")
+
+        transaction_items = pinned_items(transaction, items_dict)
+        transaction_discounts = active_discounts(transaction, discounts_dict)
+        if transaction_items is not cached_items or transaction_discounts is not cached_discounts:
+          _finish_batch_run(result, run, cached_items, cached_discounts, item_cache, price_cache)
+          item_cache, price_cache, cached_items, cached_discounts = {}, {}, transaction_items, transaction_discounts
+          most_quantities, restricted_ids = {}, set()
+
+        if promotions is None and _check_out_columns(index, transaction, transaction_items, transaction_discounts, item_cache, price_cache,
+                                                     most_quantities, restricted_ids, run):
+          continue
+      except Exception as e:
+        _finish_batch_run(result, run, cached_items, cached_discounts, item_cache, price_cache)
+        result.errors[index] = e
+        result.line_offsets.append(len(result.line_quantities))
+        continue
+
+      # Checked out on its own, once the transactions before it have taken their stock
+      _finish_batch_run(result, run, transaction_items, transaction_discounts, item_cache, price_cache)
+      _checkout_into_batch(result, index, transaction, transaction_items, transaction_discounts, item_cache, price_cache, promotions)
+
+    _finish_batch_run(result, run, cached_items, cached_discounts, item_cache, price_cache)
+    return result
+
+
+def _checkout_into_batch(result: BatchCheckoutResult, index: int, transaction: Transaction, items_dict: Dict[str, Tuple[Item, int, Optional[int]]],
+                         discounts_dict: Dict[str, Discount], item_cache: Dict[str, Tuple[Item, Optional[Tuple[int, bool]], Optional[int]]],
+                         price_cache: Dict[str, Tuple[int, int]], promotions: Optional[PromotionEngine] = None) -> None:
+    # Checks out a single transaction of the batch exactly as checkout would, recording its exception if it fails
+    lines_before = len(result.line_quantities)
+    try:
+      _checkout_transaction(transaction, items_dict, discounts_dict, item_cache, price_cache, result, promotions)
+    except Exception as e:
+      # Drop any lines this transaction added before it failed
+      del result.line_final_costs_cents[lines_before:]
+      del result.line_savings_cents[lines_before:]
+      del result.line_quantities[lines_before:]
+      result.errors[index] = e
+
+    result.line_offsets.append(len(result.line_quantities))
+
+
+def _check_out_columns(index: int, transaction: Transaction, items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount],
+                       item_cache: Dict[str, Tuple[Item, Optional[Tuple[int, bool]], Optional[int]]], price_cache: Dict[str, Tuple[int, int]],
+                       most_quantities: Dict[str, int], restricted_ids: Set[str], run: List[_BatchRunEntry]) -> bool:
+    # Checks each unique item of the transaction against its total quantity, prices every line a whole column at a time and adds the transaction
+    # to the run, which takes its stock and sets its totals when finished. Returns False if anything does not check out, so that it can be
+    # checked out on its own and raise the exception checkout would.
+    if transaction.payment_method is None:
+      return False
+
+    transaction_lines = transaction.transaction_lines
+    smallest_quantity = transaction_lines.smallest_quantity()
+    if smallest_quantity is not None and smallest_quantity < 1:
+      return False
+
+    purchased_quantities = transaction_lines.item_quantities
+    for (item_id, quantity) in purchased_quantities.items():
+      most_quantity = most_quantities.get(item_id)
+      if most_quantity is None:
+        most_quantity = most_quantities[item_id] = _batch_most_quantity(item_id, items_dict, discounts_dict, item_cache, price_cache, restricted_ids)
+      if quantity > most_quantity:
+        return False
+
+    try:
+      if not restricted_ids.isdisjoint(purchased_quantities):
+        restrictions_not_allowed = {}
+        for item_id in restricted_ids.intersection(purchased_quantities):
+          if _restriction_not_allowed(transaction, item_cache[item_id][1], restrictions_not_allowed):
+            return False
+
+      surcharge_cents = _fulfilment_surcharge_cents(transaction.fulfilment_type, transaction.customer)
+    except Exception:
+      return False
+
+    final_costs_cents, savings_cents, quantities = transaction_lines.write_final_costs(price_cache)
+    run.append((index, transaction, purchased_quantities, sum(final_costs_cents), sum(savings_cents), transaction_lines.total_quantity,
+                surcharge_cents, final_costs_cents, savings_cents, quantities))
+    return True
+
+
+def _batch_most_quantity(item_id: str, items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount],
+                         item_cache: Dict[str, Tuple[Item, Optional[Tuple[int, bool]], Optional[int]]], price_cache: Dict[str, Tuple[int, int]],
+                         restricted_ids: Set[str]) -> int:
+    # Looks up, checks and prices an item once for the whole run, and returns the largest quantity of it a transaction can check out column-wise:
+    # its purchase limit, and for an items dictionary that is not an Inventory its stock level too. An Inventory's stock is checked when the run
+    # takes it. Returns 0 if the item cannot be checked out column-wise at all.
+    try:
+      _, restriction, purchase_limit = _cached_item(item_id, items_dict, item_cache)
+      stock = items_dict[item_id][1]
+      _cached_price(item_id, discounts_dict, item_cache, price_cache)
+    except Exception:
+      return 0
+
+    if stock is None or stock < 0:
+      return 0
+    if restriction is not None:
+      restricted_ids.add(item_id)
+
+    most_quantity = sys.maxsize if isinstance(items_dict, Inventory) else stock
+    return most_quantity if purchase_limit is None else min(most_quantity, purchase_limit)
+
+
+def _finish_batch_run(result: BatchCheckoutResult, run: List[_BatchRunEntry], items_dict: Dict[str, Tuple[Item, int, Optional[int]]],
+                      discounts_dict: Dict[str, Discount], item_cache: Dict[str, Tuple[Item, Optional[Tuple[int, bool]], Optional[int]]],
+                      price_cache: Dict[str, Tuple[int, int]]) -> None:
+    # Takes the stock of every transaction in the run in one commit, then sets their totals and adds their lines to the result columns in batch order.
+    # If there is not enough stock for the whole run, each transaction takes its own, and one that cannot is checked out on its own
+    # so that it raises the InsufficientStockException checkout would, for the line checkout would raise it for.
+    run_committed = not isinstance(items_dict, Inventory)
+    if run and not run_committed:
+      run_quantities: Dict[str, int] = {}
+      for entry in run:
+        for (item_id, quantity) in entry[2].items():
+          run_quantities[item_id] = run_quantities.get(item_id, 0) + quantity
+      try:
+        items_dict.commit(run_quantities)
+        run_committed = True
+      except InsufficientStockException:
+        pass
+
+    for (index, transaction, quantities, subtotal_cents, total_savings_cents, total_items, surcharge_cents, final_costs_cents, savings_cents, line_quantities) in run:
+      try:
+        if isinstance(items_dict, Inventory):
+          transaction.stock_reservation = dict(quantities) if run_committed else items_dict.commit(quantities)
+      except InsufficientStockException:
+        _checkout_into_batch(result, index, transaction, items_dict, discounts_dict, item_cache, price_cache)
+        continue
+
+      _set_transaction_totals(transaction, subtotal_cents, total_savings_cents, total_items, surcharge_cents)
+      result.line_final_costs_cents.extend(final_costs_cents)
+      result.line_savings_cents.extend(savings_cents)
+      result.line_quantities.extend(line_quantities)
+      result.line_offsets.append(len(result.line_quantities))
+
+    run.clear()
+
+
+def _checkout_transaction(transaction: Transaction, items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount],
+                          item_cache: Dict[str, Tuple[Item, Optional[Tuple[int, bool]], Optional[int]]], price_cache: Dict[str, Tuple[int, int]],
+                          columns: Optional[BatchCheckoutResult] = None, promotions: Optional[PromotionEngine] = None) -> Transaction:
+    # Shared by checkout and checkout_batch. item_cache maps item IDs to (item, restriction or None, purchase limit), and price_cache
+    # to (final price cents, savings cents). They only depend on the items and discounts dictionaries and so can be reused across transactions.
+    # Items are only priced once they have been checked, as pricing can raise for an invalid discount.
+    # All amounts are whole cents, so nothing needs rounding until they are read back as dollars.
+    # Lines are merged by item ID first, so each unique item is validated and priced once however many times it was scanned
+    transaction_lines = transaction.transaction_lines
+    purchased_quantities = transaction_lines.item_quantities
+    if not _unique_items_check_out(transaction, purchased_quantities, items_dict, discounts_dict, item_cache, price_cache):
+      # Validate line by line instead, so the exception raised is the one for the first line that does not check out
+      purchased_quantities = _validate_lines(transaction, items_dict, discounts_dict, item_cache, price_cache)
+
+    if promotions is not None:
+      return _checkout_with_promotions(transaction, items_dict, discounts_dict, item_cache, price_cache, columns, promotions, purchased_quantities)
+
     # Initialize variables for the transaction
-    subtotal = 0
-    total_savings = 0
+    subtotal_cents = 0
+    total_savings_cents = 0
     total_items = 0
-    purchased_quantities = {}
 
-    # Go through every transaction line in the transaction object
-    for tline in transaction.transaction_lines:
+    # Every line keeps its own final cost for the receipt
+    for tline in transaction_lines:
+      final_price_cents, savings_cents = _cached_price(tline.item.id, discounts_dict, item_cache, price_cache)
+
+      # Update transaction line with the final price
+      line_cost_cents = final_price_cents * tline.quantity
+      tline.final_cost_cents = line_cost_cents
+
+      # Update transaction details
+      subtotal_cents += line_cost_cents
+      total_savings_cents += savings_cents * tline.quantity
+      total_items += tline.quantity
+
+      if columns is not None:
+        columns.line_final_costs_cents.append(line_cost_cents)
+        columns.line_savings_cents.append(savings_cents * tline.quantity)
+        columns.line_quantities.append(tline.quantity)
+
+    # The subtotal is rounded off for the payment method only once every line has been checked and priced
+    _check_payment_method(transaction)
+
+    # Calculate the surcharge using existing functions
+    surcharge_cents = _fulfilment_surcharge_cents(transaction.fulfilment_type, transaction.customer)
+
+    _commit_stock(transaction, items_dict, purchased_quantities)
+    return _set_transaction_totals(transaction, subtotal_cents, total_savings_cents, total_items, surcharge_cents)
+
+
+def _checkout_with_promotions(transaction: Transaction, items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount],
+                              item_cache: Dict[str, Tuple[Item, Optional[Tuple[int, bool]], Optional[int]]], price_cache: Dict[str, Tuple[int, int]],
+                              columns: Optional[BatchCheckoutResult], promotions: PromotionEngine, purchased_quantities: Dict[str, int]) -> Transaction:
+    # Prices the validated lines with the promotions. Each line's final cost and savings are kept on the line, as the receipt
+    # cannot work them out from the item's discount alone. Writing them keeps the running totals the sums of the lines.
+    transaction_lines = transaction.transaction_lines
+    lines = []
+    subtotal_without_promotions_cents = 0
+    for (item, quantity, _, _) in transaction_lines.rows():
+      cached_item = item_cache[item.id][0]
+      final_price_cents, _ = _cached_price(item.id, discounts_dict, item_cache, price_cache)
+      lines.append((cached_item, quantity, final_price_cents))
+      subtotal_without_promotions_cents += final_price_cents * quantity
+
+    line_prices, promotion_discount_cents = promotions.price_lines(lines)
+    # The lines no longer have the prices of the discounts alone, so they are priced again before their running totals are next
+    # used by a checkout without promotions (see running_totals)
+    transaction_lines.pricing_version = None
+
+    subtotal_cents = 0
+    total_savings_cents = 0
+    for (tline, (line_cost_cents, line_savings_cents)) in zip(transaction_lines, line_prices):
+      tline.final_cost_cents = line_cost_cents
+      tline.savings_cents = line_savings_cents
+      subtotal_cents += line_cost_cents
+      total_savings_cents += line_savings_cents
+
+      if columns is not None:
+        columns.line_final_costs_cents.append(line_cost_cents)
+        columns.line_savings_cents.append(line_savings_cents)
+        columns.line_quantities.append(tline.quantity)
+
+    _check_payment_method(transaction)
+    surcharge_cents = _fulfilment_surcharge_cents(transaction.fulfilment_type, transaction.customer)
+
+    _commit_stock(transaction, items_dict, purchased_quantities)
+    _set_transaction_totals(transaction, subtotal_cents - promotion_discount_cents, total_savings_cents + promotion_discount_cents,
+                            transaction_lines.total_quantity, surcharge_cents)
+    transaction.promotion_discount_cents = promotion_discount_cents
+    transaction.promotion_savings_cents = subtotal_without_promotions_cents - subtotal_cents + promotion_discount_cents
+    return transaction
+
+
+def _cached_item(item_id: str, items_dict: Dict[str, Tuple[Item, int, Optional[int]]],
+                 item_cache: Dict[str, Tuple[Item, Optional[Tuple[int, bool]], Optional[int]]]) -> Tuple[Item, Optional[Tuple[int, bool]], Optional[int]]:
+    cached = item_cache.get(item_id)
+
+    if cached is None:
       # Get item details using the item id in the transaction line
-      item, _, _ = items_dict.get((tline.item.id), (None, None, None))
-          
+      item, _, _ = items_dict.get(item_id, (None, None, None))
+
       # Check if the item exists
       if item is None:
-        raise Exception(f"Item with code {item[0]} not found")
-          
+        raise Exception(f"Item with code {item_id} not found")
+
+      cached = (item, _item_restriction(item), get_item_purchase_quantity_limit(item, items_dict))
+      item_cache[item_id] = cached
+
+    return cached
+
+
+def _cached_price(item_id: str, discounts_dict: Dict[str, Discount], item_cache: Dict[str, Tuple[Item, Optional[Tuple[int, bool]], Optional[int]]],
+                  price_cache: Dict[str, Tuple[int, int]]) -> Tuple[int, int]:
+    # Must only be called for items that have been checked, and so are already in the item cache
+    cached = price_cache.get(item_id)
+
+    if cached is None:
+      # Calculate final item price and savings using existing functions
+      cached = item_price_and_savings_cents(item_cache[item_id][0], discounts_dict)
+      price_cache[item_id] = cached
+
+    return cached
+
+
+def _unique_items_check_out(transaction: Transaction, purchased_quantities: Dict[str, int], items_dict: Dict[str, Tuple[Item, int, Optional[int]]],
+                            discounts_dict: Dict[str, Discount], item_cache: Dict[str, Tuple[Item, Optional[Tuple[int, bool]], Optional[int]]],
+                            price_cache: Dict[str, Tuple[int, int]]) -> bool:
+    # Checks each unique item once against its total quantity. Every line has a quantity of at least 1, so if the total checks out,
+    # so does the running total at every line, and the lines would have passed one by one.
+    # The unique items are then priced. Returns False if anything does not check out or cannot be priced, so that _validate_lines
+    # can raise the exception for the line it fails on.
+    smallest_quantity = transaction.transaction_lines.smallest_quantity()
+    if smallest_quantity is not None and smallest_quantity < 1:
+      return False
+
+    restrictions_not_allowed = {}
+    try:
+      for (item_id, quantity) in purchased_quantities.items():
+        item, restriction, purchase_limit = _cached_item(item_id, items_dict, item_cache)
+
+        if restriction is not None and _restriction_not_allowed(transaction, restriction, restrictions_not_allowed):
+          return False
+
+        if purchase_limit is not None and quantity > purchase_limit:
+          return False
+
+        if not is_item_sufficiently_stocked(item, quantity, items_dict):
+          return False
+
+      for item_id in purchased_quantities:
+        _cached_price(item_id, discounts_dict, item_cache, price_cache)
+    except Exception:
+      return False
+
+    return True
+
+
+def _validate_lines(transaction: Transaction, items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount],
+                    item_cache: Dict[str, Tuple[Item, Optional[Tuple[int, bool]], Optional[int]]], price_cache: Dict[str, Tuple[int, int]]) -> Dict[str, int]:
+    # Checks every transaction line in order against the running total of its item, then prices it, raising for the first line that
+    # does not check out or cannot be priced. Returns the purchased quantity of each item ID.
+    purchased_quantities = {}
+    restrictions_not_allowed = {}
+
+    # Go through every transaction line in the transaction object
+    for tline in transaction.transaction_lines:
+      item, restriction, purchase_limit = _cached_item(tline.item.id, items_dict, item_cache)
+
       # Use existing functions to check restrictions, stock levels, and purchase quantity limits
-      if is_not_allowed_to_purchase_item(item, transaction.customer, transaction.date):
+      if restriction is not None and _restriction_not_allowed(transaction, restriction, restrictions_not_allowed):
         raise RestrictedItemException(f"Restricted item {item.name} cannot be purchased by the customer")
-      
+
       # Get or set the purchased quantity for the item
       purchased_so_far = purchased_quantities.get(item.id, 0)
       new_purchase_amount = purchased_so_far + tline.quantity
-      
-      purchase_limit = get_item_purchase_quantity_limit(item, items_dict)
+
       if purchase_limit is not None and new_purchase_amount > purchase_limit:
         raise PurchaseLimitExceededException(f"Purchase limit exceeded for item {item.name}")
-      
-      # Update purchased quantity for the ite
+
+      # Update purchased quantity for the item
       purchased_quantities[item.id] = new_purchase_amount
-      
+
       if not is_item_sufficiently_stocked(item, new_purchase_amount, items_dict):
         raise InsufficientStockException(f"Insufficient stock for item {item.name}")
-          
-      # Calculate final item price and savings using existing functions
-      final_price = calculate_final_item_price(item, discounts_dict)
-      savings = calculate_item_savings(item.original_price, final_price)
-          
-      # Update transaction line with the final price
-      tline.final_cost = final_price* tline.quantity
-          
-      # Update transaction details
-      subtotal += final_price * tline.quantity
-      total_savings += savings * tline.quantity
-      total_items += tline.quantity
-      
-    # Calculate the rounded-off subtotal and surcharge using existing functions
-    rounded_subtotal = round_off_subtotal(subtotal, transaction.payment_method)
-    surcharge = calculate_fulfilment_surcharge(transaction.fulfilment_type, transaction.customer)
-      
-    # Calculate final total and rounding
-    final_total = rounded_subtotal + surcharge
-    rounding = rounded_subtotal- subtotal
-      
+
+      # Priced only once the line has checked out, so an invalid discount is raised no earlier than it was line by line
+      _cached_price(item.id, discounts_dict, item_cache, price_cache)
+
+    return purchased_quantities
+
+
+def _restriction_not_allowed(transaction: Transaction, restriction: Tuple[int, bool], restrictions_not_allowed: Dict[Tuple[int, bool], bool]) -> bool:
+    # The customer and purchase date are the same for every line, so each restriction only needs to be checked once per transaction
+    not_allowed = restrictions_not_allowed.get(restriction)
+    if not_allowed is None:
+      not_allowed = restrictions_not_allowed[restriction] = _is_restricted_purchase_not_allowed(
+        transaction.customer, transaction.date, transaction.date_ordinal, restriction)
+    return not_allowed
+
+
+def _check_payment_method(transaction: Transaction) -> None:
+    # Raised where round_off_subtotal would raise it, after the lines but before the fulfilment surcharge
+    if transaction.payment_method is None:
+        raise Exception("Both subtotal and payment method must be provided.")
+
+
+def release_stock(transaction: Transaction, items_dict: Dict[str, Tuple[Item, int, Optional[int]]]) -> None:
+    """
+    Puts back any stock taken from an Inventory when the transaction was checked out, e.g. if payment is cancelled.
+    Does nothing if no stock was taken.
+    """
+    if transaction.stock_reservation is not None and isinstance(items_dict, Inventory):
+        items_dict.rollback(transaction.stock_reservation)
+    transaction.stock_reservation = None
+
+
+def _commit_stock(transaction: Transaction, items_dict: Dict[str, Tuple[Item, int, Optional[int]]], quantities: Dict[str, int]) -> None:
+    # Stock is only taken when the items dictionary is a shared Inventory, all items together or none at all.
+    # Another lane may have sold the last units since they were checked, in which case InsufficientStockException is raised.
+    if isinstance(items_dict, Inventory):
+        transaction.stock_reservation = items_dict.commit(quantities)
+
+
+def _set_transaction_totals(transaction: Transaction, subtotal_cents: int, total_savings_cents: int, total_items: int, surcharge_cents: int) -> Transaction:
+    # Calculate the rounded-off subtotal using existing functions
+    rounded_subtotal_cents = _round_off_subtotal_cents(subtotal_cents, transaction.payment_method)
+
     # Update the transaction object with all the calculated details
-    transaction.all_items_subtotal = subtotal
-    transaction.fulfilment_surcharge_amount = surcharge
-    transaction.rounding_amount_applied = rounding
-    transaction.final_total = final_total
-    transaction.amount_saved= total_savings
+    transaction.all_items_subtotal_cents = subtotal_cents
+    transaction.fulfilment_surcharge_amount_cents = surcharge_cents
+    transaction.rounding_amount_applied_cents = rounded_subtotal_cents - subtotal_cents
+    transaction.final_total_cents = rounded_subtotal_cents + surcharge_cents
+    transaction.amount_saved_cents = total_savings_cents
     transaction.total_items_purchased = total_items
-      
+    transaction.promotion_discount_cents = None
+    transaction.promotion_savings_cents = None
+
     return transaction
 
 
@@ -1,5 +1,9 @@
+import io
+import os
+import re
+from contextvars import ContextVar
 from datetime import datetime
-from typing import Dict, Tuple, Optional
+from typing import Dict, Iterable, Iterator, List, Tuple, Optional
 from PaymentMethod import PaymentMethod
 from FulfilmentType import FulfilmentType
 from TransactionLine import TransactionLine
@@ -10,28 +14,49 @@ from Discount import Discount
 
 from InsufficientFundsException import InsufficientFundsException
 
-from megamart import calculate_final_item_price, calculate_item_savings, checkout
+from money import from_cents
+from Inventory import Inventory
+from PriceBook import PriceBook
+from MappedCatalog import MappedCatalog, MappedDiscounts
+from TransactionJournal import TransactionJournal
+from ReceiptRenderer import ReceiptRenderer
+from Console import Console
+from PromotionEngine import PromotionEngine
+
+from megamart import checkout, pinned_items, release_stock, track_running_totals
+
+# Receipts and item lists are written with one precompiled layout
+receipt_renderer = ReceiptRenderer()
+
+# A bulk scan token: an item code, optionally followed by 'x' and a quantity, e.g. '1001' or '1001x3'
+_SCAN_TOKEN = re.compile(r'(.+?)(?:[xX](\d+))?')
+BULK_SCAN_BATCH_SIZE = 1000
+
+# The console that terminal and its prompts read from and print to. terminal sets it for the session it runs,
+# so that lanes running in separate threads can each have their own, e.g. a ScriptedConsole.
+current_console: ContextVar[Console] = ContextVar('current_console', default=Console())
 
 
 def scan_item(items_dict: Dict[str, Tuple[Item, int, Optional[int]]]) -> TransactionLine:
+  console = current_console.get()
   item = None
   quantity = None
 
   while True:
-    item_id = input("\n>>> What is the item code? (Enter 'quit' to cancel) \n")
+    item_id = console.input("\n>>> What is the item code? (Enter 'quit' to cancel) \n")
     if item_id == 'quit':
       return None
 
     if item_id not in items_dict:
-      print('Item with the provided ID was not found, please try again.')
+      console.print('Item with the provided ID was not found, please try again.')
       continue
     
     item = items_dict[item_id][0]
-    print("Found item: '{}'".format(item.name))
+    console.print("Found item: '{}'".format(item.name))
     break
 
   while True:
-    quantity = input("\n>>> What is the quantity? (Enter 'quit' to cancel)\n")
+    quantity = console.input("\n>>> What is the quantity? (Enter 'quit' to cancel)\n")
     if quantity == 'quit':
       return None
     
@@ -41,7 +66,7 @@ def scan_item(items_dict: Dict[str, Tuple[Item, int, Optional[int]]]) -> Transac
         raise Exception()
 
     except:
-      print('The provided quantity is not a whole number that is at least 1, please try again.')
+      console.print('The provided quantity is not a whole number that is at least 1, please try again.')
       continue
 
     break
@@ -49,41 +74,74 @@ def scan_item(items_dict: Dict[str, Tuple[Item, int, Optional[int]]]) -> Transac
   return TransactionLine(item, quantity)
 
 
-def list_items(transaction: Transaction, discounts_dict: Dict[str, Discount]) -> Tuple[int, str, str]:
-  list_string = f"{'#':<5} {'ITEM NAME':<30} {'QUANTITY':<10} {'UNIT PRICE ($)':>20} {'TOTAL DISCOUNTS APPLIED ($)':>35} {'FINAL PRICE ($)':>20}\n"
+def scan_items_bulk(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], stream: Iterable[str],
+                    batch_size: int = BULK_SCAN_BATCH_SIZE) -> Tuple[List[TransactionLine], List[str]]:
+  """
+  Reads item_id[xqty] tokens separated by whitespace or commas, e.g. '1 2x3, 4', from lines of text such as stdin or an open file,
+  without prompting for each item. Tokens are resolved against the items dictionary a batch at a time, looking each item code up once per batch.
+  Returns the transaction lines of every resolved token in the order read, and the tokens that could not be resolved:
+  unknown item codes, and quantities that are not a whole number of at least 1.
+  """
+  transaction_lines = []
+  rejected = []
+  batch = []
+  for token in _scan_tokens(stream):
+    batch.append(token)
+    if len(batch) >= batch_size:
+      _resolve_scan_tokens(batch, items_dict, transaction_lines, rejected)
+      batch = []
+  _resolve_scan_tokens(batch, items_dict, transaction_lines, rejected)
+  return transaction_lines, rejected
+
+
+def _scan_tokens(stream: Iterable[str]) -> Iterator[str]:
+  for line in stream:
+    yield from line.replace(',', ' ').split()
+
+
+def _resolve_scan_tokens(tokens: List[str], items_dict: Dict[str, Tuple[Item, int, Optional[int]]],
+                         transaction_lines: List[TransactionLine], rejected: List[str]) -> None:
+  parsed = [_SCAN_TOKEN.fullmatch(token).groups() for token in tokens]
+  items = {item_id: items_dict[item_id][0] for item_id in {item_id for (item_id, _) in parsed} if item_id in items_dict}
+
+  for (token, (item_id, quantity)) in zip(tokens, parsed):
+    quantity = 1 if quantity is None else int(quantity)
+    if item_id not in items or quantity < 1:
+      rejected.append(token)
+    else:
+      transaction_lines.append(TransactionLine(items[item_id], quantity))
 
-  items_total = 0 
-  for (index, transaction_line) in enumerate(transaction.transaction_lines):
-    final_price = calculate_final_item_price(transaction_line.item, discounts_dict)
-    discounts = calculate_item_savings(transaction_line.item.original_price, final_price)
-    items_total += final_price * transaction_line.quantity
-    list_string += f"{(index + 1):<5} {transaction_line.item.name :<30} {transaction_line.quantity:<10} {('{:.2f} {}'.format(transaction_line.item.original_price, 'each')):>20} {(discounts * transaction_line.quantity):>35.2f} {(final_price * transaction_line.quantity):>20.2f}\n"
 
-  totals_string = f"{'':<5} {'':<30} {'':<10} {'':>20} {'===============================':>35}={'====================':>20}\n"
-  totals_string += f"{'':<5} {'':<30} {'':<10} {'':>20} {'TOTAL PRICE ($)':>35} {items_total:>20.2f}\n"
-  totals_string += f"{'':<5} {'':<30} {'':<10} {'':>20} {'===============================':>35}={'====================':>20}"
+def list_items(transaction: Transaction, discounts_dict: Dict[str, Discount]) -> Tuple[int, str, str]:
+  list_stream = io.StringIO()
+  items_total = from_cents(receipt_renderer.write_items(transaction, discounts_dict, list_stream))
 
-  return items_total, list_string, totals_string
+  totals_stream = io.StringIO()
+  receipt_renderer.write_items_totals(items_total, totals_stream)
+
+  return items_total, list_stream.getvalue(), totals_stream.getvalue()
 
 
 def link_member_account(customers_dict: Dict[str, Customer]) -> Optional[Customer]:
+  console = current_console.get()
   customer = None
 
   while True:
-    customer_id = input("\n>>> What is your membership number? (Enter 'quit' to cancel) \n")
+    customer_id = console.input("\n>>> What is your membership number? (Enter 'quit' to cancel) \n")
     if customer_id == 'quit':
       return None
 
     if customer_id not in customers_dict:
-      print('The membership number you provided was not found, please try again.')
+      console.print('The membership number you provided was not found, please try again.')
       continue
 
     customer = customers_dict[customer_id]
-    print("Found member: '{}'".format(customer.name))
+    console.print("Found member: '{}'".format(customer.name))
     return customer
 
 
 def remove_transaction_line(transaction: Transaction) -> Tuple[Optional[int], Optional[Transaction]]:
+  console = current_console.get()
   max_line_number = len(transaction.transaction_lines)
   if max_line_number == 0:
     return None, None
@@ -91,7 +149,7 @@ def remove_transaction_line(transaction: Transaction) -> Tuple[Optional[int], Op
   line_number_to_remove = None
 
   while True:
-    line_number_to_remove = input(">>> What is the line number of the item to remove? (Enter 'quit' to cancel)\n")
+    line_number_to_remove = console.input(">>> What is the line number of the item to remove? (Enter 'quit' to cancel)\n")
     if line_number_to_remove == 'quit':
       return None, None
     
@@ -101,7 +159,7 @@ def remove_transaction_line(transaction: Transaction) -> Tuple[Optional[int], Op
         raise Exception()
 
     except:
-      print('The provided line number is not a whole number between 1 and {} inclusive, please try again.'.format(max_line_number))
+      console.print('The provided line number is not a whole number between 1 and {} inclusive, please try again.'.format(max_line_number))
       continue
 
     break
@@ -110,6 +168,7 @@ def remove_transaction_line(transaction: Transaction) -> Tuple[Optional[int], Op
 
 
 def select_fulfilment_type() -> Optional[FulfilmentType]:
+  console = current_console.get()
   num_fulfilment_types = len(FulfilmentType)
   if num_fulfilment_types == 0:
     return None
@@ -118,11 +177,11 @@ def select_fulfilment_type() -> Optional[FulfilmentType]:
   fulfilment_types_list = [e for e in FulfilmentType]
 
   while True:
-    print('\nFulfilment Types:')
+    console.print('\nFulfilment Types:')
     for (index, method) in enumerate(FulfilmentType):
-      print('{}. {}'.format(index + 1, method.value))
+      console.print('{}. {}'.format(index + 1, method.value))
 
-    selected_type = input(">>> Which fulfilment type (1 to {}) would you like to use? (Enter 'quit' to cancel)\n".format(num_fulfilment_types))
+    selected_type = console.input(">>> Which fulfilment type (1 to {}) would you like to use? (Enter 'quit' to cancel)\n".format(num_fulfilment_types))
     if selected_type == 'quit':
       return None
     
@@ -132,7 +191,7 @@ def select_fulfilment_type() -> Optional[FulfilmentType]:
         raise Exception()
 
     except:
-      print('The provided fulfilment type number is not a whole number between 1 and {} inclusive, please try again.'.format(num_fulfilment_types))
+      console.print('The provided fulfilment type number is not a whole number between 1 and {} inclusive, please try again.'.format(num_fulfilment_types))
       continue
 
     break
@@ -141,6 +200,7 @@ def select_fulfilment_type() -> Optional[FulfilmentType]:
 
 
 def select_payment_method() -> Optional[PaymentMethod]:
+  console = current_console.get()
   num_payment_methods = len(PaymentMethod)
   if num_payment_methods == 0:
     return None
@@ -149,11 +209,11 @@ def select_payment_method() -> Optional[PaymentMethod]:
   payment_methods_list = [e for e in PaymentMethod]
 
   while True:
-    print('\nPayment Methods:')
+    console.print('\nPayment Methods:')
     for (index, method) in enumerate(PaymentMethod):
-      print('{}. {}'.format(index + 1, method.value))
+      console.print('{}. {}'.format(index + 1, method.value))
 
-    selected_method = input(">>> Which payment method (1 to {}) would you like to use? (Enter 'quit' to cancel)\n".format(num_payment_methods))
+    selected_method = console.input(">>> Which payment method (1 to {}) would you like to use? (Enter 'quit' to cancel)\n".format(num_payment_methods))
     if selected_method == 'quit':
       return None
     
@@ -163,7 +223,7 @@ def select_payment_method() -> Optional[PaymentMethod]:
         raise Exception()
 
     except:
-      print('The provided payment method number is not a whole number between 1 and {} inclusive, please try again.'.format(num_payment_methods))
+      console.print('The provided payment method number is not a whole number between 1 and {} inclusive, please try again.'.format(num_payment_methods))
       continue
 
     break
@@ -172,8 +232,9 @@ def select_payment_method() -> Optional[PaymentMethod]:
 
 
 def tender_variable_payment(transaction: Transaction) -> Transaction:
+  console = current_console.get()
   while True:
-    amount = input("\n>>> How much would you like to pay using {}? ${:.2f} is currently due. (Enter 'quit' to cancel)\n".format(transaction.payment_method.value, transaction.final_total))
+    amount = console.input("\n>>> How much would you like to pay using {}? ${:.2f} is currently due. (Enter 'quit' to cancel)\n".format(transaction.payment_method.value, transaction.final_total))
     if amount == 'quit':
       return transaction
 
@@ -187,136 +248,137 @@ def tender_variable_payment(transaction: Transaction) -> Transaction:
         raise Exception('Amount tendered is invalid, it cannot be negative.')
 
     except:
-      print('The tendered amount cannot be negative and cannot be more than two decimal places, please try again.')
+      console.print('The tendered amount cannot be negative and cannot be more than two decimal places, please try again.')
       continue
 
     break
 
+  return settle_payment(transaction, amount)
+
+
+def settle_payment(transaction: Transaction, amount: float) -> Transaction:
   transaction.amount_tendered = amount
 
   # Check amount tendered covers final order total
   if transaction.amount_tendered < transaction.final_total:
     raise InsufficientFundsException('Amount tendered (${:.2f}) is less than the total price of the ordered items (${:.2f}).'.format(transaction.amount_tendered, transaction.final_total))
 
-  change_amount = transaction.amount_tendered - transaction.final_total
-  transaction.change_amount = change_amount
+  transaction.change_amount_cents = transaction.amount_tendered_cents - transaction.final_total_cents
   transaction.finalised = True
 
   return transaction
 
 
 def tender_exact_payment(transaction: Transaction) -> Transaction:
+  console = current_console.get()
   while True:
-    response = input("\n>>> ${:.2f} is currently due. Enter 'Y' to pay exact amount by {}. (Enter 'N' or 'quit' to cancel)\n".format(transaction.final_total, transaction.payment_method.value))
+    response = console.input("\n>>> ${:.2f} is currently due. Enter 'Y' to pay exact amount by {}. (Enter 'N' or 'quit' to cancel)\n".format(transaction.final_total, transaction.payment_method.value))
     if response == 'quit' or response.lower() == 'n':
       return transaction
 
     if response.lower() == 'y':
-      transaction.amount_tendered = transaction.final_total
+      transaction.amount_tendered_cents = transaction.final_total_cents
       transaction.change_amount = 0
       transaction.finalised = True
 
       return transaction
 
-    print('Invalid input, please try again.')
-
-
-def generate_receipt(transaction: Transaction, discounts_dict: Dict[str, Discount]) -> str:
-  if not transaction.finalised:
-     raise Exception('Cannot print a receipt for an unfinalised transaction.')
+    console.print('Invalid input, please try again.')
 
-  receipt_border = f"{'=====':<5}={'==============================':<30}={'==========':<10}={'====================':>20}={'===================================':>35}={'====================':>20}\n"
 
-  # Build header
-  receipt_text = receipt_border
-  receipt_text += 'MONASH MEGAMART RECEIPT\n'
-  receipt_text += receipt_border
+def load_catalog(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount]) -> Tuple[Inventory, PriceBook]:
+  """
+  Returns the items and discounts dictionaries (e.g. megadata.items and megadata.discounts) as lanes use them: stock levels held by an
+  Inventory, so that checkouts on different lanes take stock atomically, and discounts by a PriceBook, which remembers final prices and
+  savings, so discounts must then be replaced or removed through it.
+  If MEGAMART_CATALOG is set to the path of a catalog file (see MappedCatalog.write_catalog), its items and discounts are used instead.
+  """
+  if os.environ.get('MEGAMART_CATALOG'):
+    mapped_items = MappedCatalog(os.environ['MEGAMART_CATALOG'])
+    return mapped_items, MappedDiscounts(mapped_items)
 
-  receipt_text += 'Transaction time: {} {}\n'.format(transaction.date, transaction.time)
-  receipt_text += 'Fulfilment type: {}\n'.format(transaction.fulfilment_type.value)
+  inventory = Inventory(items_dict.values())
+  return inventory, PriceBook(discounts_dict)
 
-  if (transaction.customer):
-    receipt_text += 'Customer: {}\n'.format(transaction.customer.name)
-    receipt_text += 'Membership #: {}\n'.format(transaction.customer.membership_number)
 
-  receipt_text += receipt_border
+def generate_receipt(transaction: Transaction, discounts_dict: Dict[str, Discount]) -> str:
+  return receipt_renderer.receipt(transaction, discounts_dict)
 
-  item_total, list_string, totals_string = list_items(transaction, discounts_dict)
 
-  receipt_text += "Purchased items:\n"
-  receipt_text += list_string
+def start_transaction(discounts_dict: Dict[str, Discount]) -> Transaction:
+  now = datetime.now()
+  current_datetime = now.strftime("%d/%m/%Y %H:%M:%S")
 
-  receipt_text += "\n"
-  receipt_text += receipt_border
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'SUBTOTAL ($)':>35} {(transaction.all_items_subtotal or 0):>20.2f}\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'FULFILMENT SURCHARGE ($)':>35} {(transaction.fulfilment_surcharge_amount or 0):>20.2f}\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'ROUNDING ($)':>35} {(transaction.rounding_amount_applied or 0):>20.2f}\n\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'===============================':>35}={'====================':>20}\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'FINAL TOTAL ($)':>35} {(transaction.final_total or 0):>20.2f}\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'===============================':>35}={'====================':>20}\n\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'PAYMENT METHOD':>35} {transaction.payment_method.value:>20}\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'AMOUNT TENDERED ($)':>35} {(transaction.amount_tendered or 0):>20.2f}\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'CHANGE ($)':>35} {(transaction.change_amount or 0):>20.2f}\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'# ITEMS PURCHASED':>35} {(transaction.total_items_purchased or 0):>20}\n\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'MONEY SAVED WITH US ($)':>35} {(transaction.amount_saved or 0):>20.2f}\n"
+  transaction = Transaction(current_datetime.split(" ")[0], current_datetime.split(" ")[1])
+  track_running_totals(transaction, discounts_dict)
+  return transaction
 
-  # Build footer
-  receipt_text += receipt_border
-  receipt_text += 'Thank you for shopping at Monash MegaMart, please come again!\n'
-  receipt_text += receipt_border
 
-  return receipt_text
+def terminal(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount], customers_dict: Dict[str, Customer],
+             journal: Optional[TransactionJournal] = None, console: Optional[Console] = None, promotions: Optional[PromotionEngine] = None) -> None:
+  """
+  Runs one customer's session at a lane, reading from and printing to the given console, or the real one if not given.
+  If a PromotionEngine is given, the transaction is checked out with its promotions. Scanned item lists show prices without them.
+  """
+  if console is None:
+    return _run_terminal(items_dict, discounts_dict, customers_dict, journal, promotions)
 
+  token = current_console.set(console)
+  try:
+    return _run_terminal(items_dict, discounts_dict, customers_dict, journal, promotions)
+  finally:
+    current_console.reset(token)
 
-def terminal(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount], customers_dict: Dict[str, Customer]) -> None:
-  print("===========================")
-  print("Welcome to Monash MegaMart!")
-  print("===========================\n")
 
-  now = datetime.now()
-  current_datetime = now.strftime("%d/%m/%Y %H:%M:%S")
+def _run_terminal(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount], customers_dict: Dict[str, Customer],
+                  journal: Optional[TransactionJournal] = None, promotions: Optional[PromotionEngine] = None) -> None:
+  console = current_console.get()
+  console.print("===========================")
+  console.print("Welcome to Monash MegaMart!")
+  console.print("===========================\n")
 
-  transaction = Transaction(current_datetime.split(" ")[0], current_datetime.split(" ")[1])
+  transaction = start_transaction(discounts_dict)
 
   while True:
-    print()
+    console.print()
     if transaction.customer:
-      print(':: {} - Member #{} ::'.format(transaction.customer.name, transaction.customer.membership_number))
-    print("MAIN MENU")
-    print("1. Scan items")
-    print("2. List scanned items")
-    print("3. Link member account")
-    print("4. Checkout")
-    print("5. Remove item")
-    print("6. Cancel transaction\n")
-
-    option = input(">>> Please enter an option number (between 1 to 6) to continue:\n")
+      console.print(':: {} - Member #{} ::'.format(transaction.customer.name, transaction.customer.membership_number))
+    console.print("MAIN MENU")
+    console.print("1. Scan items")
+    console.print("2. List scanned items")
+    console.print("3. Link member account")
+    console.print("4. Checkout")
+    console.print("5. Remove item")
+    console.print("6. Cancel transaction")
+    console.print("7. Bulk scan items\n")
+
+    option = console.input(">>> Please enter an option number (between 1 to 7) to continue:\n")
     if option == "1":
         while True:
-          transaction_line = scan_item(items_dict)
+          transaction_line = scan_item(pinned_items(transaction, items_dict))
           
           if transaction_line is None:
             break
           
           transaction.transaction_lines.append(transaction_line)
-          print("\nItem '{}' added, adding next item...\n".format(transaction_line.item.name))
+          console.print("\nItem '{}' added, adding next item...\n".format(transaction_line.item.name))
 
     elif option == "2":
       if len(transaction.transaction_lines) == 0:
-        print('No items are currently scanned!')
+        console.print('No items are currently scanned!')
         continue
 
-      print('Current items:\n')
+      console.print('Current items:\n')
       item_total, list_string, totals_string = list_items(transaction, discounts_dict)
 
-      print("")
-      print(list_string)
-      print(totals_string)
-      print("Note: Price shown excludes any surcharges and roundings.")
+      console.print("")
+      console.print(list_string)
+      console.print(totals_string)
+      console.print("Note: Price shown excludes any surcharges and roundings.")
 
     elif option == "3":
       if transaction.customer:
-        print('{}, entering another membership number other than your own will cause your current account to be unlinked from this transaction.'.format(transaction.customer.name))
+        console.print('{}, entering another membership number other than your own will cause your current account to be unlinked from this transaction.'.format(transaction.customer.name))
 
       customer = link_member_account(customers_dict)
       
@@ -324,37 +386,37 @@ def terminal(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_d
         continue
 
       transaction.customer = customer
-      print('Hi {}! Your member account (membership #{}) is now linked to this transaction.'.format(customer.name, customer.membership_number))
+      console.print('Hi {}! Your member account (membership #{}) is now linked to this transaction.'.format(customer.name, customer.membership_number))
 
     elif option == "4":
       if len(transaction.transaction_lines) == 0:
-        print('There are no items to checkout!')
+        console.print('There are no items to checkout!')
         continue
 
-      print('Current items:\n')
+      console.print('Current items:\n')
       item_total, list_string, totals_string = list_items(transaction, discounts_dict)
 
-      print("")
-      print(list_string)
-      print(totals_string)
-      print("Note: Price shown excludes any surcharges and roundings.")
+      console.print("")
+      console.print(list_string)
+      console.print(totals_string)
+      console.print("Note: Price shown excludes any surcharges and roundings.")
 
       fulfilment_type = select_fulfilment_type()
       if fulfilment_type is None:
-        print('Fulfilment type not selected. Returning to main menu.')
+        console.print('Fulfilment type not selected. Returning to main menu.')
         continue
 
       transaction.fulfilment_type = fulfilment_type
 
       payment_method = select_payment_method()
       if payment_method is None:
-        print('Payment method not selected. Returning to main menu.')
+        console.print('Payment method not selected. Returning to main menu.')
         continue
 
       transaction.payment_method = payment_method
 
       try:
-        transaction = checkout(transaction, items_dict, discounts_dict)
+        transaction = checkout(transaction, items_dict, discounts_dict, promotions)
 
         if transaction.final_total is None or transaction.final_total <= 0:
           transaction.finalised = True
@@ -365,15 +427,27 @@ def terminal(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_d
           transaction = tender_exact_payment(transaction)
 
         if transaction.finalised is False:
-          print('Payment cancelled. Returning to main menu.')
+          release_stock(transaction, items_dict)
+          console.print('Payment cancelled. Returning to main menu.')
           continue
 
-        print("Transaction successful! Generating receipt...\n")        
-        print(generate_receipt(transaction, discounts_dict))
+        if journal is not None:
+          try:
+            journal_write = journal.append(transaction)
+            # If asked to, the receipt is only printed once the transaction is durable in the journal
+            if journal.durable_receipts:
+              journal_write.wait_durable()
+          except Exception as e:
+            # The customer has paid, so the receipt is still printed, but the operator is told the sale was not journaled
+            console.print("Transaction was not saved to the journal. {}:".format(type(e).__name__), str(e))
+
+        console.print("Transaction successful! Generating receipt...\n")        
+        console.print(generate_receipt(transaction, discounts_dict))
         break
 
       except Exception as e:
-        print("{}:".format(type(e).__name__), str(e))
+        release_stock(transaction, items_dict)
+        console.print("{}:".format(type(e).__name__), str(e))
         # Uncomment to print out stack trace if required for debugging
         # import traceback
         # traceback.print_exc()
@@ -381,26 +455,44 @@ def terminal(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_d
 
     elif option == "5":
       if len(transaction.transaction_lines) == 0:
-        print('No items are available to remove!')
+        console.print('No items are available to remove!')
         continue
 
-      print('Current items:\n')
+      console.print('Current items:\n')
       item_total, list_string, totals_string = list_items(transaction, discounts_dict)
 
-      print("")
-      print(list_string)
+      console.print("")
+      console.print(list_string)
 
       line_number, removed_transaction_line = remove_transaction_line(transaction)
       if line_number is None or removed_transaction_line is None:
-        print("\nNo item was removed.\n")
+        console.print("\nNo item was removed.\n")
         continue
 
-      print("\nItem #{} - '{}' removed.\n".format(line_number, removed_transaction_line.item.name))
+      console.print("\nItem #{} - '{}' removed.\n".format(line_number, removed_transaction_line.item.name))
 
     elif option == "6":
-        print("Transaction cancelled.")
-        print("Thank you for shopping at Monash MegaMart!")
+        release_stock(transaction, items_dict)
+        console.print("Transaction cancelled.")
+        console.print("Thank you for shopping at Monash MegaMart!")
         break
 
+    elif option == "7":
+      path = console.input("\n>>> Enter the path of a file of item codes, or leave it empty to enter them here and finish with an empty line:\n")
+      try:
+        if path:
+          with open(path) as stream:
+            transaction_lines, rejected = scan_items_bulk(pinned_items(transaction, items_dict), stream)
+        else:
+          transaction_lines, rejected = scan_items_bulk(pinned_items(transaction, items_dict), iter(console.input, ''))
+      except OSError as e:
+        console.print('The file could not be read: {}'.format(e))
+        continue
+
+      transaction.transaction_lines.extend(transaction_lines)
+      console.print("\n{} item line(s) added.".format(len(transaction_lines)))
+      if rejected:
+        console.print("{} code(s) were not recognised and were skipped: {}".format(len(rejected), ' '.join(rejected)))
+
     else:
-        print("Your input is invalid. Please try again.")
+        console.print("Your input is invalid. Please try again.")
@@ -0,0 +1,269 @@
+"""
+Serves many checkout lanes from one process over a local socket, one lane session per connection.
+
+Each request is a single line, and each response is zero or more lines of output followed by a status line,
+either 'OK' or 'ERR <exception name>: <message>'.
+
+  SCAN <item id> [<quantity>]            Scan an item (quantity defaults to 1)
+  BULK <item id>[x<quantity>] ...        Scan many items at once, e.g. 'BULK 1 2x3 4', skipping and reporting unknown codes
+  LIST                                   List scanned items
+  LINK <membership number>               Link a member account
+  REMOVE <line number>                   Remove an item
+  CHECKOUT <fulfilment> <payment> [<amount tendered>]
+                                         Check out, e.g. 'CHECKOUT pickup cash 20.00' or 'CHECKOUT delivery credit'
+  CANCEL                                 Cancel the transaction and start a new one
+  QUIT                                   Close the connection
+
+Finalised transactions are appended to a transaction journal if one is given. Receipts are sent once a transaction is queued for the journal,
+or only once it is durable on disk if --durable-receipts is given.
+If a metrics file is given, checkout is instrumented and its per-stage metrics are written to the file every few seconds (see instrumentation.py).
+If a restriction policy file is given, it replaces the default restricted categories (see RestrictionPolicy.load).
+If a promotions file is given, every lane checks out with its promotions (see PromotionEngine.load).
+
+Usage: python megamart_server.py [--host HOST] [--port PORT] [--unix PATH] [--journal PATH [--durable-receipts]] [--metrics PATH] [--restrictions PATH] [--promotions PATH]
+"""
+import argparse
+import asyncio
+from typing import Dict, List, Optional, Tuple
+from FulfilmentType import FulfilmentType
+from PaymentMethod import PaymentMethod
+from Transaction import Transaction
+from TransactionLine import TransactionLine
+from Item import Item
+from Customer import Customer
+from Discount import Discount
+from TransactionJournal import JournalWrite, TransactionJournal
+from PromotionEngine import PromotionEngine
+from RestrictionPolicy import RestrictionPolicy
+
+import instrumentation
+import megadata
+import megamart
+from megamart import checkout, pinned_items, release_stock
+from megamart_base import generate_receipt, list_items, load_catalog, scan_items_bulk, settle_payment, start_transaction
+
+
+class LaneSession:
+  """The state of one lane, equivalent to a single run of megamart_base.terminal."""
+
+  def __init__(self, items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount], customers_dict: Dict[str, Customer],
+               journal: Optional[TransactionJournal] = None, promotions: Optional[PromotionEngine] = None):
+    self.items_dict = items_dict
+    self.discounts_dict = discounts_dict
+    self.customers_dict = customers_dict
+    self.journal = journal
+    # Promotions the lane checks out with, if any. LIST shows prices without them.
+    self.promotions = promotions
+    # The journal write of the last transaction checked out, which its receipt waits on if the journal has durable_receipts set
+    self.journal_write: Optional[JournalWrite] = None
+    self.transaction: Transaction = start_transaction(discounts_dict)
+
+  def handle(self, command: str, args: List[str]) -> List[str]:
+    """Runs one command and returns its output lines. Raises an exception if the command fails."""
+    handler = getattr(self, 'do_' + command.lower(), None)
+    if handler is None:
+      raise Exception("Unknown command '{}'.".format(command))
+    return handler(*args)
+
+  def do_scan(self, item_id: str, quantity: str = '1') -> List[str]:
+    items_dict = pinned_items(self.transaction, self.items_dict)
+    if item_id not in items_dict:
+      raise Exception('Item with the provided ID was not found.')
+    if not quantity.isdigit() or int(quantity) <= 0:
+      raise Exception('The provided quantity is not a whole number that is at least 1.')
+
+    transaction_line = TransactionLine(items_dict[item_id][0], int(quantity))
+    self.transaction.transaction_lines.append(transaction_line)
+    return ["Item '{}' added.".format(transaction_line.item.name)]
+
+  def do_bulk(self, *tokens: str) -> List[str]:
+    transaction_lines, rejected = scan_items_bulk(pinned_items(self.transaction, self.items_dict), [' '.join(tokens)])
+    self.transaction.transaction_lines.extend(transaction_lines)
+
+    output = ['{} item line(s) added.'.format(len(transaction_lines))]
+    if rejected:
+      output.append('{} code(s) were not recognised and were skipped: {}'.format(len(rejected), ' '.join(rejected)))
+    return output
+
+  def do_list(self) -> List[str]:
+    if len(self.transaction.transaction_lines) == 0:
+      return ['No items are currently scanned!']
+
+    item_total, list_string, totals_string = list_items(self.transaction, self.discounts_dict)
+    return (list_string + totals_string).split('\n')
+
+  def do_link(self, membership_number: str) -> List[str]:
+    if membership_number not in self.customers_dict:
+      raise Exception('The membership number you provided was not found.')
+
+    customer = self.customers_dict[membership_number]
+    self.transaction.customer = customer
+    return ['Hi {}! Your member account (membership #{}) is now linked to this transaction.'.format(customer.name, customer.membership_number)]
+
+  def do_remove(self, line_number: str) -> List[str]:
+    max_line_number = len(self.transaction.transaction_lines)
+    if not line_number.isdigit() or not (0 < int(line_number) <= max_line_number):
+      raise Exception('The provided line number is not a whole number between 1 and {} inclusive.'.format(max_line_number))
+
+    removed_transaction_line = self.transaction.transaction_lines.pop(int(line_number) - 1)
+    return ["Item #{} - '{}' removed.".format(line_number, removed_transaction_line.item.name)]
+
+  def do_checkout(self, fulfilment: str, payment: str, amount: Optional[str] = None) -> List[str]:
+    if len(self.transaction.transaction_lines) == 0:
+      raise Exception('There are no items to checkout!')
+
+    self.transaction.fulfilment_type = _enum_member(FulfilmentType, fulfilment)
+    self.transaction.payment_method = _enum_member(PaymentMethod, payment)
+
+    try:
+      transaction = checkout(self.transaction, self.items_dict, self.discounts_dict, self.promotions)
+
+      if transaction.final_total is None or transaction.final_total <= 0:
+        transaction.finalised = True
+      elif transaction.payment_method == PaymentMethod.CASH:
+        settle_payment(transaction, _tendered_amount(amount))
+      else:
+        # Assume exact amount will always be tendered when paying by credit/debit card
+        settle_payment(transaction, transaction.final_total)
+    except Exception:
+      release_stock(self.transaction, self.items_dict)
+      raise
+
+    output = []
+    if self.journal is not None:
+      try:
+        journal_write = self.journal.append(transaction)
+        if self.journal.durable_receipts:
+          self.journal_write = journal_write
+      except Exception as e:
+        # The customer has paid, so the receipt is still given
+        output.append(_not_journaled(e))
+
+    receipt = generate_receipt(transaction, self.discounts_dict)
+    self.transaction = start_transaction(self.discounts_dict)
+    return output + receipt.rstrip('\n').split('\n')
+
+  def do_cancel(self) -> List[str]:
+    release_stock(self.transaction, self.items_dict)
+    self.transaction = start_transaction(self.discounts_dict)
+    return ['Transaction cancelled.']
+
+
+def _tendered_amount(amount: Optional[str]) -> float:
+  try:
+    split_amount_string = amount.split(".")
+    if len(split_amount_string) == 2 and len(split_amount_string[1]) > 2:
+      raise Exception()
+
+    tendered = float(amount)
+    if tendered < 0:
+      raise Exception()
+  except Exception:
+    raise Exception('The tendered amount must be given, cannot be negative and cannot be more than two decimal places.')
+
+  return tendered
+
+
+def _not_journaled(error: Exception) -> str:
+  return 'Transaction was not saved to the journal. {}: {}'.format(type(error).__name__, error)
+
+
+def _enum_member(enum_type, name: str):
+  for member in enum_type:
+    if name.lower() in (member.name.lower(), member.value.lower()):
+      return member
+  raise Exception("'{}' is not one of: {}.".format(name, ', '.join(member.value for member in enum_type)))
+
+
+async def handle_lane(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, items_dict: Dict[str, Tuple[Item, int, Optional[int]]],
+                      discounts_dict: Dict[str, Discount], customers_dict: Dict[str, Customer], journal: Optional[TransactionJournal] = None,
+                      promotions: Optional[PromotionEngine] = None) -> None:
+  session = LaneSession(items_dict, discounts_dict, customers_dict, journal, promotions)
+  writer.write(b'Welcome to Monash MegaMart!\nOK\n')
+
+  try:
+    while True:
+      request = await reader.readline()
+      if not request:
+        break
+
+      words = request.decode('utf-8').split()
+      if not words:
+        continue
+      if words[0].upper() == 'QUIT':
+        break
+
+      try:
+        lines = session.handle(words[0], words[1:])
+        lines.append('OK')
+      except Exception as e:
+        lines = ['ERR {}: {}'.format(type(e).__name__, e)]
+
+      journal_write, session.journal_write = session.journal_write, None
+      if journal_write is not None:
+        # With durable_receipts, a receipt is only sent once its transaction is durable. Waiting happens off the event loop, so other lanes carry on meanwhile.
+        try:
+          await asyncio.get_running_loop().run_in_executor(None, journal_write.wait_durable)
+        except Exception as e:
+          lines.insert(0, _not_journaled(e))
+
+      writer.write(('\n'.join(lines) + '\n').encode('utf-8'))
+      await writer.drain()
+  finally:
+    # Stock taken by a lane that disconnects mid-checkout goes back to the shelf
+    release_stock(session.transaction, items_dict)
+    writer.close()
+
+
+async def serve(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount], customers_dict: Dict[str, Customer],
+                host: str = '127.0.0.1', port: int = 8765, unix_path: Optional[str] = None, journal: Optional[TransactionJournal] = None,
+                promotions: Optional[PromotionEngine] = None) -> asyncio.AbstractServer:
+  """Starts serving lanes and returns the server, which keeps running until closed. Every lane checks out with the promotions, if given."""
+  async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    await handle_lane(reader, writer, items_dict, discounts_dict, customers_dict, journal, promotions)
+
+  if unix_path is not None:
+    return await asyncio.start_unix_server(handle, path=unix_path)
+  return await asyncio.start_server(handle, host, port)
+
+
+async def write_metrics_every(path: str, interval: float) -> None:
+  while True:
+    await asyncio.sleep(interval)
+    instrumentation.write_metrics(path)
+
+
+async def main(args: argparse.Namespace) -> None:
+  if args.restrictions:
+    megamart.restriction_policy = RestrictionPolicy.load(args.restrictions)
+  promotions = PromotionEngine.load(args.promotions) if args.promotions else None
+  journal = TransactionJournal(args.journal, durable_receipts=args.durable_receipts) if args.journal else None
+  metrics_writer = None
+  if args.metrics:
+    instrumentation.enable()
+    metrics_writer = asyncio.ensure_future(write_metrics_every(args.metrics, args.metrics_interval))
+  try:
+    items, discounts = load_catalog(megadata.items, megadata.discounts)
+    server = await serve(items, discounts, megadata.customers, args.host, args.port, args.unix, journal, promotions)
+    async with server:
+      await server.serve_forever()
+  finally:
+    if journal is not None:
+      journal.close()
+    if metrics_writer is not None:
+      metrics_writer.cancel()
+      instrumentation.write_metrics(args.metrics)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Serve Monash MegaMart checkout lanes over a local socket.')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8765)
+  parser.add_argument('--unix', help='serve on this unix socket path instead of TCP')
+  parser.add_argument('--journal', help='append finalised transactions to this transaction journal')
+  parser.add_argument('--durable-receipts', action='store_true', help='only send a receipt once its transaction is durable in the journal')
+  parser.add_argument('--metrics', help='instrument checkout and write its metrics to this file (JSON if it ends in .json, otherwise Prometheus text)')
+  parser.add_argument('--metrics-interval', type=float, default=10.0, help='seconds between writes of the metrics file')
+  parser.add_argument('--restrictions', help='JSON restriction policy to use instead of the default restricted categories')
+  parser.add_argument('--promotions', help='JSON list of promotions every lane checks out with')
+  asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,63 @@
+"""
+Measures the memory taken by the catalog model objects, in bytes per Item, Customer and Discount, on data from the workload generator.
+
+Each model is built into a list with tracemalloc tracing, and the memory still allocated afterwards (less the list itself) is divided by
+the number of objects. This counts everything the objects keep alive, e.g. their names and category lists, but nothing kept by the
+dictionaries they are usually stored in.
+
+Usage: python memory_benchmark.py [--items N] [--customers N] [--output FILE]
+"""
+import argparse
+import gc
+import json
+import sys
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+from workload import generate_customers, generate_discounts, generate_items
+
+
+def bytes_per_object(build: Callable[[], List[object]]) -> float:
+  """The memory allocated, and still held, by the objects build returns, per object."""
+  gc.collect()
+  tracemalloc.start()
+  try:
+    before = tracemalloc.get_traced_memory()[0]
+    objects = build()
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - before - sys.getsizeof(objects)
+  finally:
+    tracemalloc.stop()
+  return held / len(objects) if objects else 0.0
+
+
+def measure(item_count: int = 100000, customer_count: int = 100000, seed: int = 0) -> Dict[str, float]:
+  """Bytes per object of each model."""
+  items = [item for (item, _, _) in generate_items(item_count, seed)]
+  return {
+    'item': bytes_per_object(lambda: [item for (item, _, _) in generate_items(item_count, seed)]),
+    'customer': bytes_per_object(lambda: list(generate_customers(customer_count, seed))),
+    'discount': bytes_per_object(lambda: list(generate_discounts(items, seed, discount_ratio=1.0))),
+  }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description='Measure the memory taken per catalog model object.')
+  parser.add_argument('--items', type=int, default=100000)
+  parser.add_argument('--customers', type=int, default=100000)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--output', help='also write the results to this JSON file')
+  args = parser.parse_args(argv)
+
+  results = measure(args.items, args.customers, args.seed)
+  print('{:<10} {:>14}'.format('MODEL', 'BYTES/OBJECT'))
+  for (model, size) in results.items():
+    print('{:<10} {:>14.1f}'.format(model, size))
+
+  if args.output:
+    with open(args.output, 'w') as output_file:
+      json.dump(results, output_file, indent=2)
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
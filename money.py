@@ -0,0 +1,33 @@
+from typing import Optional
+
+
+def to_cents(amount: Optional[float]) -> Optional[int]:
+  """Converts a dollar amount to a whole number of cents, rounded to the nearest cent. None is passed through."""
+  if amount is None:
+    return None
+  return int(round(amount * 100))
+
+
+def from_cents(cents: Optional[int]) -> Optional[float]:
+  """Converts a whole number of cents back to a dollar amount for display. None is passed through."""
+  if cents is None:
+    return None
+  return cents / 100
+
+
+class DollarsField:
+  """
+  Class attribute that stores a money value as integer cents in '<name>_cents' on the instance,
+  while '<name>' keeps reading and accepting dollar floats.
+  """
+
+  def __set_name__(self, owner: type, name: str) -> None:
+    self.cents_name = name + '_cents'
+
+  def __get__(self, instance: object, owner: Optional[type] = None):
+    if instance is None:
+      return self
+    return from_cents(getattr(instance, self.cents_name, None))
+
+  def __set__(self, instance: object, amount: Optional[float]) -> None:
+    setattr(instance, self.cents_name, to_cents(amount))
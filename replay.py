@@ -0,0 +1,172 @@
+"""
+Recomputes the totals of journaled transactions by checking their baskets out again, e.g. for an end-of-day audit or to see
+what a different set of discounts would have done.
+
+The journal is split into ranges of records that are replayed by a pool of worker processes, each against its own copy of a
+snapshot of the items and discounts dictionaries, and their summaries are merged.
+Stock is not checked: every item in the snapshot is given an unlimited stock level, as the baskets were already checked against
+the stock of the time when they were journaled, and the stock left now would fail baskets that sold it. The summary therefore only
+reflects pricing, and does not depend on how the journal is split.
+
+Usage: python replay.py JOURNAL [--processes N]
+"""
+import argparse
+import multiprocessing
+import sys
+from typing import Dict, List, Optional, Tuple
+from Item import Item
+from Discount import Discount
+from DiscountSchedule import DiscountSchedule
+from ReplaySummary import ReplaySummary
+from TransactionJournal import JournalRecord, read_journal, record_offsets
+
+from megamart import checkout_batch
+
+# The stock level every item is replayed with, so no basket fails for stock that was sold after it
+UNLIMITED_STOCK = sys.maxsize
+
+# The snapshot each worker process replays against, set once per process by _init_worker
+_items_dict: Optional[Dict[str, Tuple[Item, int, Optional[int]]]] = None
+_discounts_dict: Optional[Dict[str, Discount]] = None
+
+
+def snapshot(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount]) -> Tuple[Dict[str, Tuple[Item, int, Optional[int]]], Dict[str, Discount]]:
+  """
+  Copies the items and discounts dictionaries into plain dictionaries that can be sent to worker processes.
+  Every item's stock level is set to UNLIMITED_STOCK, and its purchase quantity limit is kept.
+  A DiscountSchedule is copied as a schedule, so that each transaction is replayed with the discounts valid when it took place.
+  """
+  items = items_dict.snapshot() if hasattr(items_dict, 'snapshot') else items_dict
+  items_snapshot = {item_id: (item, UNLIMITED_STOCK, limit) for (item_id, (item, _, limit)) in items.items()}
+  if isinstance(discounts_dict, DiscountSchedule):
+    return items_snapshot, DiscountSchedule(discounts_dict.discounts())
+  return items_snapshot, dict(discounts_dict)
+
+
+def summarise(records: List[JournalRecord], items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount]) -> ReplaySummary:
+  """Checks out the baskets of the given journal records again and adds up the results."""
+  summary = ReplaySummary()
+  transactions = []
+  for record in records:
+    try:
+      transactions.append(record.to_transaction(items_dict))
+    except KeyError:
+      # The item is no longer in the catalog, which checkout reports the same way
+      transactions.append(None)
+      summary.errors['Exception'] = summary.errors.get('Exception', 0) + 1
+
+  batch = checkout_batch([transaction for transaction in transactions if transaction is not None], items_dict, discounts_dict)
+  summary.transactions = len(records)
+  for error in batch.errors.values():
+    summary.errors[type(error).__name__] = summary.errors.get(type(error).__name__, 0) + 1
+
+  replayed = iter(enumerate(batch.transactions))
+  for (record, transaction) in zip(records, transactions):
+    if transaction is None:
+      continue
+    index, transaction = next(replayed)
+    if index in batch.errors:
+      continue
+
+    if transaction.final_total_cents != record.final_total_cents:
+      summary.mismatches += 1
+
+    summary.subtotal_cents += transaction.all_items_subtotal_cents
+    summary.surcharge_cents += transaction.fulfilment_surcharge_amount_cents
+    summary.rounding_cents += transaction.rounding_amount_applied_cents
+    summary.final_total_cents += transaction.final_total_cents
+    summary.savings_cents += transaction.amount_saved_cents
+    summary.items_purchased += transaction.total_items_purchased
+
+    line = batch.line_offsets[index]
+    for transaction_line in transaction.transaction_lines:
+      totals = summary.by_item.setdefault(transaction_line.item.id, [0, 0, 0])
+      totals[0] += batch.line_quantities[line]
+      totals[1] += batch.line_final_costs_cents[line]
+      totals[2] += batch.line_savings_cents[line]
+      line += 1
+
+    totals = summary.by_payment_method.setdefault(transaction.payment_method, [0, 0])
+    totals[0] += 1
+    totals[1] += transaction.final_total_cents
+
+  return summary
+
+
+def _init_worker(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount]) -> None:
+  global _items_dict, _discounts_dict
+  _items_dict, _discounts_dict = items_dict, discounts_dict
+
+
+def _replay_range(args: Tuple[str, int, Optional[int]]) -> ReplaySummary:
+  path, start, end = args
+  return summarise(list(read_journal(path, start, end)), _items_dict, _discounts_dict)
+
+
+def replay(path: str, items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount],
+           processes: Optional[int] = None, records_per_task: int = 10000) -> ReplaySummary:
+  """
+  Replays every transaction in the journal at path against a snapshot of the given items and discounts dictionaries.
+  Uses a pool of the given number of processes (one per CPU by default), or replays in this process if processes is 1.
+  """
+  items_snapshot, discounts_snapshot = snapshot(items_dict, discounts_dict)
+  offsets = record_offsets(path)
+  if not offsets:
+    return ReplaySummary()
+
+  processes = processes or multiprocessing.cpu_count()
+  # Enough ranges to keep every worker busy until the end, but each large enough to amortise reading and sending its summary
+  records_per_task = max(1, min(records_per_task, -(-len(offsets) // (processes * 4))))
+  starts = offsets[::records_per_task]
+  ranges = [(path, start, end) for (start, end) in zip(starts, starts[1:] + [None])]
+
+  summary = ReplaySummary()
+  if processes == 1:
+    _init_worker(items_snapshot, discounts_snapshot)
+    for part in map(_replay_range, ranges):
+      summary.merge(part)
+    return summary
+
+  with multiprocessing.Pool(processes, _init_worker, (items_snapshot, discounts_snapshot)) as pool:
+    # Merged in journal order, so the per-item and per-payment method tables come out in the same order however the work was split
+    for part in pool.imap(_replay_range, ranges):
+      summary.merge(part)
+  return summary
+
+
+def format_summary(summary: ReplaySummary) -> str:
+  lines = [
+    'Transactions replayed:           {}'.format(summary.transactions),
+    'Failed checkouts:                {}'.format(sum(summary.errors.values())),
+  ]
+  for (name, count) in sorted(summary.errors.items()):
+    lines.append('  {:<30}{}'.format(name, count))
+  lines += [
+    'Totals differing from journal:   {}'.format(summary.mismatches),
+    'Items purchased:                 {}'.format(summary.items_purchased),
+    'Subtotal ($):                    {:.2f}'.format(summary.subtotal_cents / 100),
+    'Surcharges ($):                  {:.2f}'.format(summary.surcharge_cents / 100),
+    'Rounding ($):                    {:.2f}'.format(summary.rounding_cents / 100),
+    'Final total ($):                 {:.2f}'.format(summary.final_total_cents / 100),
+    'Savings ($):                     {:.2f}'.format(summary.savings_cents / 100),
+    '',
+    'BY PAYMENT METHOD',
+  ]
+  for (payment_method, (count, total_cents)) in summary.by_payment_method.items():
+    lines.append('{:<10}{:>10} {:>14.2f}'.format(payment_method.value, count, total_cents / 100))
+  lines += ['', 'BY ITEM']
+  for (item_id, (quantity, cost_cents, savings_cents)) in sorted(summary.by_item.items()):
+    lines.append('{:<10}{:>10} {:>14.2f} {:>12.2f}'.format(item_id, quantity, cost_cents / 100, savings_cents / 100))
+  return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+  import megadata
+  from megamart_base import load_catalog
+
+  parser = argparse.ArgumentParser(description='Recompute the totals of the transactions in a transaction journal.')
+  parser.add_argument('journal')
+  parser.add_argument('--processes', type=int, help='number of worker processes (default: one per CPU)')
+  args = parser.parse_args()
+  items, discounts = load_catalog(megadata.items, megadata.discounts)
+  print(format_summary(replay(args.journal, items, discounts, args.processes)))
@@ -1,5 +1,29 @@
+import json
+import os
+import tempfile
 import unittest
 import megamart
+import megamart_server
+import TransactionJournal
+import replay
+import MappedCatalog
+import io
+import catalog_import
+import megamart_base
+import benchmark
+import workload
+import instrumentation
+import headless
+import loadtest
+import contextlib
+import pickle
+import memory_benchmark
+from Promotion import Promotion
+from PromotionType import PromotionType
+from PromotionEngine import PromotionEngine
+from DiscountSchedule import DiscountSchedule
+from RestrictionPolicy import RestrictionPolicy
+from CatalogStore import CatalogStore, SnapshotDiscounts
 
 class TestMegaMart(unittest.TestCase):
 
@@ -75,7 +99,967 @@ class TestMegaMart(unittest.TestCase):
     with self.assertRaises(Exception):
       megamart.checkout(transaction4, items_dict, discounts_dict)
 
-    
+    #None of these have a payment method, but the line that does not check out is reported first, as round_off_subtotal used to raise last
+    with self.assertRaises(megamart.RestrictedItemException):
+      megamart.checkout(transaction2, items_dict, discounts_dict)
+    with self.assertRaises(megamart.PurchaseLimitExceededException):
+      megamart.checkout(transaction3, items_dict, discounts_dict)
+    with self.assertRaises(megamart.InsufficientStockException):
+      megamart.checkout(transaction4, items_dict, discounts_dict)
+
+  def test_checkout_batch(self):
+    item1 = (megamart.Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits']), 20, None)
+    item2 = (megamart.Item('2', 'Beer', 16.00, ['Alcohol']), 12, 2)
+    item3 = (megamart.Item('3', 'Laundry Detergent', 9.98, ['Household', 'Cleaning']), 5, None)
+    items_dict = {'1': item1, '2': item2, '3': item3}
+    discounts_dict = {'1': megamart.Discount(megamart.DiscountType.PERCENTAGE, 20, '1')}
+    adult = megamart.Customer('123', 'Alice', '01/08/2003', True, None)
+
+    def make_transaction(customer, lines):
+      transaction = megamart.Transaction('02/08/2023', '12:00:00')
+      transaction.customer = customer
+      transaction.transaction_lines = [megamart.TransactionLine(items_dict[item_id][0], quantity) for (item_id, quantity) in lines]
+      transaction.payment_method = megamart.PaymentMethod.CASH
+      transaction.fulfilment_type = megamart.FulfilmentType.PICKUP
+      return transaction
+
+    baskets = [
+      (adult, [('1', 3), ('2', 1), ('3', 2)]),
+      (None, [('1', 1), ('2', 1)]),
+      (adult, [('3', 6)]),
+      (adult, [('1', 2), ('1', 1)]),
+    ]
+
+    result = megamart.checkout_batch([make_transaction(customer, lines) for (customer, lines) in baskets], items_dict, discounts_dict)
+
+    # Errors are collected per transaction rather than aborting the batch
+    self.assertEqual(sorted(result.errors), [1, 2])
+    self.assertIsInstance(result.errors[1], megamart.RestrictedItemException)
+    self.assertIsInstance(result.errors[2], megamart.InsufficientStockException)
+
+    # Successful transactions match single transaction checkout exactly
+    for index in (0, 3):
+      expected = megamart.checkout(make_transaction(*baskets[index]), items_dict, discounts_dict)
+      actual = result.transactions[index]
+      self.assertEqual(actual.all_items_subtotal, expected.all_items_subtotal)
+      self.assertEqual(actual.final_total, expected.final_total)
+      self.assertEqual(actual.amount_saved, expected.amount_saved)
+      self.assertEqual(actual.total_items_purchased, expected.total_items_purchased)
+
+    self.assertEqual(list(result.line_offsets), [0, 3, 3, 3, 5])
+    self.assertEqual(list(result.line_quantities), [3, 1, 2, 2, 1])
+    self.assertEqual(list(result.line_final_costs_cents), [1080, 1600, 1996, 720, 360])
+
+    # Items are only priced once they have checked out, so an invalid discount does not hide a purchase limit or stock problem
+    invalid_discounts = {
+      '2': megamart.Discount(megamart.DiscountType.FLAT, -1.50, '2'),
+      '3': megamart.Discount(megamart.DiscountType.PERCENTAGE, 0, '3'),
+    }
+    result = megamart.checkout_batch([make_transaction(adult, [('2', 3)]), make_transaction(adult, [('3', 6)]), make_transaction(adult, [('3', 1)])],
+                                     items_dict, invalid_discounts)
+    self.assertIsInstance(result.errors[0], megamart.PurchaseLimitExceededException)
+    self.assertIsInstance(result.errors[1], megamart.InsufficientStockException)
+    self.assertIs(type(result.errors[2]), Exception)
+
+    # A restricted item with an invalid discount cannot be purchased, whatever its discount. Line by line, a line that cannot be
+    # priced is still reported ahead of a restricted item scanned after it.
+    invalid_discounts['1'] = megamart.Discount(megamart.DiscountType.FLAT, 5.00, '1')
+    result = megamart.checkout_batch([make_transaction(None, [('2', 1)]), make_transaction(None, [('1', 1), ('2', 1)]),
+                                      make_transaction(None, [('2', 1), ('1', 1)])], items_dict, invalid_discounts)
+    self.assertIsInstance(result.errors[0], megamart.RestrictedItemException)
+    self.assertIs(type(result.errors[1]), Exception)
+    self.assertIsInstance(result.errors[2], megamart.RestrictedItemException)
+    with self.assertRaises(megamart.RestrictedItemException):
+      megamart.checkout(make_transaction(None, [('2', 1)]), items_dict, invalid_discounts)
+
+    # An Inventory's stock is taken for a run of transactions at once. When the run does not all fit, each takes its own in turn,
+    # and the one that runs out fails for the line checkout would fail it for.
+    inventory = megamart.Inventory([item1, item2, (item3[0], 4, None)])
+    result = megamart.checkout_batch([make_transaction(adult, [('3', 3), ('1', 1)]), make_transaction(adult, [('1', 15), ('3', 2)]),
+                                      make_transaction(adult, [('3', 1), ('1', 4)])], inventory, discounts_dict)
+    self.assertEqual(sorted(result.errors), [1])
+    self.assertEqual(str(result.errors[1]), 'Insufficient stock for item Laundry Detergent')
+    self.assertEqual(result.transactions[2].stock_reservation, {'3': 1, '1': 4})
+    self.assertEqual((inventory['1'][1], inventory['3'][1]), (15, 0))
+    self.assertEqual(list(result.line_offsets), [0, 2, 2, 4])
+
+    with self.assertRaises(Exception):
+      megamart.checkout_batch(None, items_dict, discounts_dict)
+
+  def test_checkout_totals_in_cents(self):
+    item1 = (megamart.Item('1', 'Laundry Detergent', 9.98, ['Household', 'Cleaning']), 1000, None)
+    item2 = (megamart.Item('2', 'Chewing Gum', 0.10, ['Confectionery']), 1000, None)
+    items_dict = {'1': item1, '2': item2}
+    discounts_dict = {'1': megamart.Discount(megamart.DiscountType.PERCENTAGE, 15, '1')}
+
+    transaction = megamart.Transaction('02/08/2023', '12:00:00')
+    transaction.transaction_lines = [megamart.TransactionLine(item1[0], 1) for _ in range(3)] + [megamart.TransactionLine(item2[0], 1) for _ in range(3)]
+    transaction.payment_method = megamart.PaymentMethod.CASH
+    transaction.fulfilment_type = megamart.FulfilmentType.PICKUP
+
+    # 9.98 less 15% is 8.483, which is 8.48 per unit
+    checkedout_transaction = megamart.checkout(transaction, items_dict, discounts_dict)
+    self.assertEqual(checkedout_transaction.all_items_subtotal_cents, 3 * 848 + 3 * 10)
+    self.assertEqual(checkedout_transaction.all_items_subtotal, 25.74)
+    self.assertEqual(checkedout_transaction.rounding_amount_applied, 0.01)
+    self.assertEqual(checkedout_transaction.final_total, 25.75)
+    self.assertEqual(checkedout_transaction.amount_saved, 4.50)
+    self.assertEqual(transaction.transaction_lines[0].final_cost, 8.48)
+
+    # Dollar amounts set on the models are stored as whole cents
+    self.assertEqual(megamart.Item('3', 'Something', 4.35, []).original_price_cents, 435)
+    self.assertEqual(megamart.Discount(megamart.DiscountType.FLAT, 1.15, '3').value_cents, 115)
+
+  def test_checkout_coalesces_lines(self):
+    item1 = (megamart.Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits']), 300, 250)
+    item2 = (megamart.Item('2', 'Vodka', 30.00, ['Alcohol']), 10, None)
+    item3 = (megamart.Item('3', 'Coffee Powder', 16.00, ['Coffee', 'Drinks']), 3, None)
+    items_dict = {'1': item1, '2': item2, '3': item3}
+    discounts_dict = {'1': megamart.Discount(megamart.DiscountType.FLAT, 0.50, '1')}
+
+    def transaction_of(*lines):
+      transaction = megamart.Transaction('02/08/2023', '12:00:00')
+      transaction.transaction_lines = [megamart.TransactionLine(items_dict[item_id][0], quantity) for (item_id, quantity) in lines]
+      transaction.payment_method = megamart.PaymentMethod.CREDIT
+      transaction.fulfilment_type = megamart.FulfilmentType.PICKUP
+      return transaction
+
+    # The same item scanned 200 times is checked once, and every line keeps its own final cost
+    stock_checks = []
+    original = megamart.is_item_sufficiently_stocked
+    megamart.is_item_sufficiently_stocked = lambda item, quantity, items: stock_checks.append(quantity) or original(item, quantity, items)
+    try:
+      transaction = megamart.checkout(transaction_of(*[('1', 1)] * 199 + [('1', 2)]), items_dict, discounts_dict)
+    finally:
+      megamart.is_item_sufficiently_stocked = original
+    self.assertEqual(stock_checks, [201])
+    self.assertEqual(transaction.all_items_subtotal, 804.00)
+    self.assertEqual([line.final_cost for line in transaction.transaction_lines[-2:]], [4.00, 8.00])
+
+    # Exceptions are the same as checking line by line: the first line that does not check out decides which is raised
+    with self.assertRaises(megamart.PurchaseLimitExceededException):
+      megamart.checkout(transaction_of(('1', 200), ('1', 60), ('2', 1)), items_dict, discounts_dict)
+    with self.assertRaises(megamart.RestrictedItemException):
+      megamart.checkout(transaction_of(('2', 1), ('1', 200), ('1', 60)), items_dict, discounts_dict)
+    with self.assertRaises(megamart.InsufficientStockException):
+      megamart.checkout(transaction_of(('3', 2), ('1', 1), ('3', 2), ('1', 300)), items_dict, discounts_dict)
+    with self.assertRaises(megamart.PurchaseLimitExceededException):
+      megamart.checkout(transaction_of(('3', 2), ('1', 1), ('1', 300), ('3', 2)), items_dict, discounts_dict)
+    with self.assertRaisesRegex(Exception, 'Purchase quantity is not a positive integer'):
+      megamart.checkout(transaction_of(('1', 0), ('1', 2)), items_dict, discounts_dict)
+
+  def test_running_totals(self):
+    item1 = (megamart.Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits']), 20, None)
+    item2 = (megamart.Item('2', 'Coffee Powder', 16.00, ['Coffee', 'Drinks']), 12, 2)
+    items_dict = {'1': item1, '2': item2}
+    price_book = megamart.PriceBook({'1': megamart.Discount(megamart.DiscountType.PERCENTAGE, 20, '1')})
+
+    transaction = megamart.Transaction('02/08/2023', '12:00:00')
+    megamart.track_running_totals(transaction, price_book)
+    transaction.transaction_lines.append(megamart.TransactionLine(item1[0], 2))
+    transaction.transaction_lines.append(megamart.TransactionLine(item2[0], 1))
+    transaction.transaction_lines.append(megamart.TransactionLine(item1[0], 1))
+
+    lines = megamart.running_totals(transaction, price_book)
+    self.assertEqual((lines.subtotal_cents, lines.savings_cents, lines.total_quantity), (2680, 270, 4))
+    self.assertEqual(lines.item_quantities, {'1': 3, '2': 1})
+
+    transaction.transaction_lines.pop(0)
+    self.assertEqual((lines.subtotal_cents, lines.savings_cents, lines.total_quantity), (1960, 90, 2))
+
+    # Changing a discount prices the lines of that item again, and only those
+    priced_item_ids = []
+    pricer = lines.pricer
+    lines.pricer = lambda item: priced_item_ids.append(item.id) or pricer(item)
+    price_book['2'] = megamart.Discount(megamart.DiscountType.FLAT, 1.50, '2')
+    self.assertEqual(megamart.running_totals(transaction, price_book).subtotal_cents, 1810)
+    self.assertEqual(priced_item_ids, ['2'])
+    price_book['3'] = megamart.Discount(megamart.DiscountType.FLAT, 1.00, '3')
+    self.assertEqual((megamart.running_totals(transaction, price_book).subtotal_cents, lines.savings_cents), (1810, 240))
+    self.assertEqual(priced_item_ids, ['2'])
+    lines.pricer = pricer
+
+    # Running totals are not used for other discounts dictionaries
+    self.assertEqual(megamart.running_totals(transaction, {}), None)
+
+    transaction.payment_method = megamart.PaymentMethod.CASH
+    transaction.fulfilment_type = megamart.FulfilmentType.PICKUP
+    checkedout_transaction = megamart.checkout(transaction, items_dict, price_book)
+    self.assertEqual(checkedout_transaction.all_items_subtotal, 18.10)
+    self.assertEqual(checkedout_transaction.final_total, 18.10)
+    self.assertEqual(checkedout_transaction.amount_saved, 2.40)
+    self.assertEqual(checkedout_transaction.total_items_purchased, 2)
+
+    # Limits are still enforced against the total quantity of each item
+    transaction.transaction_lines.append(megamart.TransactionLine(item2[0], 2))
+    with self.assertRaises(megamart.PurchaseLimitExceededException):
+      megamart.checkout(transaction, items_dict, price_book)
+
+    # A line with no quantity is rejected as it is without running totals, however many of the item the other lines have
+    transaction.transaction_lines = [megamart.TransactionLine(item1[0], 0), megamart.TransactionLine(item1[0], 5)]
+    self.assertIsNotNone(megamart.running_totals(transaction, price_book))
+    with self.assertRaisesRegex(Exception, 'Purchase quantity is not a positive integer'):
+      megamart.checkout(transaction, items_dict, price_book)
+
+    # Each transaction has its own lines
+    self.assertEqual(len(megamart.Transaction('02/08/2023', '12:00:00').transaction_lines), 0)
+
+  def test_transaction_lines_store(self):
+    item1 = megamart.Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = megamart.Item('2', 'Coffee Powder', 16.00, ['Coffee', 'Drinks'])
+    transaction = megamart.Transaction('02/08/2023', '12:00:00')
+    transaction.transaction_lines = [megamart.TransactionLine(item1, 2), megamart.TransactionLine(item2, 1), megamart.TransactionLine(item1, 3)]
+
+    lines = transaction.transaction_lines
+    self.assertEqual([(line.item.id, line.quantity) for line in lines], [('1', 2), ('2', 1), ('1', 3)])
+    self.assertIs(lines[2].item, item1)
+    self.assertEqual(lines[0].final_cost, None)
+
+    # Writes through a line go back to the store
+    lines[0].final_cost = 9.00
+    self.assertEqual(lines[0].final_cost_cents, 900)
+    lines[1].quantity = 2
+    self.assertEqual(lines.item_quantities, {'1': 5, '2': 2})
+
+    # Popped lines stay valid after the row is gone
+    removed = lines.pop(0)
+    self.assertEqual((removed.item.id, removed.quantity, removed.final_cost), ('1', 2, 9.00))
+    self.assertEqual([(line.item.id, line.quantity) for line in lines], [('2', 2), ('1', 3)])
+    self.assertEqual(lines.total_quantity, 5)
+
+    del lines[:]
+    self.assertEqual((len(lines), lines.total_quantity, lines.item_quantities), (0, 0, {}))
+
+  def test_inventory_stock_commit(self):
+    item1 = megamart.Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = megamart.Item('2', 'Coffee Powder', 16.00, ['Coffee', 'Drinks'])
+    inventory = megamart.Inventory([(item1, 20, None), (item2, 1, 2)])
+
+    def make_transaction(lines):
+      transaction = megamart.Transaction('02/08/2023', '12:00:00')
+      transaction.transaction_lines = [megamart.TransactionLine(item, quantity) for (item, quantity) in lines]
+      transaction.payment_method = megamart.PaymentMethod.CREDIT
+      transaction.fulfilment_type = megamart.FulfilmentType.PICKUP
+      return transaction
+
+    transaction = megamart.checkout(make_transaction([(item1, 3), (item2, 1)]), inventory, {})
+    self.assertEqual((inventory['1'][1], inventory['2'][1]), (17, 0))
+
+    # A basket that cannot be fully supplied takes nothing
+    with self.assertRaises(megamart.InsufficientStockException):
+      megamart.checkout(make_transaction([(item1, 1), (item2, 1)]), inventory, {})
+    self.assertEqual((inventory['1'][1], inventory['2'][1]), (17, 0))
+
+    # Checking out the same transaction again does not take its stock twice, and releasing puts it back
+    megamart.checkout(transaction, inventory, {})
+    self.assertEqual(inventory['1'][1], 17)
+    megamart.release_stock(transaction, inventory)
+    self.assertEqual((inventory['1'][1], inventory['2'][1]), (20, 1))
+
+    with self.assertRaises(megamart.InsufficientStockException):
+      inventory.commit({'1': 5, '2': 2})
+    self.assertEqual(inventory.commit({'1': 5}), {'1': 5})
+    self.assertEqual(inventory['1'][1], 15)
+
+  def test_lane_session(self):
+    item1 = megamart.Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    items_dict = megamart.Inventory([(item1, 5, None)])
+    discounts_dict = megamart.PriceBook()
+    customers_dict = {'123': megamart.Customer('123', 'Alice', '01/08/2005', True, None)}
+    session = megamart_server.LaneSession(items_dict, discounts_dict, customers_dict)
+
+    session.handle('SCAN', ['1', '2'])
+    session.handle('LINK', ['123'])
+    self.assertIn('TOTAL PRICE ($)                 9.00', '\n'.join(session.handle('LIST', [])))
+
+    with self.assertRaises(megamart.InsufficientFundsException):
+      session.handle('CHECKOUT', ['pickup', 'cash', '5.00'])
+    self.assertEqual(items_dict['1'][1], 5)
+
+    receipt = session.handle('CHECKOUT', ['pickup', 'cash', '10.00'])
+    self.assertIn('Customer: Alice', receipt)
+    self.assertEqual(items_dict['1'][1], 3)
+    self.assertEqual(len(session.transaction.transaction_lines), 0)
+
+  def test_scan_items_bulk(self):
+    item1 = megamart.Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = megamart.Item('2', 'Coffee Powder', 16.00, ['Coffee', 'Drinks'])
+    items_dict = {'1': (item1, 20, None), '2': (item2, 12, 2)}
+
+    stream = io.StringIO('1 2x2, 1X3\n\n99 1x0 2x 1x4\n')
+    transaction_lines, rejected = megamart_base.scan_items_bulk(items_dict, stream, batch_size=2)
+    self.assertEqual([(line.item, line.quantity) for line in transaction_lines], [(item1, 1), (item2, 2), (item1, 3), (item1, 4)])
+    self.assertEqual(rejected, ['99', '1x0', '2x'])
+
+    session = megamart_server.LaneSession(megamart.Inventory(items_dict.values()), {}, {})
+    self.assertEqual(session.handle('BULK', ['1x2', '3', '2']), ['2 item line(s) added.', '1 code(s) were not recognised and were skipped: 3'])
+    self.assertEqual(session.transaction.transaction_lines.item_quantities, {'1': 2, '2': 1})
+
+  def test_headless_sessions(self):
+    item1 = megamart.Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = megamart.Item('2', 'Beer', 5.00, ['Alcohol', 'Drinks'])
+    items_dict = megamart.Inventory([(item1, 20, None), (item2, 10, None)])
+    discounts_dict = megamart.PriceBook()
+    customers_dict = {'123': megamart.Customer('123', 'Alice', '01/08/1990', True, None)}
+
+    transaction = megamart.Transaction('02/08/2023', '12:00:00')
+    transaction.transaction_lines = [megamart.TransactionLine(item1, 2), megamart.TransactionLine(item2, 1)]
+    transaction.customer = customers_dict['123']
+    transaction.fulfilment_type = megamart.FulfilmentType.PICKUP
+    transaction.payment_method = megamart.PaymentMethod.CASH
+
+    stdout = io.StringIO()
+    with contextlib.redirect_stdout(stdout):
+      console, completed = headless.run_session(items_dict, discounts_dict, customers_dict, headless.session_script(transaction), keep_output=True)
+    self.assertTrue(completed)
+    self.assertEqual(stdout.getvalue(), '')
+    self.assertEqual([action for (action, _) in console.timings], ['scan', 'link', 'checkout'])
+    self.assertIn('MONASH MEGAMART RECEIPT', console.transcript)
+    self.assertIn('Customer: Alice', console.transcript)
+    self.assertEqual(items_dict['1'][1], 18)
+
+    # Without the member account linked, the beer cannot be bought: the terminal goes back to the menu and the session does not complete
+    transaction.customer = None
+    results = headless.run_sessions(items_dict, discounts_dict, customers_dict, [transaction], bulk=True)
+    self.assertEqual((results['sessions'], results['failed']), (0, 1))
+    self.assertEqual(sorted(results['actions']), ['bulk_scan', 'checkout'])
+    self.assertEqual(items_dict['1'][1], 18)
+
+    self.assertEqual(headless.percentile([5, 1, 4, 2, 3], 50), 3)
+    self.assertEqual(headless.percentile([5, 1, 4, 2, 3], 99), 5)
+    self.assertEqual(headless.percentile(list(range(1, 101)), 95), 95)
+
+  def test_loadtest(self):
+    runs = loadtest.sweep([1, 3], 'thread', transactions=10, catalog_size=200, basket_size=5)
+    self.assertEqual([(run['lanes'], run['transactions'], run['errors']) for run in runs], [(1, 10, 0), (3, 30, 0)])
+    self.assertEqual(runs[0]['efficiency'], 1.0)
+    for run in runs:
+      self.assertTrue(0 < run['checkout']['p50'] <= run['checkout']['p95'] <= run['checkout']['p99'])
+
+    run = loadtest.run_load(2, 'process', transactions=5, catalog_size=200, basket_size=5)
+    self.assertEqual((run['transactions'], run['errors']), (10, 0))
+
+  def test_transaction_journal(self):
+    item1 = megamart.Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    items_dict = megamart.Inventory([(item1, 5, None)])
+    discounts_dict = megamart.PriceBook()
+    customers_dict = {'123': megamart.Customer('123', 'Alice', '01/08/2005', True, None)}
+
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'transactions.journal')
+      with TransactionJournal.TransactionJournal(path) as journal:
+        session = megamart_server.LaneSession(items_dict, discounts_dict, customers_dict, journal)
+        session.handle('SCAN', ['1', '2'])
+        session.handle('LINK', ['123'])
+        session.handle('CHECKOUT', ['pickup', 'cash', '10.00'])
+        session.handle('SCAN', ['1'])
+        with self.assertRaises(Exception):
+          journal.append(session.transaction)
+        session.handle('CHECKOUT', ['pickup', 'credit'])
+
+      records = list(TransactionJournal.read_journal(path))
+      self.assertEqual(len(records), 2)
+      self.assertEqual(records[0].customer.name, 'Alice')
+      self.assertEqual(records[0].payment_method, megamart.PaymentMethod.CASH)
+      self.assertEqual(records[0].lines, [('1', 2, 900)])
+      self.assertEqual((records[0].final_total_cents, records[0].amount_tendered_cents, records[0].change_amount_cents), (900, 1000, 100))
+      self.assertEqual(records[1].customer, None)
+      self.assertEqual((records[1].payment_method, records[1].amount_tendered_cents), (megamart.PaymentMethod.CREDIT, 450))
+
+      # A record torn part way through being written is dropped when the journal is next opened
+      with open(path, 'ab') as journal_file:
+        journal_file.write(b'\x40\x00\x00\x00\x00\x00\x00\x00torn')
+      size = os.path.getsize(path)
+      self.assertEqual(TransactionJournal.recover(path), 2)
+      self.assertEqual(os.path.getsize(path), size - 12)
+      self.assertEqual(len(TransactionJournal.record_offsets(path)), 2)
+
+      # Nothing can be appended once the journal is closed
+      finalised = session.transaction
+      finalised.finalised = True
+      with self.assertRaises(Exception):
+        journal.append(finalised)
+
+      # A failed write fails the transactions written with it, and is raised by every later append and by close
+      journal = TransactionJournal.TransactionJournal(path)
+      journal._file.close()
+      journal._file = open(os.devnull, 'rb')
+      durable = journal.append(finalised)
+      with self.assertRaises(Exception):
+        durable.wait_durable(5)
+      self.assertIsInstance(durable.error, OSError)
+      with self.assertRaises(Exception):
+        journal.append(finalised)
+      with self.assertRaises(Exception):
+        journal.close()
+      self.assertEqual(len(TransactionJournal.record_offsets(path)), 2)
+
+      # The writer keeps failing writes whatever the exception, so nothing waits forever
+      journal = TransactionJournal.TransactionJournal(path)
+      journal._file.close()
+      durable = journal.append(finalised)
+      self.assertTrue(durable.wait(5))
+      self.assertIsInstance(durable.error, ValueError)
+      with self.assertRaises(Exception):
+        journal.close()
+
+      # A lane only waits for its transaction to be durable before the receipt if the journal asks for it
+      for durable_receipts in (False, True):
+        with TransactionJournal.TransactionJournal(path, durable_receipts=durable_receipts) as journal:
+          session = megamart_server.LaneSession(items_dict, discounts_dict, customers_dict, journal)
+          session.handle('SCAN', ['1'])
+          session.handle('CHECKOUT', ['pickup', 'credit'])
+          self.assertEqual(session.journal_write is not None, durable_receipts)
+      self.assertEqual(len(TransactionJournal.record_offsets(path)), 4)
+
+  def test_replay(self):
+    item1 = megamart.Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = megamart.Item('2', 'Vodka', 40.00, ['Alcohol'])
+    items_dict = megamart.Inventory([(item1, 1000, None), (item2, 1000, 2)])
+    discounts_dict = megamart.PriceBook({'1': megamart.Discount(megamart.DiscountType.PERCENTAGE, 10, '1')})
+    adult = megamart.Customer('123', 'Alice', '01/08/2000', True, 4.0)
+
+    transactions = []
+    for i in range(40):
+      transaction = megamart.Transaction('20/07/2023', '10:00:00')
+      transaction.customer = adult if i % 3 else None
+      transaction.fulfilment_type = megamart.FulfilmentType.DELIVERY if i % 3 == 1 else megamart.FulfilmentType.PICKUP
+      transaction.payment_method = list(megamart.PaymentMethod)[i % 3]
+      transaction.transaction_lines = [megamart.TransactionLine(item1, i % 5 + 1)]
+      if transaction.customer:
+        transaction.transaction_lines.append(megamart.TransactionLine(item2, i % 2 + 1))
+      transactions.append(transaction)
+
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'transactions.journal')
+      with TransactionJournal.TransactionJournal(path) as journal:
+        for transaction in transactions:
+          transaction = megamart.checkout(transaction, items_dict, discounts_dict)
+          transaction.finalised = True
+          journal.append(transaction)
+
+      serial = replay.replay(path, items_dict, discounts_dict, processes=1)
+      self.assertEqual(serial.transactions, 40)
+      self.assertEqual(serial.mismatches, 0)
+      self.assertEqual(serial.final_total_cents, sum(transaction.final_total_cents for transaction in transactions))
+      self.assertEqual(serial.by_item['2'][0], sum(i % 2 + 1 for i in range(40) if i % 3))
+      self.assertEqual(replay.replay(path, items_dict, discounts_dict, processes=2, records_per_task=7), serial)
+
+      # Stock sold since the baskets were journaled does not fail them, as replay only checks pricing
+      items_dict.apply({}, {item_id: -items_dict[item_id][1] for item_id in ('1', '2')})
+      depleted = replay.replay(path, items_dict, discounts_dict, processes=1)
+      self.assertEqual((depleted.errors, depleted.mismatches), ({}, 0))
+      self.assertEqual(depleted, serial)
+
+      # Replaying against different discounts shows what they would have changed
+      backtest = replay.replay(path, items_dict, {}, processes=1)
+      self.assertEqual(backtest.savings_cents, 0)
+      self.assertEqual(backtest.mismatches, 40)
+
+  def test_discount_schedule(self):
+    item1 = megamart.Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = megamart.Item('2', 'Coffee Powder', 16.00, ['Coffee', 'Drinks'])
+    items_dict = megamart.Inventory([(item1, 1000, None), (item2, 1000, None)])
+    july = megamart.Discount(megamart.DiscountType.PERCENTAGE, 20, '1', '01/07/2023', '01/08/2023')
+    august_sale = megamart.Discount(megamart.DiscountType.FLAT, 1.00, '1', '01/08/2023 09:00:00', '01/08/2023 17:00:00')
+    coffee = megamart.Discount(megamart.DiscountType.PERCENTAGE, 50, '2', end='01/01/2024')
+    schedule = DiscountSchedule([august_sale, july, coffee])
+
+    self.assertIs(schedule.at('01/07/2023')['1'], july)
+    self.assertIs(schedule.at('31/07/2023', '23:59:59')['1'], july)
+    self.assertNotIn('1', schedule.at('01/08/2023', '08:59:59'))
+    self.assertIs(schedule.at('01/08/2023', '09:00:00')['1'], august_sale)
+    self.assertNotIn('1', schedule.at('01/08/2023', '17:00:00'))
+    self.assertEqual(dict(schedule.at('01/01/2023')), {'2': coffee})
+    self.assertEqual(len(schedule.at('01/01/2024')), 0)
+    # Moments with the same discounts share the same discounts dictionary
+    self.assertIs(schedule.at('02/07/2023'), schedule.at('30/07/2023', '12:00:00'))
+
+    with self.assertRaises(Exception):
+      schedule.add(megamart.Discount(megamart.DiscountType.FLAT, 0.50, '1', '31/07/2023', '02/08/2023'))
+    with self.assertRaises(Exception):
+      schedule.add(megamart.Discount(megamart.DiscountType.FLAT, 0.50, '2', '31/07/2023', '30/07/2023'))
+    with self.assertRaises(Exception):
+      DiscountSchedule([july, megamart.Discount(megamart.DiscountType.FLAT, 0.50, '1', '15/07/2023')])
+
+    september = megamart.Discount(megamart.DiscountType.FLAT, 0.50, '1', '01/09/2023')
+    schedule.add(september)
+    self.assertIs(schedule.at('01/10/2023')['1'], september)
+    schedule.remove(september)
+    self.assertNotIn('1', schedule.at('01/10/2023'))
+    self.assertEqual(len(schedule), 3)
+
+    def transaction_at(date, time):
+      transaction = megamart.Transaction(date, time)
+      transaction.transaction_lines = [megamart.TransactionLine(item1, 2), megamart.TransactionLine(item2, 1)]
+      transaction.fulfilment_type = megamart.FulfilmentType.PICKUP
+      transaction.payment_method = megamart.PaymentMethod.CREDIT
+      return transaction
+
+    # Each transaction is priced with the discounts valid at its own date and time
+    self.assertEqual(megamart.checkout(transaction_at('15/07/2023', '12:00:00'), items_dict, schedule).final_total, 15.20)
+    self.assertEqual(megamart.checkout(transaction_at('01/08/2023', '12:00:00'), items_dict, schedule).final_total, 15.00)
+    self.assertEqual(megamart.checkout(transaction_at('01/08/2023', '18:00:00'), items_dict, schedule).final_total, 17.00)
+    self.assertEqual(megamart_base.list_items(transaction_at('15/07/2023', '12:00:00'), schedule)[0], 15.20)
+
+    transactions = [transaction_at(date, '12:00:00') for date in ('10/07/2023', '15/07/2023', '01/08/2023', '02/08/2023', '02/01/2024')]
+    result = megamart.checkout_batch(transactions, items_dict, schedule)
+    self.assertEqual([transaction.final_total for transaction in result.transactions], [15.20, 15.20, 15.00, 17.00, 25.00])
+
+    # Replays price past transactions with the discounts that were valid when they took place
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'transactions.journal')
+      with TransactionJournal.TransactionJournal(path) as journal:
+        for transaction in result.transactions:
+          transaction.finalised = True
+          journal.append(transaction)
+
+      summary = replay.replay(path, items_dict, schedule, processes=2, records_per_task=2)
+      self.assertEqual((summary.transactions, summary.mismatches), (5, 0))
+      self.assertEqual(replay.replay(path, items_dict, schedule.at('02/01/2024'), processes=1).mismatches, 4)
+
+    with self.assertRaises(Exception):
+      megamart.checkout(transaction_at('2023-07-15', '12:00:00'), items_dict, schedule)
+
+  def test_slotted_models(self):
+    beer = megamart.Item('10', 'Beer', 5.00, ['Alcohol', 'Drinks'])
+    cider = megamart.Item('11', 'Cider', 6.00, ['Alcohol', 'Drinks'])
+    customer = megamart.Customer('123', 'Alice', '01/08/2005', True, None)
+    discount = megamart.Discount(megamart.DiscountType.FLAT, 1.50, '10')
+    for model in (beer, customer, discount):
+      self.assertFalse(hasattr(model, '__dict__'))
+
+    # A discount cannot be changed in place, as price books would not see the change
+    with self.assertRaisesRegex(Exception, 'A discount cannot be changed once made'):
+      discount.value = 2.00
+    self.assertEqual(discount.value, 1.50)
+
+    # Items in the same categories share one tuple of them
+    self.assertIs(beer.categories, cider.categories)
+    self.assertEqual(beer.category_mask, cider.category_mask)
+
+    unpickled_beer, unpickled_customer, unpickled_discount = pickle.loads(pickle.dumps((beer, customer, discount)))
+    self.assertEqual((unpickled_beer.id, unpickled_beer.name, unpickled_beer.original_price, unpickled_beer.categories), ('10', 'Beer', 5.00, ('Alcohol', 'Drinks')))
+    self.assertEqual(unpickled_beer.category_mask, beer.category_mask)
+    self.assertEqual((unpickled_customer.date_of_birth, unpickled_customer.adult_from_ordinal, unpickled_customer.eligible_from(21)),
+                     ('01/08/2005', customer.adult_from_ordinal, customer.eligible_from(21)))
+    self.assertEqual((unpickled_discount.type, unpickled_discount.value, unpickled_discount.item_id), (megamart.DiscountType.FLAT, 1.50, '10'))
+
+    sizes = memory_benchmark.measure(200, 200)
+    self.assertEqual(sorted(sizes), ['customer', 'discount', 'item'])
+    self.assertTrue(all(size > 0 for size in sizes.values()))
+
+  def test_catalog_store(self):
+    item1 = megamart.Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = megamart.Item('2', 'Coffee Powder', 16.00, ['Coffee', 'Drinks'])
+    store = CatalogStore([(item1, 20, None), (item2, 10, 2)], {'1': megamart.Discount(megamart.DiscountType.PERCENTAGE, 20, '1')})
+
+    # A lane starts a transaction and scans before the prices change
+    session = megamart_server.LaneSession(store, store, {})
+    session.do_scan('1', '2')
+    session.do_scan('2')
+    first_version = session.transaction.catalog_snapshot
+    self.assertIs(first_version, store.current_version())
+
+    repriced_item1 = megamart.Item('1', 'Tim Tam - Chocolate', 5.00, ['Confectionery', 'Biscuits'])
+    published = store.publish({'1': (repriced_item1, None, None)}, {'2': 5}, {'1': None, '2': megamart.Discount(megamart.DiscountType.FLAT, 1.00, '2')})
+    self.assertEqual((published.version, store.version), (1, 1))
+    self.assertEqual((first_version['1'][0].original_price, first_version['2'][1], store['1'][0].original_price), (4.50, 15, 5.00))
+
+    # Checkout and the receipt use the prices the transaction started with, while stock is shared by every version
+    receipt = '\n'.join(session.do_checkout('pickup', 'credit'))
+    self.assertEqual(receipt.split('FINAL TOTAL ($)')[1].split()[0], '23.20')
+    self.assertEqual((store['1'][1], store['2'][1]), (18, 14))
+    self.assertIsNot(session.transaction.catalog_snapshot, first_version)
+
+    session.do_scan('1', '2')
+    session.do_scan('2')
+    receipt = '\n'.join(session.do_checkout('pickup', 'credit'))
+    self.assertEqual(receipt.split('FINAL TOTAL ($)')[1].split()[0], '25.00')
+
+    transactions = []
+    for _ in range(3):
+      transaction = megamart.Transaction('01/08/2023', '12:00:00')
+      transaction.transaction_lines = [megamart.TransactionLine(item1, 2), megamart.TransactionLine(item2, 1)]
+      transaction.fulfilment_type = megamart.FulfilmentType.PICKUP
+      transaction.payment_method = megamart.PaymentMethod.CREDIT
+      transactions.append(transaction)
+    transactions[0].catalog_snapshot = first_version
+    result = megamart.checkout_batch(transactions, store, store)
+    self.assertEqual([transaction.final_total for transaction in result.transactions], [23.20, 25.00, 25.00])
+    self.assertEqual(store['2'][1], 10)
+
+    with self.assertRaises(Exception):
+      first_version['3'] = (item1, 1, None)
+    with self.assertRaises(Exception):
+      store.publish(stock_deltas={'2': -100})
+    self.assertEqual((store.version, store['2'][1]), (1, 10))
+
+    # A version's discounts cannot be changed in place, only by publishing a new version
+    for change in (lambda: store.discounts.__setitem__('1', megamart.Discount(megamart.DiscountType.FLAT, 2.00, '1')),
+                   lambda: first_version.discounts.pop('1'), lambda: store.discounts.update({}), lambda: first_version.discounts.clear()):
+      with self.assertRaisesRegex(Exception, 'published by its CatalogStore'):
+        change()
+    self.assertEqual((store.version, first_version.discounts['1'].value, '1' in store.discounts), (1, 20, False))
+    self.assertIsInstance(store.discounts, SnapshotDiscounts)
+
+    # Each batch of a feed is published as one version
+    feed = io.StringIO('record,id,name,price,categories,stock,limit,delta,type,value\n'
+                       'price,1,,4.00,,,,,,\n'
+                       'discount,1,,,,,,,Flat,0.50\n'
+                       'item,3,Milk,2.00,Dairy,40,,,,\n'
+                       'stock,2,,,,,,-1,,\n')
+    report = catalog_import.import_feed(feed, store, store, 'csv')
+    self.assertEqual((report.applied, store.version), (4, 2))
+    self.assertEqual((store['1'][0].original_price, store.discounts['1'].value, store['3'][1], store['2'][1]), (4.00, 0.50, 40, 9))
+    self.assertNotIn('3', first_version)
+
+    del store['3']
+    self.assertEqual(('3' in store, store.version), (False, 3))
+
+  def test_mapped_catalog(self):
+    item1 = megamart.Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = megamart.Item('2', 'Coffee Powder', 16.00, ['Coffee', 'Drinks'])
+    item10 = megamart.Item('10', 'Beer', 5.00, ['Alcohol', 'Drinks'])
+    discount1 = megamart.Discount(megamart.DiscountType.PERCENTAGE, 20, '1')
+    discount2 = megamart.Discount(megamart.DiscountType.FLAT, 1.50, '2')
+
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'catalog.bin')
+      MappedCatalog.write_catalog(path, [(item10, 7, None), (item2, 12, 2), (item1, 20, None)], [discount1, discount2])
+
+      items_dict = MappedCatalog.MappedCatalog(path, writable=True)
+      discounts_dict = MappedCatalog.MappedDiscounts(items_dict)
+      self.assertEqual(list(items_dict), ['1', '10', '2'])
+      self.assertNotIn('3', items_dict)
+      self.assertEqual(items_dict.get('3'), None)
+
+      item, stock, limit = items_dict['2']
+      self.assertEqual((item.id, item.name, item.original_price, item.categories, stock, limit), ('2', 'Coffee Powder', 16.00, ('Coffee', 'Drinks'), 12, 2))
+      self.assertIs(items_dict['2'][0], item)
+      self.assertEqual(sorted(discounts_dict), ['1', '2'])
+      self.assertEqual((discounts_dict['1'].type, discounts_dict['1'].value), (megamart.DiscountType.PERCENTAGE, 20))
+      self.assertNotIn('10', discounts_dict)
+
+      transaction = megamart.Transaction('20/07/2023', '10:00:00')
+      transaction.fulfilment_type = megamart.FulfilmentType.PICKUP
+      transaction.payment_method = megamart.PaymentMethod.CASH
+      transaction.transaction_lines = [megamart.TransactionLine(items_dict['1'][0], 3), megamart.TransactionLine(item, 2)]
+      transaction = megamart.checkout(transaction, items_dict, discounts_dict)
+      self.assertEqual(transaction.final_total, 39.80)
+      self.assertEqual((items_dict['1'][1], items_dict['2'][1]), (17, 10))
+
+      with self.assertRaises(megamart.InsufficientStockException):
+        items_dict.commit({'1': 5, '10': 8})
+      self.assertEqual(items_dict['10'][1], 7)
+
+      # A feed is refused before any of its rows are applied, rather than failing part way through
+      feed = io.StringIO('record,id,delta,type,value\nstock,1,5,,\ndiscount,10,,Flat,1.00\n')
+      with self.assertRaisesRegex(Exception, 'mapped catalog'):
+        catalog_import.import_feed(feed, items_dict, discounts_dict, 'csv')
+      self.assertEqual((items_dict['1'][1], '10' in discounts_dict), (17, False))
+
+      items_dict.flush()
+      items_dict.close()
+      self.assertEqual(MappedCatalog.MappedCatalog(path)['2'][1], 10)
+
+  def test_catalog_import(self):
+    item1 = megamart.Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    items_dict = megamart.Inventory([(item1, 20, None)])
+    discounts_dict = megamart.PriceBook({'1': megamart.Discount(megamart.DiscountType.FLAT, 1.00, '1')})
+
+    feed = io.StringIO('\n'.join([
+      'record,id,name,price,categories,stock,limit,delta,type,value',
+      'item,2,Coffee Powder,16.00,Coffee;Drinks,12,2,,,',
+      'discount,2,,,,,,,Percentage,25',
+      'stock,1,,,,,,-5,,',
+      'stock,2,,,,,,3,,',
+      'price,1,,5.25,,,,,,',
+      'price,1,,0.50,,,,,,',
+      'stock,1,,,,,,-16,,',
+      'discount,2,,,,,,,Percentage,101',
+      'item,3,Laundry Detergent,9.985,Household,5,,,,',
+      'stock,4,,,,,,1,,',
+      'discount,1,,,,,,,,',
+    ]))
+    report = catalog_import.import_feed(feed, items_dict, discounts_dict, 'csv', batch_size=3)
+    self.assertEqual((report.rows, report.applied, report.rejected), (11, 6, 5))
+    self.assertEqual([row_number for (row_number, _) in report.errors], [6, 7, 8, 9, 10])
+    self.assertIn('Invalid flat discount value', report.errors[0][1])
+
+    item2, stock, limit = items_dict['2']
+    self.assertEqual((item2.name, item2.categories, stock, limit), ('Coffee Powder', ('Coffee', 'Drinks'), 15, 2))
+    self.assertEqual(megamart.calculate_final_item_price(item2, discounts_dict), 12.00)
+    self.assertEqual((items_dict['1'][0].original_price, items_dict['1'][1]), (5.25, 15))
+    self.assertNotIn('1', discounts_dict)
+    self.assertNotIn('3', items_dict)
+
+    report = catalog_import.import_feed(io.StringIO('{"record": "stock", "id": "1", "delta": 5}\n'), items_dict, discounts_dict, 'jsonl')
+    self.assertEqual((report.applied, items_dict['1'][1]), (1, 20))
+
+    # Stock sold by lanes after the rows were checked rejects the rows behind the delta, by their own row numbers
+    for catalog in (items_dict, megamart.CatalogStore([(item1, 20, None)])):
+      batch = catalog_import._Batch(catalog, discounts_dict if catalog is items_dict else catalog)
+      batch.add({'record': 'stock', 'id': '1', 'delta': '-5'}, 3)
+      batch.add({'record': 'stock', 'id': '1', 'delta': '-5'}, 7)
+      catalog.commit({'1': 15})
+      report = catalog_import.ImportReport()
+      batch.apply(report)
+      self.assertEqual((report.applied, report.rejected, catalog['1'][1]), (0, 2, 5))
+      self.assertEqual([row_number for (row_number, _) in report.errors], [3, 7])
+
+  def test_receipt_renderer(self):
+    item1 = megamart.Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    discounts_dict = {'1': megamart.Discount(megamart.DiscountType.PERCENTAGE, 20, '1')}
+    transaction = megamart.Transaction('20/07/2023', '10:00:00')
+    transaction.customer = megamart.Customer('123', 'Alice', '01/08/2005', True, 4.0)
+    transaction.fulfilment_type = megamart.FulfilmentType.DELIVERY
+    transaction.payment_method = megamart.PaymentMethod.CASH
+    transaction.transaction_lines = [megamart.TransactionLine(item1, 3)]
+    transaction = megamart.checkout(transaction, {'1': (item1, 20, None)}, discounts_dict)
+    megamart_base.settle_payment(transaction, 20)
+
+    border = '=' * 125 + '\n'
+    rule = ' ' * 73 + '=' * 52 + '\n'
+    self.assertEqual(megamart_base.generate_receipt(transaction, discounts_dict), ''.join([
+      border, 'MONASH MEGAMART RECEIPT\n', border,
+      'Transaction time: 20/07/2023 10:00:00\n', 'Fulfilment type: Delivery\n', 'Customer: Alice\n', 'Membership #: 123\n', border,
+      'Purchased items:\n',
+      '#     ITEM NAME                      QUANTITY         UNIT PRICE ($)         TOTAL DISCOUNTS APPLIED ($)      FINAL PRICE ($)\n',
+      '1     Tim Tam - Chocolate            3                     4.50 each                                2.70                10.80\n',
+      '\n', border,
+      ' ' * 92 + 'SUBTOTAL ($)                10.80\n',
+      ' ' * 80 + 'FULFILMENT SURCHARGE ($)                 5.00\n',
+      ' ' * 92 + 'ROUNDING ($)                 0.00\n\n',
+      rule, ' ' * 89 + 'FINAL TOTAL ($)                15.80\n', rule, '\n',
+      ' ' * 90 + 'PAYMENT METHOD                 Cash\n',
+      ' ' * 85 + 'AMOUNT TENDERED ($)                20.00\n',
+      ' ' * 94 + 'CHANGE ($)                 4.20\n',
+      ' ' * 87 + '# ITEMS PURCHASED                    3\n\n',
+      ' ' * 81 + 'MONEY SAVED WITH US ($)                 2.70\n',
+      border, 'Thank you for shopping at Monash MegaMart, please come again!\n', border,
+    ]))
+
+    stream = io.StringIO()
+    self.assertEqual(megamart_base.receipt_renderer.write_receipts([transaction, transaction], discounts_dict, stream), 2)
+    self.assertEqual(stream.getvalue(), megamart_base.generate_receipt(transaction, discounts_dict) * 2)
+
+  def test_promotions(self):
+    item1 = megamart.Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = megamart.Item('2', 'Shortbread', 3.00, ['Biscuits'])
+    item3 = megamart.Item('3', 'Cola', 2.00, ['Drinks'])
+    items_dict = megamart.Inventory([(item1, 50, None), (item2, 50, None), (item3, 50, None)])
+    discounts_dict = megamart.PriceBook({'1': megamart.Discount(megamart.DiscountType.PERCENTAGE, 20, '1')})
+    promotions = PromotionEngine([
+      Promotion(PromotionType.CATEGORY, 'Biscuits 10% off', megamart.DiscountType.PERCENTAGE, 10, categories=['biscuits']),
+      Promotion(PromotionType.MULTI_BUY, 'Cola 3 for 2', item_ids=['3'], buy=2, free=1),
+      Promotion(PromotionType.SPEND_THRESHOLD, 'Spend $20 save $2', megamart.DiscountType.FLAT, 2, threshold=20),
+      Promotion(PromotionType.SPEND_THRESHOLD, 'Spend $50 save 10%', megamart.DiscountType.PERCENTAGE, 10, threshold=50),
+    ])
+
+    def transaction_of(*lines):
+      transaction = megamart_base.start_transaction(discounts_dict)
+      transaction.transaction_lines.extend(megamart.TransactionLine(items_dict[item_id][0], quantity) for (item_id, quantity) in lines)
+      transaction.fulfilment_type = megamart.FulfilmentType.PICKUP
+      transaction.payment_method = megamart.PaymentMethod.CREDIT
+      return transaction
+
+    # Tim Tams keep their own 20% discount, which beats 10% off biscuits. One cola in every three is free, counted over both cola lines.
+    transaction = megamart.checkout(transaction_of(('1', 2), ('3', 2), ('2', 3), ('3', 2)), items_dict, discounts_dict, promotions=promotions)
+    self.assertEqual([line.final_cost for line in transaction.transaction_lines], [7.20, 2.00, 8.10, 4.00])
+    self.assertEqual(transaction.promotion_discount, 2.00)
+    self.assertEqual(transaction.all_items_subtotal, 19.30)
+    self.assertEqual(transaction.final_total, 19.30)
+    self.assertEqual(transaction.amount_saved, 6.70)
+    self.assertEqual(transaction.promotion_savings, 4.90)
+
+    megamart_base.settle_payment(transaction, transaction.final_total)
+    receipt = megamart_base.generate_receipt(transaction, discounts_dict)
+    self.assertIn('3     Shortbread                     3                     3.00 each                                0.90                 8.10\n', receipt)
+    self.assertIn('2     Cola                           2                     2.00 each                                2.00                 2.00\n', receipt)
+    self.assertIn(' ' * 78 + 'PROMOTION DISCOUNT ($)                 2.00\n' + ' ' * 92 + 'SUBTOTAL ($)                19.30\n', receipt)
+
+    # When no promotion applies, totals and receipts are the same as without the engine
+    plain = megamart.checkout(transaction_of(('1', 1)), items_dict, discounts_dict)
+    promoted = megamart.checkout(transaction_of(('1', 1)), items_dict, discounts_dict, promotions=promotions)
+    self.assertEqual(promoted.promotion_savings_cents, 0)
+    self.assertEqual(promoted.final_total_cents, plain.final_total_cents)
+    for transaction in (plain, promoted):
+      transaction.time = '10:00:00'
+      megamart_base.settle_payment(transaction, 10)
+    self.assertEqual(megamart_base.generate_receipt(promoted, discounts_dict), megamart_base.generate_receipt(plain, discounts_dict))
+
+    # The running totals follow the promotional prices written to the lines, so a line removed afterwards takes off what it added,
+    # and a checkout without promotions prices the lines again with the discounts alone
+    transaction = megamart.checkout(transaction_of(('2', 2), ('3', 3)), items_dict, discounts_dict, promotions=promotions)
+    self.assertEqual((transaction.all_items_subtotal_cents, transaction.transaction_lines.subtotal_cents), (940, 940))
+    transaction.transaction_lines.pop(1)
+    self.assertEqual((transaction.transaction_lines.subtotal_cents, transaction.transaction_lines.savings_cents), (540, 60))
+    self.assertEqual(megamart.checkout(transaction, items_dict, discounts_dict).all_items_subtotal_cents, 600)
+    self.assertEqual([line.final_cost_cents for line in transaction.transaction_lines], [600])
+    megamart.release_stock(transaction, items_dict)
+
+    result = megamart.checkout_batch([transaction_of(('3', 3)), transaction_of(('3', 1))], items_dict, discounts_dict, promotions)
+    self.assertEqual([transaction.final_total for transaction in result.transactions], [4.00, 2.00])
+
+    # Lanes check out with the promotions they are given
+    session = megamart_server.LaneSession(items_dict, discounts_dict, {}, promotions=promotions)
+    session.handle('SCAN', ['2', '10'])
+    receipt = '\n'.join(session.handle('CHECKOUT', ['pickup', 'credit']))
+    self.assertIn('PROMOTION DISCOUNT ($)                 2.00', receipt)
+    self.assertIn('FINAL TOTAL ($)                25.00', receipt)
+
+    self.assertEqual(promotions.basket_discount_cents(1999), 0)
+    self.assertEqual(promotions.basket_discount_cents(2000), 200)
+    self.assertEqual(promotions.basket_discount_cents(6000), 600)
+    better = PromotionEngine([Promotion(PromotionType.MULTI_BUY, '3 for 2', item_ids=['3'], buy=2, free=1),
+                              Promotion(PromotionType.MULTI_BUY, '2 for 1', categories=['DRINKS'], buy=1, free=1)])
+    self.assertEqual(better.item_rules(item3), (None, (1, 1)))
+    self.assertEqual(better.price_lines([(item3, 3, 200)]), ([(400, 200)], 0))
+
+    with self.assertRaises(Exception):
+      PromotionEngine([Promotion(PromotionType.CATEGORY, 'Nothing off', megamart.DiscountType.PERCENTAGE, 0, categories=['Drinks'])])
+    with self.assertRaises(Exception):
+      PromotionEngine([Promotion(PromotionType.MULTI_BUY, 'Buy 2 get none', item_ids=['3'], buy=2, free=0)])
+
+    # Promotions can be loaded from a JSON file, e.g. by megamart_server --promotions
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'promotions.json')
+      with open(path, 'w') as promotions_file:
+        json.dump([
+          {'type': 'Category', 'name': 'Biscuits 10% off', 'discount_type': 'percentage', 'value': 10, 'categories': ['biscuits']},
+          {'type': 'multi_buy', 'name': 'Cola 3 for 2', 'item_ids': ['3'], 'buy': 2, 'free': 1},
+          {'type': 'Spend threshold', 'name': 'Spend $20 save $2', 'discount_type': 'Flat', 'value': 2, 'threshold': 20},
+        ], promotions_file)
+      loaded = PromotionEngine.load(path)
+      transaction = megamart.checkout(transaction_of(('1', 2), ('3', 2), ('2', 3), ('3', 2)), items_dict, discounts_dict, promotions=loaded)
+      self.assertEqual((transaction.final_total, transaction.promotion_discount), (19.30, 2.00))
+
+      with open(path, 'w') as promotions_file:
+        json.dump([{'type': 'Category', 'name': 'Half off', 'discount_type': 'Half'}], promotions_file)
+      with self.assertRaisesRegex(Exception, "'Half' is not one of"):
+        PromotionEngine.load(path)
+      with open(path, 'w') as promotions_file:
+        json.dump([{'name': 'No type'}], promotions_file)
+      with self.assertRaisesRegex(Exception, 'must hold a list of promotions'):
+        PromotionEngine.load(path)
+
+  def test_benchmark(self):
+    results = benchmark.run_benchmarks([3], [20], [0.5], repeat=1, min_seconds=0)
+    self.assertEqual(sorted(results), [
+      'calculate_final_item_price[catalog=20,restricted=0.5]',
+      'checkout[basket=3,catalog=20,restricted=0.5]',
+      'checkout_batch[transactions=1000,catalog=20,restricted=0.5]',
+      'checkout_each[transactions=1000,catalog=20,restricted=0.5]',
+      'generate_receipt[basket=3,catalog=20]',
+      'is_not_allowed_to_purchase_item[catalog=20,restricted=0.5]',
+      'list_items[basket=3,catalog=20]',
+    ])
+    self.assertEqual(list(benchmark.batch_speedups(results)), ['checkout_batch[transactions=1000,catalog=20,restricted=0.5]'])
+
+    baseline = {'a': {'median': 1.0, 'min': 1.0}, 'b': {'median': 1.0, 'min': 1.0}}
+    current = {'a': {'median': 1.3, 'min': 1.05}, 'b': {'median': 1.0, 'min': 1.2}, 'c': {'median': 9.0, 'min': 9.0}}
+    self.assertEqual(benchmark.compare(current, baseline, 0.1), [('b', 1.0, 1.2, 1.2)])
+
+  def test_workload(self):
+    items_dict, customers_dict, discounts_dict = workload.generate_megadata(500, 50, seed=7, restricted_ratio=0.2)
+    self.assertIsInstance(items_dict, megamart.Inventory)
+    self.assertIsInstance(discounts_dict, megamart.PriceBook)
+    self.assertEqual(sorted(customers_dict)[:2], ['100001', '100002'])
+    restricted = [item_id for item_id in items_dict if megamart._is_restricted_item(items_dict[item_id][0])]
+    self.assertTrue(50 <= len(restricted) <= 150)
+    for discount in discounts_dict.values():
+      megamart.calculate_final_item_price(items_dict[discount.item_id][0], discounts_dict)
+
+    baskets = [[(line.item.id, line.quantity) for line in transaction.transaction_lines]
+               for transaction in workload.generate_baskets(items_dict, customers_dict, 20, seed=7)]
+    # The same seed gives the same data, whatever else is generated with it
+    other_items_dict, other_customers_dict, _ = workload.generate_megadata(500, 50, seed=7, restricted_ratio=0.2, stock_range=(1000, 1000))
+    self.assertEqual(baskets, [[(line.item.id, line.quantity) for line in transaction.transaction_lines]
+                               for transaction in workload.generate_baskets(other_items_dict, other_customers_dict, 20, seed=7)])
+
+    transactions = list(workload.generate_baskets(items_dict, customers_dict, 5, seed=1, size=30, member_ratio=1.0))
+    self.assertEqual([len(transaction.transaction_lines) for transaction in transactions], [30] * 5)
+    for transaction in transactions:
+      for line in transaction.transaction_lines:
+        self.assertFalse(megamart.is_not_allowed_to_purchase_item(line.item, transaction.customer, transaction.date))
+
+  def test_instrumentation(self):
+    items_dict, customers_dict, discounts_dict = workload.generate_megadata(200, 20, seed=3, stock_range=(1000, 1000))
+    original = megamart.is_item_sufficiently_stocked
+    instrumentation.reset()
+
+    instrumentation.enable()
+    try:
+      self.assertIsNot(megamart.is_item_sufficiently_stocked, original)
+      transaction = next(workload.generate_baskets(items_dict, customers_dict, 1, seed=3, size=10, member_ratio=1.0))
+      megamart.checkout(transaction, items_dict, discounts_dict)
+      megamart_base.settle_payment(transaction, transaction.final_total)
+      megamart_base.generate_receipt(transaction, discounts_dict)
+    finally:
+      instrumentation.disable()
+
+    # Disabled, checkout calls the original functions again and nothing more is counted
+    self.assertIs(megamart.is_item_sufficiently_stocked, original)
+    megamart.checkout(next(workload.generate_baskets(items_dict, customers_dict, 1, seed=4, size=10, member_ratio=1.0)), items_dict, discounts_dict)
+
+    # Stock is checked once per unique item of the basket
+    unique_items = len(transaction.transaction_lines.item_quantities)
+    metrics = instrumentation.metrics()
+    self.assertEqual(metrics['stock']['count'], unique_items)
+    self.assertEqual(metrics['rounding']['count'], 1)
+    self.assertEqual(metrics['surcharge']['count'], 1)
+    self.assertEqual(metrics['stock_commit']['count'], 1)
+    self.assertEqual(metrics['generate_receipt']['count'], 1)
+    self.assertEqual(metrics['stock']['buckets']['+Inf'], unique_items)
+
+    with tempfile.TemporaryDirectory() as directory:
+      instrumentation.write_metrics(os.path.join(directory, 'metrics.prom'))
+      with open(os.path.join(directory, 'metrics.prom')) as metrics_file:
+        text = metrics_file.read()
+      self.assertIn('megamart_stage_seconds_count{{stage="stock"}} {}\n'.format(unique_items), text)
+      self.assertIn('megamart_stage_seconds_bucket{stage="rounding",le="+Inf"} 1\n', text)
+
+      instrumentation.write_metrics(os.path.join(directory, 'metrics.json'))
+      with open(os.path.join(directory, 'metrics.json')) as metrics_file:
+        self.assertEqual(json.load(metrics_file)['stages']['generate_receipt']['count'], 1)
+    instrumentation.reset()
+
+  def test_price_book(self):
+    item1 = megamart.Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = megamart.Item('2', 'Coffee Powder', 16.00, ['Coffee', 'Drinks'])
+    price_book = megamart.PriceBook({
+      '1': megamart.Discount(megamart.DiscountType.PERCENTAGE, 20, '1'),
+    })
+
+    self.assertEqual(megamart.item_price_and_savings(item1, price_book), (3.60, 0.90))
+    self.assertEqual(megamart.item_price_and_savings(item2, price_book), (16.00, 0.00))
+    self.assertEqual(price_book.cached_price(item1), (360, 90))
+
+    # Only the entries of items whose discount changed are dropped
+    price_book['2'] = megamart.Discount(megamart.DiscountType.FLAT, 1.50, '2')
+    self.assertEqual(price_book.cached_price(item2), None)
+    self.assertEqual(price_book.cached_price(item1), (360, 90))
+    self.assertEqual(megamart.item_price_and_savings(item2, price_book), (14.50, 1.50))
+
+    del price_book['1']
+    self.assertEqual(price_book.cached_price(item1), None)
+    self.assertEqual(megamart.item_price_and_savings(item1, price_book), (4.50, 0.00))
+
+    # The items whose discounts changed since a version are remembered, unless every discount may have changed
+    version = price_book.version
+    price_book['2'] = megamart.Discount(megamart.DiscountType.FLAT, 1.00, '2')
+    price_book.invalidate('1')
+    self.assertEqual(price_book.changed_since(version), {'1', '2'})
+    self.assertEqual(price_book.changed_since(price_book.version), set())
+    price_book.invalidate_all()
+    self.assertEqual(price_book.changed_since(version), None)
+    self.assertEqual(megamart.item_price_and_savings(item2, price_book), (15.00, 1.00))
+
+    # A replaced item object is priced again
+    item1_repriced = megamart.Item('1', 'Tim Tam - Chocolate', 5.00, ['Confectionery', 'Biscuits'])
+    self.assertEqual(megamart.item_price_and_savings(item1_repriced, price_book), (5.00, 0.00))
+
   def test_is_not_allowed_to_purchase_item(self):
 
     # Data block for is_not_allowed_to_purchase_item testing
@@ -111,6 +1095,80 @@ class TestMegaMart(unittest.TestCase):
     with self.assertRaises(Exception):
       megamart.is_not_allowed_to_purchase_item(itemRestricted,customerDobInvalid,purchaseDateInvalid)
 
+  def test_restriction_age_boundaries(self):
+    itemRestricted = megamart.Item('2', 'Beer', 4.50, ['Alcohol'])
+    customer = megamart.Customer('123', 'Alice', '01/08/2005', True, None)
+    customerLeapDay = megamart.Customer('456', 'Bob', '29/02/2004', True, None)
+
+    self.assertEqual(megamart.is_not_allowed_to_purchase_item(itemRestricted, customer, '31/07/2023'), True)
+    self.assertEqual(megamart.is_not_allowed_to_purchase_item(itemRestricted, customer, '01/08/2023'), False)
+    self.assertEqual(megamart.is_not_allowed_to_purchase_item(itemRestricted, customerLeapDay, '28/02/2022'), True)
+    self.assertEqual(megamart.is_not_allowed_to_purchase_item(itemRestricted, customerLeapDay, '01/03/2022'), False)
+
+    # The eligibility date follows changes to the customer's birth date
+    customer.date_of_birth = '02/08/2005'
+    self.assertEqual(megamart.is_not_allowed_to_purchase_item(itemRestricted, customer, '01/08/2023'), True)
+
+    transaction = megamart.Transaction('01/08/2023', '12:00:00')
+    self.assertEqual(transaction.date_ordinal, megamart.parse_date_ordinal('01/08/2023'))
+    transaction.date = '2023-08-01'
+    self.assertEqual(transaction.date_ordinal, None)
+
+
+  def test_restriction_policy(self):
+    beer = megamart.Item('2', 'Beer', 4.50, ['ALCOHOL', 'Drinks'])
+    energy_drink = megamart.Item('3', 'Energy Drink', 3.00, ['Energy drinks'])
+    cleaver = megamart.Item('4', 'Cleaver', 20.00, ['Knives', 'Energy Drinks'])
+    water = megamart.Item('5', 'Water', 1.00, ['Drinks'])
+    customer16 = megamart.Customer('1', 'Alice', '01/08/2007', False, None)
+    customer20 = megamart.Customer('2', 'Bob', '01/08/2003', True, None)
+    customer21 = megamart.Customer('3', 'Carol', '01/08/2002', True, None)
+
+    # The default policy restricts alcohol, tobacco and knives to verified customers aged 18+
+    self.assertEqual(megamart.restriction_policy.requirement(beer), (18, True))
+    self.assertIsNone(megamart.restriction_policy.requirement(energy_drink))
+    self.assertEqual(beer.category_mask & water.category_mask, water.category_mask)
+
+    policy = RestrictionPolicy({'alcohol': (18, True), 'energy drinks': (16, False), 'KNIVES': (21, True)})
+    self.assertEqual(policy.requirement(cleaver), (21, True))
+    default_policy = megamart.restriction_policy
+    megamart.restriction_policy = policy
+    try:
+      self.assertEqual(megamart.is_not_allowed_to_purchase_item(energy_drink, customer16, '01/08/2023'), False)
+      self.assertEqual(megamart.is_not_allowed_to_purchase_item(energy_drink, customer16, '31/07/2023'), True)
+      self.assertEqual(megamart.is_not_allowed_to_purchase_item(energy_drink, None, '01/08/2023'), True)
+      self.assertEqual(megamart.is_not_allowed_to_purchase_item(beer, customer16, '01/08/2023'), True)
+      self.assertEqual(megamart.is_not_allowed_to_purchase_item(cleaver, customer20, '01/08/2023'), True)
+      self.assertEqual(megamart.is_not_allowed_to_purchase_item(cleaver, customer21, '01/08/2023'), False)
+      self.assertEqual(megamart.is_not_allowed_to_purchase_item(water, None, None), False)
+
+      items_dict = {item.id: (item, 10, None) for item in (beer, energy_drink, cleaver, water)}
+      transaction = megamart.Transaction('01/08/2023', '12:00:00')
+      transaction.customer = customer20
+      transaction.transaction_lines = [megamart.TransactionLine(beer, 1), megamart.TransactionLine(energy_drink, 1), megamart.TransactionLine(cleaver, 1)]
+      transaction.payment_method = megamart.PaymentMethod.CASH
+      transaction.fulfilment_type = megamart.FulfilmentType.PICKUP
+      with self.assertRaises(megamart.RestrictedItemException):
+        megamart.checkout(transaction, items_dict, {})
+      transaction.customer = customer21
+      self.assertEqual(megamart.checkout(transaction, items_dict, {}).total_items_purchased, 3)
+    finally:
+      megamart.restriction_policy = default_policy
+
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'restrictions.json')
+      with open(path, 'w') as policy_file:
+        json.dump({'Energy Drinks': {'minimum_age': 16, 'id_required': False}, 'tobacco': {'minimum_age': 21}}, policy_file)
+      loaded = RestrictionPolicy.load(path)
+      self.assertEqual((loaded.requirement(cleaver), loaded.requirement(beer)), ((16, False), None))
+      self.assertEqual(loaded.requirement(megamart.Item('6', 'Cigars', 30.00, ['Tobacco'])), (21, True))
+
+      with open(path, 'w') as policy_file:
+        json.dump({'tobacco': 21}, policy_file)
+      with self.assertRaises(Exception):
+        RestrictionPolicy.load(path)
+    with self.assertRaises(Exception):
+      RestrictionPolicy({'alcohol': (-1, True)})
   def test_get_item_purchase_quantity_limit(self):
     # Data block for test_get_item_purchase_quantity_limit testing
     itemNoLimit = (megamart.Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits']))
@@ -199,6 +1257,28 @@ class TestMegaMart(unittest.TestCase):
     self.assertEqual(megamart.calculate_final_item_price(itemDiscountPercValid[0], disc_dict), 3.00)
     self.assertEqual(megamart.calculate_final_item_price(itemDiscountFlatValid[0], disc_dict), 14.50)
 
+    #Check that the discounted price, not the amount taken off, is rounded to the nearest cent, halves rounding up
+    half_cent_items = {
+      '7': megamart.Item('7', 'Something', 0.05, ['Confectionery']),
+      '8': megamart.Item('8', 'Something', 0.01, ['Confectionery']),
+      '9': megamart.Item('9', 'Something', 0.05, ['Confectionery']),
+    }
+    half_cent_discounts = {
+      '7': megamart.Discount(megamart.DiscountType.PERCENTAGE, 50, '7'),
+      '8': megamart.Discount(megamart.DiscountType.PERCENTAGE, 50, '8'),
+      '9': megamart.Discount(megamart.DiscountType.PERCENTAGE, 30, '9'),
+    }
+    self.assertEqual(megamart.calculate_final_item_price(half_cent_items['7'], half_cent_discounts), 0.03)
+    self.assertEqual(megamart.calculate_final_item_price(half_cent_items['8'], half_cent_discounts), 0.01)
+    self.assertEqual(megamart.calculate_final_item_price(half_cent_items['9'], half_cent_discounts), 0.04)
+    #Exact half cents round up, even where the float arithmetic rounded them down (to 22.45 and 22.18)
+    half_cent_items['10'] = megamart.Item('10', 'Something', 44.91, ['Confectionery'])
+    half_cent_items['11'] = megamart.Item('11', 'Something', 29.58, ['Confectionery'])
+    half_cent_discounts['10'] = megamart.Discount(megamart.DiscountType.PERCENTAGE, 50, '10')
+    half_cent_discounts['11'] = megamart.Discount(megamart.DiscountType.PERCENTAGE, 25, '11')
+    self.assertEqual(megamart.calculate_final_item_price(half_cent_items['10'], half_cent_discounts), 22.46)
+    self.assertEqual(megamart.calculate_final_item_price(half_cent_items['11'], half_cent_discounts), 22.19)
+
     #Check for all possible exceptions
     with self.assertRaises(Exception):
       megamart.calculate_final_item_price(None, disc_dict)
@@ -267,6 +1347,8 @@ class TestMegaMart(unittest.TestCase):
     self.assertEqual(megamart.round_off_subtotal(subtotalRoundingDown, megamart.PaymentMethod.CASH), 4.50)
     self.assertEqual(megamart.round_off_subtotal(subtotalRoundingDown, megamart.PaymentMethod.CREDIT), 4.51)
     self.assertEqual(megamart.round_off_subtotal(subtotalRoundingUp, megamart.PaymentMethod.CASH), 4.60)
+    #Subtotals are rounded to the cent before rounding for cash, so 0.58 (0.5799... as a float) rounds up
+    self.assertEqual(megamart.round_off_subtotal(0.58, megamart.PaymentMethod.CASH), 0.60)
 
     #Check for all possible exceptions
     with self.assertRaises(Exception):
@@ -0,0 +1,243 @@
+"""
+Generates synthetic catalogs, customer bases, discounts and streams of baskets, in the same shapes as megadata exposes,
+for benchmarks, load tests and replay.
+
+Everything is deterministic for a given seed: each kind of data has its own random stream derived from the seed,
+so e.g. the customers generated for a seed do not depend on how many items were generated first.
+
+Usage: python workload.py [--seed N] [--items N] [--customers N] [--transactions N]
+                          [--catalog FILE] [--feed FILE] [--journal FILE]
+"""
+import argparse
+import csv
+import datetime
+import itertools
+import random
+from typing import Dict, Iterator, List, Optional, Tuple
+from Item import Item
+from Customer import Customer
+from Discount import Discount
+from DiscountType import DiscountType
+from FulfilmentType import FulfilmentType
+from PaymentMethod import PaymentMethod
+from PriceBook import PriceBook
+from Inventory import Inventory
+from Transaction import Transaction
+from TransactionLine import TransactionLine
+from TransactionJournal import TransactionJournal
+from MappedCatalog import write_catalog
+
+from megamart import checkout, is_not_allowed_to_purchase_item
+from megamart_base import settle_payment
+
+# (category, relative share of unrestricted items, names used for items in it)
+_CATEGORIES = [
+  ('Produce', 14, ['Apples', 'Bananas', 'Carrots', 'Broccoli', 'Tomatoes', 'Potatoes']),
+  ('Dairy', 10, ['Milk', 'Cheddar', 'Yoghurt', 'Butter', 'Cream']),
+  ('Drinks', 10, ['Orange Juice', 'Sparkling Water', 'Cola', 'Iced Tea']),
+  ('Bakery', 8, ['Sourdough', 'Croissants', 'Wholemeal Bread', 'Muffins']),
+  ('Meat', 8, ['Chicken Breast', 'Beef Mince', 'Lamb Chops', 'Sausages']),
+  ('Confectionery', 8, ['Chocolate Bar', 'Jelly Beans', 'Licorice', 'Mints']),
+  ('Household', 8, ['Paper Towels', 'Light Bulbs', 'Batteries', 'Bin Liners']),
+  ('Frozen', 7, ['Ice Cream', 'Frozen Peas', 'Fish Fingers', 'Pizza']),
+  ('Cleaning', 6, ['Laundry Detergent', 'Dishwashing Liquid', 'Bleach', 'Sponges']),
+  ('Cooking', 6, ['Olive Oil', 'Flour', 'Rice', 'Pasta']),
+  ('Personal Care', 6, ['Shampoo', 'Toothpaste', 'Soap', 'Deodorant']),
+  ('Biscuits', 5, ['Tim Tam', 'Shortbread', 'Crackers', 'Anzac Biscuits']),
+  ('Coffee', 4, ['Coffee Powder', 'Coffee Beans', 'Coffee Pods']),
+]
+
+# (category, relative share of restricted items, names, the unrestricted category it is also listed under)
+_RESTRICTED_CATEGORIES = [
+  ('Alcohol', 60, ['Beer', 'Wine', 'Vodka', 'Gin', 'Cider'], 'Drinks'),
+  ('Tobacco', 25, ['Cigarettes', 'Cigars', 'Rolling Tobacco'], None),
+  ('Knives', 15, ['Kitchen Knife', 'Paring Knife', 'Cleaver'], 'Cooking'),
+]
+
+_FIRST_NAMES = ['Alice', 'Bob', 'Carol', 'Dave', 'Erin', 'Frank', 'Grace', 'Heidi', 'Ivan', 'Judy', 'Mallory', 'Niaj', 'Olivia', 'Peggy', 'Rupert', 'Sybil', 'Trent', 'Victor', 'Walter', 'Yusuf']
+_LAST_NAMES = ['Nguyen', 'Smith', 'Wang', 'Jones', 'Patel', 'Williams', 'Brown', 'Singh', 'Chen', 'Taylor', 'Kim', 'Martin']
+
+_PAYMENT_METHODS = [PaymentMethod.CASH, PaymentMethod.DEBIT, PaymentMethod.CREDIT]
+_PAYMENT_METHOD_WEIGHTS = [25, 40, 35]
+
+# Ages are worked out against this date, which is also the default date of generated baskets
+REFERENCE_DATE = datetime.date(2023, 7, 20)
+
+
+def _rng(seed: int, stream: str) -> random.Random:
+  return random.Random('{}:{}'.format(seed, stream))
+
+
+def generate_items(count: int, seed: int = 0, restricted_ratio: float = 0.04, limit_ratio: float = 0.1,
+                   stock_range: Tuple[int, int] = (0, 200)) -> Iterator[Tuple[Item, int, Optional[int]]]:
+  """
+  Yields (item, stock level, purchase quantity limit) tuples with item IDs '1' to str(count).
+  About restricted_ratio of the items are in a restricted category (mostly alcohol), and limit_ratio have a purchase quantity limit.
+  Prices follow a log-normal distribution with a median of about $6.
+  """
+  rng = _rng(seed, 'items')
+  # Stock levels have their own stream, so changing stock_range does not change the items
+  stock_rng = _rng(seed, 'stock')
+  category_weights = [weight for (_, weight, _) in _CATEGORIES]
+  restricted_weights = [weight for (_, weight, _, _) in _RESTRICTED_CATEGORIES]
+
+  for index in range(count):
+    item_id = str(index + 1)
+    if rng.random() < restricted_ratio:
+      category, _, names, listed_under = rng.choices(_RESTRICTED_CATEGORIES, restricted_weights)[0]
+      categories = [category] if listed_under is None else [category, listed_under]
+    else:
+      category, _, names = rng.choices(_CATEGORIES, category_weights)[0]
+      categories = [category]
+      if rng.random() < 0.2:
+        categories.append(rng.choices(_CATEGORIES, category_weights)[0][0])
+
+    price = min(max(round(rng.lognormvariate(1.8, 0.8), 2), 0.5), 500.0)
+    limit = rng.randint(1, 5) if rng.random() < limit_ratio else None
+    yield (Item(item_id, '{} #{}'.format(rng.choice(names), item_id), price, categories), stock_rng.randint(*stock_range), limit)
+
+
+def generate_customers(count: int, seed: int = 0) -> Iterator[Customer]:
+  """
+  Yields customers with membership numbers '100001' onwards.
+  Most have a birth date (ages 12 to 90, so some are under 18) and a verified ID, and about 60% have a delivery distance.
+  """
+  rng = _rng(seed, 'customers')
+  for index in range(count):
+    date_of_birth = None
+    if rng.random() < 0.9:
+      birth_date = REFERENCE_DATE - datetime.timedelta(days=rng.randint(12 * 365, 90 * 365))
+      date_of_birth = birth_date.strftime('%d/%m/%Y')
+    delivery_distance_km = round(rng.expovariate(1 / 12), 1) if rng.random() < 0.6 else None
+
+    yield Customer(str(100001 + index), '{} {}'.format(rng.choice(_FIRST_NAMES), rng.choice(_LAST_NAMES)),
+                   date_of_birth, rng.random() < 0.85, delivery_distance_km)
+
+
+def generate_discounts(items: List[Item], seed: int = 0, discount_ratio: float = 0.15) -> Iterator[Discount]:
+  """
+  Yields discounts for about discount_ratio of the given items: 60% percentage discounts of 5 to 50%,
+  and 40% flat discounts of up to 30% of the item's price.
+  """
+  rng = _rng(seed, 'discounts')
+  for item in items:
+    if rng.random() >= discount_ratio:
+      continue
+    if rng.random() < 0.6:
+      yield Discount(DiscountType.PERCENTAGE, 5 * rng.randint(1, 10), item.id)
+    else:
+      yield Discount(DiscountType.FLAT, round(rng.uniform(0, item.original_price * 0.3), 2), item.id)
+
+
+def generate_megadata(item_count: int, customer_count: int, seed: int = 0, restricted_ratio: float = 0.04, discount_ratio: float = 0.15,
+                      stock_range: Tuple[int, int] = (0, 200)) -> Tuple[Inventory, Dict[str, Customer], PriceBook]:
+  """Returns items, customers and discounts dictionaries shaped like megadata.items, megadata.customers and megadata.discounts."""
+  items = Inventory(generate_items(item_count, seed, restricted_ratio, stock_range=stock_range))
+  customers = {customer.membership_number: customer for customer in generate_customers(customer_count, seed)}
+  discounts = PriceBook({discount.item_id: discount for discount in generate_discounts([items[item_id][0] for item_id in items], seed, discount_ratio)})
+  return items, customers, discounts
+
+
+def generate_baskets(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], customers_dict: Dict[str, Customer], count: int, seed: int = 0,
+                     mean_size: float = 12, max_size: int = 200, size: Optional[int] = None, popularity_skew: float = 1.1,
+                     member_ratio: float = 0.6, date: datetime.date = REFERENCE_DATE) -> Iterator[Transaction]:
+  """
+  Yields transactions ready to check out, with transaction lines, customer, fulfilment type and payment method set, at
+  increasing times through the given day.
+  Basket sizes are exponentially distributed around mean_size (or all exactly size), and items are picked with Zipf-like
+  popularity, so a few items appear in most baskets. Picks that the customer is not allowed to buy, or that would go over
+  an item's purchase quantity limit, are skipped, so baskets only fail checkout if stock runs out.
+  """
+  rng = _rng(seed, 'baskets')
+  item_ids = list(items_dict)
+  membership_numbers = list(customers_dict)
+  # Item IDs are shuffled first so popularity does not follow ID order
+  rng.shuffle(item_ids)
+  popularity = list(itertools.accumulate(1 / (rank + 1) ** popularity_skew for rank in range(len(item_ids))))
+  date_string = date.strftime('%d/%m/%Y')
+
+  for index in range(count):
+    seconds = 8 * 3600 + index * 14 * 3600 // max(count, 1)
+    transaction = Transaction(date_string, '{:02d}:{:02d}:{:02d}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60))
+    if membership_numbers and rng.random() < member_ratio:
+      transaction.customer = customers_dict[rng.choice(membership_numbers)]
+
+    basket_size = size if size is not None else min(max_size, 1 + int(rng.expovariate(1 / max(mean_size - 1, 1e-9))))
+    quantities: Dict[str, int] = {}
+    lines = []
+    attempts = 0
+    while len(lines) < basket_size and attempts < basket_size * 10:
+      attempts += 1
+      item, _, limit = items_dict[rng.choices(item_ids, cum_weights=popularity)[0]]
+      quantity = 1 if rng.random() < 0.8 else rng.randint(2, 3)
+      if limit is not None and quantities.get(item.id, 0) + quantity > limit:
+        continue
+      if is_not_allowed_to_purchase_item(item, transaction.customer, date_string):
+        continue
+      quantities[item.id] = quantities.get(item.id, 0) + quantity
+      lines.append(TransactionLine(item, quantity))
+    transaction.transaction_lines = lines
+
+    if transaction.customer is not None and transaction.customer.delivery_distance_km is not None and rng.random() < 0.25:
+      transaction.fulfilment_type = FulfilmentType.DELIVERY
+    else:
+      transaction.fulfilment_type = FulfilmentType.PICKUP
+    transaction.payment_method = rng.choices(_PAYMENT_METHODS, _PAYMENT_METHOD_WEIGHTS)[0]
+    yield transaction
+
+
+def write_feed(path: str, items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount]) -> None:
+  """Writes the items and discounts as a CSV feed that catalog_import can load."""
+  with open(path, 'w', newline='', encoding='utf-8') as feed_file:
+    writer = csv.writer(feed_file)
+    writer.writerow(['record', 'id', 'name', 'price', 'categories', 'stock', 'limit', 'delta', 'type', 'value'])
+    for item_id in items_dict:
+      item, stock, limit = items_dict[item_id]
+      writer.writerow(['item', item.id, item.name, '{:.2f}'.format(item.original_price), ';'.join(item.categories), stock, '' if limit is None else limit, '', '', ''])
+    for (item_id, discount) in discounts_dict.items():
+      writer.writerow(['discount', item_id, '', '', '', '', '', '', discount.type.value, '{:.2f}'.format(discount.value)])
+
+
+def write_journal(path: str, items_dict: Dict[str, Tuple[Item, int, Optional[int]]], customers_dict: Dict[str, Customer],
+                  discounts_dict: Dict[str, Discount], count: int, seed: int = 0) -> int:
+  """
+  Checks out generated baskets and journals the ones that succeed, as if they had been paid for exactly. Returns how many were journaled.
+  Baskets are checked against the stock levels as they are, without drawing them down, as replay does.
+  """
+  if hasattr(items_dict, 'snapshot'):
+    items_dict = items_dict.snapshot()
+  journaled = 0
+  with TransactionJournal(path) as journal:
+    for transaction in generate_baskets(items_dict, customers_dict, count, seed):
+      try:
+        transaction = checkout(transaction, items_dict, discounts_dict)
+      except Exception:
+        continue
+      settle_payment(transaction, transaction.final_total)
+      journal.append(transaction)
+      journaled += 1
+  return journaled
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Generate a synthetic catalog, customer base, discounts and transactions.')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--items', type=int, default=100000)
+  parser.add_argument('--customers', type=int, default=10000)
+  parser.add_argument('--restricted-ratio', type=float, default=0.04)
+  parser.add_argument('--discount-ratio', type=float, default=0.15)
+  parser.add_argument('--transactions', type=int, default=10000, help='number of baskets to check out into the journal')
+  parser.add_argument('--catalog', help='write the items and discounts to this memory-mapped catalog file')
+  parser.add_argument('--feed', help='write the items and discounts to this CSV feed')
+  parser.add_argument('--journal', help='check out generated baskets into this transaction journal')
+  args = parser.parse_args()
+
+  items, customers, discounts = generate_megadata(args.items, args.customers, args.seed, args.restricted_ratio, args.discount_ratio)
+  if args.catalog:
+    write_catalog(args.catalog, (items[item_id] for item_id in items), discounts.values())
+    print('Wrote {} items to {}.'.format(len(items), args.catalog))
+  if args.feed:
+    write_feed(args.feed, items, discounts)
+    print('Wrote {} items and {} discounts to {}.'.format(len(items), len(discounts), args.feed))
+  if args.journal:
+    print('Journaled {} transactions to {}.'.format(write_journal(args.journal, items, customers, discounts, args.transactions, args.seed), args.journal))